@@ -0,0 +1,297 @@
+"""
+Microbenchmarks of the conversion hot paths, on synthetic images.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_suite [--output results.json] [--compare baseline.json]
+
+Each benchmark is timed over several rounds and the median time per call
+is kept. Results are written as JSON, so that runs on different commits
+can be compared: with --compare, any benchmark whose median is more than
+--threshold slower than in the baseline is reported, and the exit status
+is 1.
+
+Benchmarks:
+
+    set_image[<mode>-<width>x<height>]     PhotographBase.set_image() or
+                                           RadiographBase.set_image() of an
+                                           encoded image file, decode included
+    construct[<view>]                      OrthodonticPhotograph() for each
+                                           view code of IMAGE_TYPES
+    save_implicit_little_endian[<writer>]  encoding of a 1000x750 RGB
+                                           photograph, with pydicom and with
+                                           the header template writer
+    load_image_types                       defaults._load_image_types()
+    bulk_convert_from_csv[<n>]             sequential bulk conversion of n
+                                           640x480 JPEG photographs
+"""
+import argparse
+import csv
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import PIL
+import PIL.Image
+import pydicom
+
+import dicom4ortho.controller as controller
+import dicom4ortho.defaults as defaults
+from dicom4ortho.fastwriter import TemplateWriter
+from dicom4ortho.m_orthodontic_photograph import IMAGE_TYPES, OrthodonticPhotograph
+from dicom4ortho.m_orthodontic_radiograph import OrthodonticRadiograph
+
+# (mode, size, format) of the images decoded by set_image.
+IMAGES = [
+    ('RGB', (640, 480), 'JPEG'),
+    ('RGB', (2000, 1500), 'JPEG'),
+    ('RGB', (4000, 3000), 'JPEG'),
+    ('L', (2000, 1500), 'PNG'),
+    ('I;16', (2000, 1500), 'PNG'),
+]
+
+# Only the smallest images and fewer rounds with --quick.
+QUICK_PIXELS = 3000000
+
+BULK_IMAGES = 20
+
+# A benchmark is a regression when its median is this much slower than in
+# the baseline.
+DEFAULT_THRESHOLD = 0.25
+
+# Minimum duration of one round. Fast calls are repeated within a round.
+MIN_ROUND_TIME = 0.05
+
+
+def synthetic_image(mode, size):
+    ''' A noisy image, so that it compresses like a photograph would.
+    '''
+    noise = PIL.Image.effect_noise(size, 48)
+    if mode == 'RGB':
+        gradient = PIL.Image.linear_gradient('L').resize(size)
+        return PIL.Image.merge('RGB', (noise, gradient, noise.transpose(
+            PIL.Image.Transpose.FLIP_LEFT_RIGHT)))
+    if mode == 'I;16':
+        # 12 bit values, as X-ray software exports them.
+        return noise.point(lambda v: v * 16, 'I').convert('I;16')
+    return noise.convert(mode)
+
+
+def write_image(directory, mode, size, image_format):
+    filename = os.path.join(directory, '{}-{}x{}.{}'.format(
+        mode.replace(';', ''), size[0], size[1], image_format.lower()))
+    synthetic_image(mode, size).save(filename, image_format)
+    return filename
+
+
+def measure(fn, rounds):
+    ''' Median and minimum time per call of fn, in seconds.
+    '''
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_ROUND_TIME:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(MIN_ROUND_TIME / elapsed) + 1)
+    times = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        'median': statistics.median(times),
+        'min': min(times),
+        'rounds': rounds,
+        'number': number,
+    }
+
+
+def make_photo(image_type, input_image, teeth=None):
+    if image_type.startswith('RV'):
+        photo = OrthodonticRadiograph(image_type=image_type, input_image=input_image)
+    else:
+        photo = OrthodonticPhotograph(image_type=image_type, input_image=input_image,
+                                      teeth=teeth)
+    photo.patient_firstname = 'John'
+    photo.patient_lastname = 'Doe'
+    photo.patient_id = '99999'
+    return photo
+
+
+# Each bench_* function yields (name, bench) for each of its benchmarks,
+# where bench() runs the measurement and returns its result.
+
+
+def bench_set_image(directory, images, rounds):
+    for mode, size, image_format in images:
+        filename = write_image(directory, mode, size, image_format)
+        image_type = 'RV02' if mode == 'I;16' else 'EV01'
+        yield 'set_image[{}-{}x{}]'.format(mode, *size), lambda: measure(
+            lambda: make_photo(image_type, filename).set_image(), rounds)
+
+
+def bench_construct(rounds):
+    image = PIL.Image.new('RGB', (1, 1))
+    for image_type in IMAGE_TYPES:
+        yield 'construct[{}]'.format(image_type), lambda: measure(
+            lambda: OrthodonticPhotograph(image_type=image_type, input_image=image),
+            rounds)
+
+
+def bench_save(directory, rounds):
+    photo = make_photo('IV25', synthetic_image('RGB', (1000, 750)),
+                       teeth=['11', '12', '13', '21', '22', '23'])
+    photo.set_image()
+    filename = os.path.join(directory, 'save.dcm')
+    writer = TemplateWriter()
+    yield 'save_implicit_little_endian[pydicom]', lambda: measure(
+        lambda: photo.save_implicit_little_endian(filename), rounds)
+    yield 'save_implicit_little_endian[template]', lambda: measure(
+        lambda: photo.save_implicit_little_endian(filename, writer=writer), rounds)
+
+
+def bench_load_image_types(rounds):
+    yield 'load_image_types', lambda: measure(
+        defaults._load_image_types, rounds)  # pylint: disable=protected-access
+
+
+def bench_bulk(directory, count, rounds):
+    directory = os.path.join(directory, 'bulk')
+    os.makedirs(directory)
+    image = synthetic_image('RGB', (640, 480))
+    csv_input = os.path.join(directory, 'input.csv')
+    with open(csv_input, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([
+            'patient_firstname', 'patient_lastname', 'patient_id', 'patient_sex',
+            'patient_birthdate', 'dental_provider_firstname', 'dental_provider_lastname',
+            'image_type', 'manufacturer', 'input_image_filename', 'study_instance_uid',
+            'study_description', 'series_instance_uid', 'series_description'])
+        study = defaults.generate_dicom_uid()
+        series = defaults.generate_dicom_uid()
+        views = sorted(IMAGE_TYPES)
+        for i in range(count):
+            name = 'image{:04d}.jpg'.format(i)
+            image.save(os.path.join(directory, name), 'JPEG')
+            writer.writerow([
+                'John', 'Doe', '99999', 'M', '2000-01-01', 'Edward', 'Angle',
+                views[i % len(views)], 'Apple', name, study, 'Initial Visit',
+                series, 'Orthodontic Extraoral Series'])
+    c = controller.SimpleController(None)
+
+    def bulk():
+        result = measure(lambda: c.bulk_convert_from_csv(csv_input), rounds)
+        result['per_file'] = result['median'] / count
+        return result
+
+    yield 'bulk_convert_from_csv[{}]'.format(count), bulk
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick=False, select=None):
+    ''' Run all benchmarks whose name contains select. Returns the results
+    as a dict ready to be written as JSON.
+    '''
+    rounds = 3 if quick else 7
+    images = [i for i in IMAGES if not quick or i[1][0] * i[1][1] <= QUICK_PIXELS]
+    controller.SimpleController(None)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        benchmarks = [
+            bench_set_image(directory, images, rounds),
+            bench_construct(rounds),
+            bench_save(directory, rounds),
+            bench_load_image_types(rounds),
+            bench_bulk(directory, BULK_IMAGES // 4 if quick else BULK_IMAGES,
+                       min(rounds, 3)),
+        ]
+        for benchmark in benchmarks:
+            for name, bench in benchmark:
+                if select and select not in name:
+                    continue
+                results[name] = result = bench()
+                print('{:45s} {:12.1f} us'.format(name, result['median'] * 1e6),
+                      file=sys.stderr)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'pydicom': pydicom.__version__,
+            'pillow': PIL.__version__,
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    ''' Benchmarks of current more than threshold slower than in baseline,
+    as a list of (name, baseline median, current median). Benchmarks
+    missing from either run are ignored.
+    '''
+    regressions = []
+    for name, result in sorted(current['results'].items()):
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['median']
+        if result['median'] > before * (1 + threshold):
+            regressions.append((name, before, result['median']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='write the results into this JSON file')
+    parser.add_argument('--compare', help='JSON file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='relative slowdown counted as a regression. Default: {}'.format(
+                            DEFAULT_THRESHOLD))
+    parser.add_argument('--quick', action='store_true',
+                        help='smaller images and fewer rounds')
+    parser.add_argument('--select', help='only run benchmarks whose name contains this')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    warnings.simplefilter('ignore')
+
+    results = run(quick=args.quick, select=args.select)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        for name, before, after in regressions:
+            print('REGRESSION {}: {:.1f} us -> {:.1f} us ({:+.0%})'.format(
+                name, before * 1e6, after * 1e6, after / before - 1))
+        if regressions:
+            return 1
+        print('No regression against {} (commit {})'.format(
+            args.compare, baseline['meta'].get('commit')))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
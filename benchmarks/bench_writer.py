@@ -0,0 +1,60 @@
+"""
+Compare the time to encode one DICOM file with pydicom and with the header
+template writer.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_writer [--number N]
+
+The 1x1 pixel image measures the header alone.
+"""
+import argparse
+import io
+import logging
+import timeit
+import warnings
+
+import PIL.Image
+
+import dicom4ortho.controller as controller
+from dicom4ortho.fastwriter import TemplateWriter
+from dicom4ortho.m_orthodontic_photograph import OrthodonticPhotograph
+
+
+def make_photo(size):
+    photo = OrthodonticPhotograph(
+        image_type='IV25', input_image=PIL.Image.new('RGB', size),
+        teeth=['11', '12', '13', '21', '22', '23'])
+    photo.patient_firstname = 'John'
+    photo.patient_lastname = 'Doe'
+    photo.patient_id = '99999'
+    photo.set_image()
+    return photo
+
+
+def measure(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--number', type=int, default=2000,
+                        help='files encoded per measurement')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+    warnings.simplefilter('ignore')
+    controller.SimpleController(None)
+
+    writer = TemplateWriter()
+    for size in ((1, 1), (1000, 750)):
+        photo = make_photo(size)
+        number = args.number if size == (1, 1) else max(1, args.number // 20)
+        pydicom_time = measure(lambda: photo.to_bytes(), number)
+        template_time = measure(lambda: photo.to_bytes(writer=writer), number)
+        print("{}x{} pixels: pydicom {:8.1f} us/file, template {:8.1f} us/file, {:5.1f}x".format(
+            size[0], size[1], pydicom_time * 1e6, template_time * 1e6,
+            pydicom_time / template_time))
+
+
+if __name__ == '__main__':
+    main()
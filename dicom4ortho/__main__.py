@@ -14,8 +14,25 @@ from prettytable import PrettyTable
 
 import dicom4ortho.defaults as defaults
 import dicom4ortho.controller as controller
+import dicom4ortho.dedup as dedup
+import dicom4ortho.dicomfile as dicomfile
+import dicom4ortho.integrity as integrity
+import dicom4ortho.manifest as manifest
+import dicom4ortho.preflight as preflight
+import dicom4ortho.sender as sender
+import dicom4ortho.spool as spool
+import dicom4ortho.stow as stow
+import dicom4ortho.timing as timing
+from dicom4ortho.archive import ArchiveWriter
+from dicom4ortho.m_orthodontic_radiograph import RADIOGRAPH_DESCRIPTIONS
 
 LIST_IMAGE_TYPES = 'list-image-types'
+DRAIN_SPOOL = 'drain-spool'
+SERVE = 'serve'
+VERIFY = 'verify'
+EXPORT = 'export'
+DEIDENTIFY = 'deidentify'
+PATCH = 'patch'
 
 
 class CLIError(Exception):
@@ -50,12 +67,187 @@ def print_image_types():
             for subseq in wrapped_meaning[1:]:
                 image_types_table.add_row(['', '', '  {}'.format(subseq)])
         # image_types_table = from_csv(image_types_csvfile)
+    for image_type, meaning in RADIOGRAPH_DESCRIPTIONS.items():
+        image_types_table.add_row([image_type, 'RX', '{} radiograph'.format(meaning)])
 
     image_types_table.align[header2] = "l"
     image_types_table.align[header3] = "l"
     print(image_types_table)
 
 
+def print_sender_stats(stats):
+    header = ['Association', 'Sent', 'Failed', 'Inst/s',
+              'p50 (ms)', 'p95 (ms)', 'p99 (ms)']
+    stats_table = PrettyTable(header)
+    for s in stats:
+        stats_table.add_row([
+            s['association'],
+            s['sent'],
+            s['failed'],
+            '{:.1f}'.format(s['throughput']),
+        ] + ['-' if s[p] is None else '{:.1f}'.format(s[p] * 1000)
+             for p in ('p50', 'p95', 'p99')])
+    print(stats_table)
+
+
+def print_preflight(probes, largest=10):
+    summary = preflight.summarize(probes)
+    summary_table = PrettyTable(['Images', 'Unreadable', 'Megapixels',
+                                 'Input (MB)', 'Memory (MB)', 'Modes'])
+    summary_table.add_row([
+        summary['images'],
+        summary['failed'],
+        '{:.1f}'.format(summary['pixels'] / 1e6),
+        '{:.1f}'.format(summary['file_size'] / 1024**2),
+        '{:.1f}'.format(summary['memory'] / 1024**2),
+        ', '.join('{} {}'.format(n, mode) for mode, n in sorted(summary['modes'].items())),
+    ])
+    print(summary_table)
+
+    images_table = PrettyTable(['Image', 'Size', 'Mode', 'Bits', 'Memory (MB)'])
+    images_table.align['Image'] = 'l'
+    for p in sorted(probes, key=lambda p: p.memory, reverse=True)[:largest]:
+        if p.error is None:
+            images_table.add_row([p.filename, '{}x{}'.format(p.width, p.height),
+                                  p.mode, p.bits, '{:.1f}'.format(p.memory / 1024**2)])
+    print(images_table)
+    for p in probes:
+        if p.error is not None:
+            print("Cannot read {}: {}".format(p.filename, p.error))
+    return 1 if summary['failed'] else 0
+
+
+def print_manifest_errors(errors):
+    for error in errors:
+        print(manifest.format_error(error))
+    print("{} errors found.".format(len(errors)))
+    return 1 if errors else 0
+
+
+def parse_address(address):
+    ''' Split a <host:port> string.
+    '''
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise CLIError("Invalid address [{}], expected <host:port>".format(address))
+    return host, int(port)
+
+
+def parse_size(size):
+    ''' Parse a size in bytes, optionally followed by K, M, G or T.
+    '''
+    units = {'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+    size = size.strip().upper().rstrip('B')
+    try:
+        if size and size[-1] in units:
+            return int(float(size[:-1]) * units[size[-1]])
+        return int(size)
+    except ValueError:
+        raise CLIError("Invalid size [{}]".format(size))
+
+
+def make_sender(args):
+    addr, port = parse_address(args.send_to)
+    return sender.MultiAssociationSender(
+        addr, port,
+        called_ae_title=args.called_ae_title,
+        associations=args.associations,
+        max_pending=args.max_pending)
+
+
+def drain_spool(args):
+    if args.spool is None or args.send_to is None:
+        raise CLIError("{} requires --spool and --send.".format(DRAIN_SPOOL))
+    with spool.OutboundSpool(args.spool) as outbound_spool:
+        with make_sender(args) as dicom_sender:
+            sent, failed = outbound_spool.drain(dicom_sender, wait=args.wait)
+        print_sender_stats(dicom_sender.stats())
+        lost = outbound_spool.lost()
+        for sop_instance_uid in lost:
+            print("Spooled file of {} is missing.".format(sop_instance_uid))
+        print("Sent {}, failed {}, still pending {}, lost {}.".format(
+            sent, failed, outbound_spool.pending(), len(lost)))
+        return 0 if outbound_spool.pending() == 0 and not lost else 1
+
+
+def verify(args):
+    if not args.paths:
+        raise CLIError("{} requires DICOM files or directories.".format(VERIFY))
+    results = integrity.verify(list(dicomfile.dicom_files(args.paths)), args.hashes)
+    for result in results:
+        if result.ok is not True:
+            print("{}: {}".format(result.filename, result.message))
+    verified = sum(1 for result in results if result.ok)
+    failed = sum(1 for result in results if result.ok is False)
+    print("{} verified, {} failed, {} without hash.".format(
+        verified, failed, len(results) - verified - failed))
+    return 1 if failed else 0
+
+
+def print_results(results, action, counts):
+    ''' Print the results, namedtuples with a filename and an error, that
+    failed to action, then counts, (number, outcome) pairs, and the number
+    that failed. Returns the exit code: 1 if any failed.
+    '''
+    failed = [result for result in results if result.error is not None]
+    for result in failed:
+        print("Cannot {} {}: {}".format(action, result.filename, result.error))
+    print(", ".join("{} {}".format(number, outcome)
+                    for number, outcome in counts + [(len(failed), 'failed')]) + ".")
+    return 1 if failed else 0
+
+
+def export_images(args):
+    # Imported here, as it is not needed for anything else.
+    import dicom4ortho.export as export
+    if not args.paths:
+        raise CLIError("{} requires DICOM files or directories.".format(EXPORT))
+    files = list(dicomfile.relative_dicom_files(args.paths))
+    results = export.export([filename for filename, _ in files],
+                            output_directory=args.output_directory,
+                            image_format=args.image_format, by_view=args.by_view,
+                            workers=args.workers or os.cpu_count(),
+                            names=[name for _, name in files])
+    exported = sum(1 for result in results if result.error is None)
+    return print_results(results, 'export', [(exported, 'exported')])
+
+
+def deidentify(args):
+    # Imported here, as it is not needed for anything else.
+    import dicom4ortho.deid as deid
+    if not args.paths or args.output_directory is None:
+        raise CLIError("{} requires DICOM files or directories, and --output-directory."
+                       .format(DEIDENTIFY))
+    try:
+        profile = deid.load_profile(args.profile)
+    except (OSError, ValueError, TypeError) as e:
+        raise CLIError("Invalid profile [{}]: {}".format(args.profile, e))
+    results = deid.deidentify(args.paths, args.output_directory,
+                              args.lookup_table or deid.LOOKUP_TABLE_FILENAME,
+                              profile=profile, workers=args.workers or os.cpu_count())
+    deidentified = sum(1 for result in results if result.error is None)
+    return print_results(results, 'de-identify', [(deidentified, 'de-identified')])
+
+
+def patch_files(args):
+    # Imported here, as it is not needed for anything else.
+    import dicom4ortho.patch as patch
+    if not (args.set or args.manifest) or not (args.paths or args.manifest):
+        raise CLIError("{} requires --set and DICOM files or directories, or --manifest."
+                       .format(PATCH))
+    try:
+        attributes = dict(patch.parse_assignment(text) for text in args.set or [])
+        where = dict(patch.parse_assignment(text) for text in args.where or [])
+        results = patch.patch(args.paths, attributes, where=where,
+                              manifest_input=args.manifest,
+                              workers=args.workers or os.cpu_count())
+    except (OSError, ValueError) as e:
+        raise CLIError(e)
+    patched = sum(1 for result in results if result.patched)
+    not_matching = sum(1 for result in results if not result.patched and result.error is None)
+    return print_results(results, 'patch', [(patched, 'patched'), (not_matching, 'not matching')])
+
+
 def main(argv=None):
     '''Command line options.'''
 
@@ -118,7 +310,10 @@ USAGE
             nargs="*",
             help="Add this tooth to image. Tooth should be clearly visible. \
             Use ISO tooth numbering. Add as many as necessary, divided by a \
-            space, like: '--teeth 18 17 16'.",
+            space, like: '--teeth 18 17 16'. Ranges along an arch and \
+            quadrants work too: '--teeth 13-23 Q3'. Anything else is skipped \
+            with a warning. A teeth column in the CSV file replaces this for \
+            its row: there, anything else is a manifest error.",
         )
         parser.add_argument(
             "--add-max-allowed-teeth",
@@ -128,21 +323,379 @@ USAGE
             adult patient with all teeth present and clearly visible for the \
             specified image type.",
         )
+        parser.add_argument(
+            "--mirror-correction",
+            dest="mirror_correction",
+            nargs="?",
+            const="auto",
+            default=None,
+            help="Undo the mirror of intraoral photographs taken through \
+            one. Without a value, the usual flip for the view: left to right \
+            for buccal views, top to bottom for occlusal views. Or one of \
+            FLIP_LEFT_RIGHT, FLIP_TOP_BOTTOM, ROTATE_90, ROTATE_180, \
+            ROTATE_270, TRANSPOSE, TRANSVERSE.",
+            metavar='<transpose>',
+        )
+        parser.add_argument(
+            "--exif-orientation",
+            dest="exif_orientation",
+            action="store_true",
+            help="Turn images upright according to their EXIF Orientation tag.",
+        )
+        parser.add_argument(
+            "--max-dimension",
+            dest="max_dimension",
+            type=int,
+            default=None,
+            help="Scale images down so that neither their width nor their \
+            height is larger than this many pixels.",
+            metavar='<pixels>',
+        )
+        parser.add_argument(
+            "--max-megapixels",
+            dest="max_megapixels",
+            type=float,
+            default=None,
+            help="Scale images down to at most this many million pixels.",
+            metavar='<megapixels>',
+        )
+        parser.add_argument(
+            "--duplicates",
+            dest="duplicates",
+            choices=dedup.POLICIES,
+            default=None,
+            help="Look for duplicate images before converting. link: convert \
+            the first one only, the others become links to it. skip: convert \
+            the first one only. report: convert all, log the duplicates.",
+        )
+        parser.add_argument(
+            "--perceptual-hash",
+            dest="perceptual_distance",
+            nargs="?",
+            const=0,
+            type=int,
+            default=None,
+            help="With --duplicates, also compare images by perceptual hash, \
+            to find copies re-encoded or resized. Images whose 64 bit hashes \
+            differ by at most this many bits are duplicates, default 0.",
+            metavar='<bits>',
+        )
         parser.add_argument(
             "--validate",
             dest="validate",
             action="store_true",
             help="Validate DICOM File",
         )
+        parser.add_argument(
+            "--send",
+            dest="send_to",
+            help="Also send converted images with C-STORE to the Storage SCP \
+            (PACS) at this address.",
+            default=None,
+            metavar='<host:port>',
+        )
+        parser.add_argument(
+            "--called-ae-title",
+            dest="called_ae_title",
+            help="AE Title of the Storage SCP. [default: %(default)s]",
+            default='ANY-SCP',
+            metavar='<aet>',
+        )
+        parser.add_argument(
+            "--associations",
+            dest="associations",
+            help="Number of concurrent associations to use when sending. \
+            [default: %(default)s]",
+            default=defaults.SEND_ASSOCIATIONS,
+            type=int,
+            metavar='<n>',
+        )
+        parser.add_argument(
+            "--max-pending",
+            dest="max_pending",
+            help="Maximum number of converted images waiting to be sent \
+            before conversion pauses. [default: twice the associations]",
+            default=None,
+            type=int,
+            metavar='<n>',
+        )
+        parser.add_argument(
+            "--stow-url",
+            dest="stow_url",
+            help="Also upload converted images with DICOMweb STOW-RS to \
+            this URL, for example http://pacs:8080/dicom-web/studies.",
+            default=None,
+            metavar='<url>',
+        )
+        parser.add_argument(
+            "--stow-batch-size",
+            dest="stow_batch_size",
+            help="Number of images uploaded per STOW-RS request. \
+            [default: %(default)s]",
+            default=defaults.STOW_BATCH_SIZE,
+            type=int,
+            metavar='<n>',
+        )
+        parser.add_argument(
+            "--stow-parallelism",
+            dest="stow_parallelism",
+            help="Number of concurrent STOW-RS requests. \
+            [default: %(default)s]",
+            default=defaults.STOW_PARALLELISM,
+            type=int,
+            metavar='<n>',
+        )
+        parser.add_argument(
+            "--spool",
+            dest="spool",
+            help="Queue converted images in this spool directory before \
+            sending them, so they survive PACS outages and restarts. Use {} \
+            to send what is left in the spool.".format(DRAIN_SPOOL),
+            default=None,
+            metavar='<directory>',
+        )
+        parser.add_argument(
+            "--wait",
+            dest="wait",
+            action="store_true",
+            help="With {}, keep retrying until the spool is empty.".format(DRAIN_SPOOL),
+        )
+        parser.add_argument(
+            "--output-archive",
+            dest="output_archive",
+            help="Write all converted images into this .zip (uncompressed) or \
+            .tar archive instead of separate files.",
+            default=None,
+            metavar='<filename>',
+        )
+        parser.add_argument(
+            "--archive-max-size",
+            dest="archive_max_size",
+            help="Start a new archive once the current one reaches this \
+            size, for example 4G.",
+            default=None,
+            metavar='<size>',
+        )
+        parser.add_argument(
+            "--listen",
+            dest="listen",
+            help="With {}, address to listen on. [default: %(default)s]".format(SERVE),
+            default=defaults.SERVE_ADDRESS,
+            metavar='<host:port>',
+        )
+        parser.add_argument(
+            "--workers",
+            dest="workers",
+            help="Number of worker processes. With a CSV file, convert in \
+            this many processes, with {}, {} or {}, process the files in \
+            this many processes. [default: number of CPUs]".format(
+                EXPORT, DEIDENTIFY, PATCH),
+            default=None,
+            type=int,
+            metavar='<n>',
+        )
+        parser.add_argument(
+            "--memory-budget",
+            dest="memory_budget",
+            help="With a CSV file, convert in worker processes while the \
+            estimated memory of the running conversions stays under this \
+            size, for example 8G. [default: half the physical memory]",
+            default=None,
+            metavar='<size>',
+        )
+        parser.add_argument(
+            "--max-pixels",
+            dest="max_pixels",
+            type=int,
+            default=None,
+            help="With a CSV file, fail images with more pixels than this, \
+            according to their header, without decoding them. See \
+            --max-megapixels to scale large images down instead.",
+            metavar='<pixels>',
+        )
+        parser.add_argument(
+            "--timeout",
+            dest="timeout",
+            type=float,
+            default=None,
+            help="With a CSV file, fail images taking longer than this many \
+            seconds to convert, killing and replacing their worker process.",
+            metavar='<seconds>',
+        )
+        parser.add_argument(
+            "--memory-limit",
+            dest="memory_limit",
+            help="With a CSV file, fail images needing more than this much \
+            memory to convert, for example 2G, replacing their worker process.",
+            default=None,
+            metavar='<size>',
+        )
+        parser.add_argument(
+            "--preflight",
+            dest="preflight",
+            action="store_true",
+            help="With a CSV file, only read the image headers and report \
+            sizes and estimated memory.",
+        )
+        parser.add_argument(
+            "--check-manifest",
+            dest="check_manifest",
+            action="store_true",
+            help="With a CSV file, only check all its rows and input files \
+            and report every error. A CSV file is always checked this way \
+            before converting.",
+        )
+        parser.add_argument(
+            "--uid-namespace",
+            dest="uid_namespace",
+            help="Derive the UIDs not given in the CSV file from this \
+            namespace (a UUID, or a name like the domain of the practice) and \
+            the patient, descriptions and input file names, so that \
+            converting the same files again gives the same UIDs. \
+            [default: random UIDs]",
+            default=None,
+            metavar='<namespace>',
+        )
+        parser.add_argument(
+            "--report",
+            dest="report",
+            help="With a CSV file, write how long each stage of each \
+            conversion took into this file as JSON Lines, followed by a \
+            summary. - writes to standard output.",
+            default=None,
+            metavar='<filename>',
+        )
+        parser.add_argument(
+            "--pixel-hash",
+            dest="pixel_hash",
+            nargs="?",
+            const=integrity.REPORT,
+            choices=(integrity.REPORT, integrity.ATTRIBUTE),
+            default=None,
+            help="With a CSV file, hash the pixels of each image while \
+            encoding it, into the --report, or with attribute also into \
+            private attributes of the file. Check the files later with {}.".format(VERIFY),
+        )
+        parser.add_argument(
+            "--hashes",
+            dest="hashes",
+            help="With {}, compare with the hashes of this --report file \
+            instead of those stored in the files. Files it does not list \
+            fail.".format(VERIFY),
+            default=None,
+            metavar='<filename>',
+        )
+        parser.add_argument(
+            "--format",
+            dest="image_format",
+            choices=("png", "jpeg", "webp"),
+            default="png",
+            help="With {}, the image format to write. [default: %(default)s]".format(EXPORT),
+        )
+        parser.add_argument(
+            "--output-directory",
+            dest="output_directory",
+            help="With {}, write the images into this directory instead of \
+            next to the DICOM files, keeping their paths relative to the \
+            directories given. With {}, write the de-identified files into \
+            this directory.".format(EXPORT, DEIDENTIFY),
+            default=None,
+            metavar='<directory>',
+        )
+        parser.add_argument(
+            "--by-view",
+            dest="by_view",
+            action="store_true",
+            help="With {}, name the images after the patient ID and the view \
+            code, like 99999/IV25.png.".format(EXPORT),
+        )
+        parser.add_argument(
+            "--profile",
+            dest="profile",
+            help="With {}, the de-identification profile: basic, \
+            basic-retain-dates, or a JSON file. [default: %(default)s]".format(DEIDENTIFY),
+            default='basic',
+            metavar='<profile>',
+        )
+        parser.add_argument(
+            "--lookup-table",
+            dest="lookup_table",
+            help="With {}, the SQLite file keeping how UIDs and patients were \
+            mapped, so that they are mapped the same way in later runs. Keep \
+            it private. [default: deid-lookup.sqlite]".format(DEIDENTIFY),
+            default=None,
+            metavar='<filename>',
+        )
+        parser.add_argument(
+            "--set",
+            dest="set",
+            action="append",
+            help="With {}, set this attribute, like --set \
+            PatientID=12345. Repeat for more attributes.".format(PATCH),
+            metavar='<keyword=value>',
+        )
+        parser.add_argument(
+            "--where",
+            dest="where",
+            action="append",
+            help="With {}, only patch files whose attribute matches, like \
+            --where 'StudyDescription=Initial*'. Repeat for more \
+            conditions.".format(PATCH),
+            metavar='<keyword=pattern>',
+        )
+        parser.add_argument(
+            "--manifest",
+            dest="manifest",
+            help="With {}, a CSV or JSON Lines file with a filename column, \
+            and a column per attribute to set in that file.".format(PATCH),
+            default=None,
+            metavar='<filename>',
+        )
+        parser.add_argument(
+            "--progress",
+            dest="progress",
+            action="store_true",
+            help="With a CSV file, show progress and the time left on \
+            standard error.",
+        )
+        parser.add_argument(
+            "--queue-limit",
+            dest="queue_limit",
+            help="With {}, number of requests allowed to wait for a free \
+            worker before answering 503. [default: %(default)s]".format(SERVE),
+            default=defaults.SERVE_QUEUE_LIMIT,
+            type=int,
+            metavar='<n>',
+        )
+        parser.add_argument(
+            "--max-request-size",
+            dest="max_request_size",
+            help="With {}, largest request accepted, like 64M, before \
+            answering 413. [default: 256M]".format(SERVE),
+            default=None,
+            metavar='<size>',
+        )
         parser.add_argument(
             dest="input_filename",
             help="path of file or CSV file with metadata and filename of files \
-            to convert to DICOM",
+            to convert to DICOM, or the same as JSON Lines (.jsonl), {} to \
+            send what is left in the spool, {} to run the HTTP conversion \
+            service, {} to check the Pixel Data hashes of DICOM files, {} \
+            to export DICOM files as images, {} to de-identify DICOM files, \
+            or {} to change attributes of DICOM files".format(
+                DRAIN_SPOOL, SERVE, VERIFY, EXPORT, DEIDENTIFY, PATCH),
             metavar='<filename>',
         )
+        parser.add_argument(
+            dest="paths",
+            nargs="*",
+            help="With {}, {}, {} or {}, the DICOM files, or directories of \
+            them.".format(VERIFY, EXPORT, DEIDENTIFY, PATCH),
+            metavar='<path>',
+        )
 
         # Process arguments
-        args = parser.parse_args(argv[1:])
+        args = parser.parse_intermixed_args(argv[1:])
         if args.verbose is True:
             args.log_level = logging.DEBUG
 
@@ -157,6 +710,31 @@ USAGE
             print_image_types()
             return 0
 
+        if args.input_filename == DRAIN_SPOOL:
+            return drain_spool(args)
+
+        if args.input_filename == SERVE:
+            # Imported here, as it is not needed for anything else.
+            import dicom4ortho.server as server
+            server.serve(parse_address(args.listen),
+                         workers=args.workers, queue_limit=args.queue_limit,
+                         max_request_size=defaults.SERVE_MAX_REQUEST_SIZE
+                         if args.max_request_size is None
+                         else parse_size(args.max_request_size))
+            return 0
+
+        if args.input_filename == VERIFY:
+            return verify(args)
+
+        if args.input_filename == EXPORT:
+            return export_images(args)
+
+        if args.input_filename == DEIDENTIFY:
+            return deidentify(args)
+
+        if args.input_filename == PATCH:
+            return patch_files(args)
+
         if not os.path.isfile(args.input_filename):
             logging.error("Cannot locate file {}:".format(args.input_filename))
             return 1
@@ -172,18 +750,102 @@ USAGE
         if args.validate is True:
             c.validate_dicom_file(args.input_filename)
             return 0
-        elif args.input_filename.lower().endswith('.csv'):
-            c.bulk_convert_from_csv(args.input_filename, teeth=teeth)
-            return 0
-        else:
-            c.convert_image_to_dicom4orthograph({
-                'image_type': 'args.image_type',
-                'input_image_filename': 'args.input_filename',
-                'teeth': teeth,
-                'output_image_filename': 'args.output_filename'})
-            c.photo.print()
-            return 0
 
+        if args.preflight is True:
+            return print_preflight(c.preflight_csv(args.input_filename))
+
+        if args.check_manifest is True:
+            return print_manifest_errors(c.validate_csv(args.input_filename))
+
+        if args.pixel_hash == integrity.REPORT and args.report is None:
+            raise CLIError("--pixel-hash report requires --report, to write the hashes "
+                           "into. Use --pixel-hash attribute to store them in the files.")
+
+        dicom_sender = None
+        if args.send_to is not None:
+            dicom_sender = make_sender(args)
+        outbound_spool = None
+        if args.spool is not None:
+            outbound_spool = spool.OutboundSpool(args.spool)
+        output_archive = None
+        if args.output_archive is not None:
+            output_archive = ArchiveWriter(
+                args.output_archive,
+                max_size=None if args.archive_max_size is None
+                else parse_size(args.archive_max_size))
+        stow_client = None
+        if args.stow_url is not None:
+            stow_client = stow.StowClient(
+                args.stow_url,
+                batch_size=args.stow_batch_size,
+                parallelism=args.stow_parallelism)
+
+        run_report = None
+        if args.report is not None or args.progress:
+            run_report = timing.open_report(args.report, progress=args.progress)
+
+        try:
+            if args.input_filename.lower().endswith('.csv') or \
+                    manifest.is_jsonl(args.input_filename):
+                c.bulk_convert_from_csv(
+                    args.input_filename, teeth=teeth,
+                    sender=dicom_sender, spool=outbound_spool,
+                    stow=stow_client, archive=output_archive,
+                    workers=args.workers,
+                    memory_budget=None if args.memory_budget is None
+                    else parse_size(args.memory_budget),
+                    report=run_report,
+                    mirror_correction=args.mirror_correction,
+                    exif_orientation=args.exif_orientation,
+                    max_dimension=args.max_dimension,
+                    max_megapixels=args.max_megapixels,
+                    duplicates=args.duplicates,
+                    perceptual_distance=args.perceptual_distance,
+                    validate=True,
+                    pixel_hash=args.pixel_hash,
+                    max_pixels=args.max_pixels,
+                    timeout=args.timeout,
+                    memory_limit=None if args.memory_limit is None
+                    else parse_size(args.memory_limit))
+            else:
+                c.convert_image_to_dicom4orthograph({
+                    'image_type': 'args.image_type',
+                    'input_image_filename': 'args.input_filename',
+                    'teeth': teeth,
+                    'output_image_filename': 'args.output_filename'})
+                c.photo.print()
+                if outbound_spool is not None:
+                    outbound_spool.enqueue(c.photo.dataset)
+                elif dicom_sender is not None:
+                    dicom_sender.send(c.photo.dataset)
+                if stow_client is not None:
+                    stow_client.add(c.photo.output_image_filename)
+            if outbound_spool is not None and dicom_sender is not None:
+                outbound_spool.drain(dicom_sender)
+        finally:
+            if run_report is not None:
+                summary = run_report.close()
+                logging.info("{files} files in {seconds:.1f} s, {files_per_second:.1f} "
+                             "files/s, {failed} failed".format(**summary))
+            if output_archive is not None:
+                output_archive.close()
+            if dicom_sender is not None:
+                dicom_sender.close()
+                print_sender_stats(dicom_sender.stats())
+            if outbound_spool is not None:
+                outbound_spool.close()
+            if stow_client is not None:
+                stow_client.close()
+                failed = [r for r in stow_client.results if not r.success]
+                print("STOW-RS: {} stored, {} failed.".format(
+                    len(stow_client.results) - len(failed), len(failed)))
+        return 1 if c.failed else 0
+
+    except CLIError as e:
+        logging.error(e)
+        return 2
+    except manifest.InvalidManifest as e:
+        return print_manifest_errors(e.errors)
     except KeyboardInterrupt:
         ### handle keyboard interrupt ###
         return 120
@@ -0,0 +1,385 @@
+"""
+Archive containers.
+
+Bulk conversion results can be written into ZIP or TAR archives instead of
+one file each, which turns hundreds of thousands of small file creations
+into a few large sequential writes.
+
+Input images can also be read straight from inside ZIP or TAR archives,
+using paths like export.zip!/patient1/IV25.jpg.
+"""
+import contextlib
+import io
+import os
+import pathlib
+import posixpath
+import stat
+import tarfile
+import threading
+import time
+import zipfile
+
+# Buffer size of the archive files themselves.
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Separates the archive file name from the member name in an input path.
+MEMBER_SEPARATOR = '!/'
+
+
+class _EntryWriter(object):
+    """ Wraps the write-only stream of an archive entry.
+
+    pydicom wants to know the position it is writing at, which zip entries
+    do not provide.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._position = 0
+
+    def write(self, data):
+        self._position += len(data)
+        return self._stream.write(data)
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if (whence, offset) not in ((io.SEEK_SET, self._position), (io.SEEK_CUR, 0)):
+            raise io.UnsupportedOperation("Archive entries cannot seek.")
+        return self._position
+
+    def read(self, size=-1):
+        raise io.UnsupportedOperation("Archive entries are write-only.")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _AppendOnlyFile(object):
+    """ A file which can only be appended to.
+
+    Without seek(), zipfile writes the sizes of each entry after its content
+    instead of going back to patch its header, so the archive is written
+    strictly sequentially.
+    """
+
+    def __init__(self, filename):
+        self._file = open(filename, 'wb', buffering=WRITE_BUFFER_SIZE)
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ArchiveWriter(object):
+    """ Writes entries into an uncompressed ZIP or a TAR archive.
+
+    The format is chosen from the extension of filename: .zip or .tar.
+
+    ZIP entries are streamed straight into the archive as they are encoded.
+    TAR needs the size of an entry before its content, so each entry is
+    encoded in memory first.
+
+    arguments:
+
+    filename: name of the archive
+
+    max_size: when an archive has grown to this many bytes, the following
+    entries go into a new archive, named like filename with a -0001, -0002,
+    ... suffix. An archive may exceed max_size by at most one entry.
+    """
+
+    def __init__(self, filename, max_size=None):
+        base, extension = os.path.splitext(filename)
+        if extension.lower() not in ('.zip', '.tar'):
+            raise ValueError("Unsupported archive type {}, use .zip or .tar".format(filename))
+        self._base = base
+        self._extension = extension
+        self._is_zip = extension.lower() == '.zip'
+        self.max_size = max_size
+        self.filenames = []
+        self._file = None
+        self._archive = None
+        # Entries of the current archive.
+        self._arcnames = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _next_archive(self):
+        self._close_archive()
+        if self.filenames:
+            filename = '{}-{:04d}{}'.format(self._base, len(self.filenames), self._extension)
+        else:
+            filename = self._base + self._extension
+        self.filenames.append(filename)
+        self._arcnames = set()
+        self._file = _AppendOnlyFile(filename)
+        if self._is_zip:
+            self._archive = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_STORED)
+        else:
+            self._archive = tarfile.open(fileobj=self._file, mode='w|')
+
+    def _close_archive(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._file.close()
+        self._archive = None
+        self._file = None
+
+    @property
+    def size(self):
+        ''' Size of the current archive so far.
+        '''
+        return 0 if self._file is None else self._file.tell()
+
+    @contextlib.contextmanager
+    def open(self, arcname):
+        ''' Context manager returning a binary stream to write the content of
+        entry arcname into. If the body of the with statement raises, the
+        entry is not added.
+        '''
+        if self._archive is None or (
+                self.max_size is not None and self.size >= self.max_size):
+            self._next_archive()
+
+        if self._is_zip:
+            info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+            try:
+                with self._archive.open(info, 'w') as entry:
+                    yield _EntryWriter(entry)
+            except Exception:
+                # What was written is in the file already, but readers list
+                # the entries of the central directory: leave it out of it.
+                if info in self._archive.filelist:
+                    self._archive.filelist.remove(info)
+                    del self._archive.NameToInfo[arcname]
+                raise
+        else:
+            buffer = io.BytesIO()
+            yield buffer
+            info = tarfile.TarInfo(arcname)
+            info.size = buffer.tell()
+            info.mtime = int(time.time())
+            buffer.seek(0)
+            self._archive.addfile(info, buffer)
+        self._arcnames.add(arcname)
+
+    def add(self, arcname, data):
+        ''' Add an entry with content data, a bytes-like object.
+        '''
+        with self.open(arcname) as entry:
+            entry.write(data)
+
+    def link(self, arcname, target):
+        ''' Add entry arcname as a link to entry target: a hard link in a
+        TAR archive, a relative symbolic link in a ZIP archive.
+
+        Returns False, adding nothing, if target is not in the current
+        archive, as a link cannot point into another one.
+        '''
+        if self._archive is None or target not in self._arcnames:
+            return False
+        self._arcnames.add(arcname)
+        if self._is_zip:
+            info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+            info.create_system = 3
+            info.external_attr = (stat.S_IFLNK | 0o777) << 16
+            self._archive.writestr(info, posixpath.relpath(
+                target, posixpath.dirname(arcname) or '.'))
+        else:
+            info = tarfile.TarInfo(arcname)
+            info.type = tarfile.LNKTYPE
+            info.linkname = target
+            info.mtime = int(time.time())
+            self._archive.addfile(info)
+        return True
+
+    def close(self):
+        self._close_archive()
+
+
+def is_member_path(path):
+    return isinstance(path, str) and MEMBER_SEPARATOR in path
+
+
+def split_member_path(path):
+    ''' Split export.zip!/patient1/IV25.jpg into its archive file name and
+    member name.
+    '''
+    filename, _, member = path.partition(MEMBER_SEPARATOR)
+    return filename, member
+
+
+def default_output_filename(path):
+    ''' Where to write the DICOM file for input path by default: next to
+    the input, or for archive members in a directory named like the archive,
+    next to the archive.
+    '''
+    if not is_member_path(path):
+        return str(pathlib.Path(path).with_suffix('.dcm'))
+    filename, member = split_member_path(path)
+    return str(pathlib.Path(filename).with_suffix('') /
+               pathlib.PurePosixPath(member).with_suffix('.dcm'))
+
+
+class _TarMember(io.RawIOBase):
+    """ A member of an uncompressed TAR archive, read with positioned reads
+    from the file shared by all members.
+    """
+
+    def __init__(self, reader, info):
+        super().__init__()
+        self._reader = reader
+        self._start = info.offset_data
+        self._size = info.size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        self._position = max(0, offset)
+        return self._position
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._size - self._position)
+        if size <= 0:
+            return 0
+        data = self._reader.read_at(self._start + self._position, size)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+
+class ArchiveReader(object):
+    """ Gives access to the members of a ZIP or TAR archive.
+
+    The archive is opened, and its index read, only once. Members can be
+    read concurrently by several threads. TAR archives may be compressed,
+    but then each member is decompressed into memory.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._zip = None
+        self._tar = None
+        if zipfile.is_zipfile(filename):
+            self._zip = zipfile.ZipFile(filename)
+            return
+        self._tar = tarfile.open(filename)
+        self._members = {m.name: m for m in self._tar.getmembers() if m.isfile()}
+        self._file = None
+        with open(filename, 'rb') as f:
+            # gzip, bzip2 or xz.
+            compressed = f.read(6).startswith((b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00'))
+        if not compressed:
+            self._file = open(filename, 'rb')
+
+    def names(self):
+        if self._zip is not None:
+            return self._zip.namelist()
+        return list(self._members)
+
+    def size(self, member):
+        ''' Uncompressed size of member.
+        '''
+        if self._zip is not None:
+            return self._zip.getinfo(member).file_size
+        try:
+            return self._members[member].size
+        except KeyError:
+            raise FileNotFoundError(
+                "No member {} in {}".format(member, self.filename))
+
+    def read_at(self, offset, size):
+        if hasattr(os, 'pread'):
+            return os.pread(self._file.fileno(), size, offset)
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def open(self, member):
+        ''' A binary, seekable stream of member.
+        '''
+        if self._zip is not None:
+            return self._zip.open(member)
+        try:
+            info = self._members[member]
+        except KeyError:
+            raise FileNotFoundError(
+                "No member {} in {}".format(member, self.filename))
+        if self._file is not None:
+            return io.BufferedReader(_TarMember(self, info), WRITE_BUFFER_SIZE)
+        with self._lock:
+            return io.BytesIO(self._tar.extractfile(info).read())
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
+            if self._file is not None:
+                self._file.close()
+
+
+_readers = {}
+_readers_pid = None
+_readers_lock = threading.Lock()
+
+
+def open_archive(filename):
+    ''' Return the ArchiveReader for filename, opening the archive on first
+    use. Readers are shared by everything running in this process, but never
+    across processes, since those would share file positions too.
+    '''
+    global _readers_pid  # pylint: disable=global-statement
+    filename = os.path.abspath(filename)
+    with _readers_lock:
+        if _readers_pid != os.getpid():
+            _readers.clear()
+            _readers_pid = os.getpid()
+        reader = _readers.get(filename)
+        if reader is None:
+            reader = _readers[filename] = ArchiveReader(filename)
+        return reader
+
+
+def open_member(path):
+    ''' Open an input path of the form archive!/member.
+    '''
+    filename, member = split_member_path(path)
+    return open_archive(filename).open(member)
+
+
+def close_archives():
+    with _readers_lock:
+        for reader in _readers.values():
+            reader.close()
+        _readers.clear()
@@ -3,11 +3,11 @@ Controller
 """
 import os
 import os.path
-import csv
 import datetime
+import io
 import logging
 import pathlib
-import pkg_resources
+import pydicom
 import dicom4ortho.model as model
 
 # Just importing will do to execute the code in the module. Pylint will
@@ -15,52 +15,434 @@ import dicom4ortho.model as model
 # pylint: disable=unused-import
 import dicom4ortho.m_dental_acquisition_context_module
 
+import dicom4ortho.dedup as dedup
 import dicom4ortho.defaults as defaults
+import dicom4ortho.integrity as integrity
+import dicom4ortho.manifest as manifest
+import dicom4ortho.preflight as preflight
+import dicom4ortho.uid as uid
+from dicom4ortho.archive import default_output_filename, is_member_path, split_member_path
+from dicom4ortho.fastwriter import TemplateWriter
 from dicom4ortho.m_orthodontic_photograph import OrthodonticPhotograph
+from dicom4ortho.m_orthodontic_radiograph import OrthodonticRadiograph, is_radiograph_type
+from dicom4ortho.scheduler import MemoryScheduler, Task
+from dicom4ortho.timing import Timings
+from dicom4ortho.workers import WorkerPool
+
+# The controller of each worker process of a bulk conversion.
+_worker_controller = None
+
+
+def _init_worker(uid_namespace):
+    global _worker_controller  # pylint: disable=global-statement
+    _worker_controller = SimpleController(None, uid_namespace=uid_namespace)
+
+
+def _convert_in_worker(row, in_memory, timed):
+    ''' Returns (result, timings), timings being the dict of the
+    timing.Timings of the conversion if timed, otherwise None.
+    '''
+    timings = _start_timings(row) if timed else None
+    if in_memory:
+        result = _worker_controller.convert_image_to_dicom_bytes(row, timings)
+    else:
+        result = _worker_controller.convert_image_to_dicom4orthograph(
+            row, timings).output_image_filename
+    return result, None if timings is None else timings.as_dict()
+
+
+def _start_timings(row):
+    timings = Timings(row.get('input_image_filename'))
+    input_image = row.get('input_image')
+    if isinstance(input_image, (bytes, bytearray, memoryview)):
+        timings.input_bytes = len(input_image)
+    elif timings.input_filename is not None:
+        try:
+            timings.input_bytes = preflight.file_size(timings.input_filename)
+        except (OSError, KeyError):
+            pass
+    return timings
+
+
+def _output_filename(row):
+    return row.get('output_image_filename') or default_output_filename(
+        row['input_image_filename'])
+
+
+def _output_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except (OSError, TypeError):
+        return None
+
+
+def _build_dataset(metadata, uids, timings):
+    if is_radiograph_type(metadata['image_type']):
+        photo = OrthodonticRadiograph(timings=timings, uids=uids, **metadata)
+    else:
+        photo = OrthodonticPhotograph(timings=timings, uids=uids, **metadata)
+
+    # Empty UIDs are allocated when the file is written.
+    if metadata.get('study_instance_uid'):
+        photo.study_instance_uid = metadata['study_instance_uid']
+    photo.study_description = metadata['study_description']
+    if metadata.get('series_instance_uid'):
+        photo.series_instance_uid = metadata['series_instance_uid']
+    photo.series_description = metadata['series_description']
+    photo.patient_firstname = metadata['patient_firstname']
+    photo.patient_lastname = metadata['patient_lastname']
+    photo.patient_id = metadata['patient_id']
+    photo.patient_sex = metadata['patient_sex']
+    photo.patient_birthdate = datetime.datetime.strptime(
+        metadata['patient_birthdate'], defaults.IMPORT_DATE_FORMAT).date()
+    photo.dental_provider_firstname = metadata['dental_provider_firstname']
+    photo.dental_provider_lastname = metadata['dental_provider_lastname']
+    photo.equipment_manufacturer = metadata['manufacturer']
+    if metadata.get(manifest.DICOM_ATTRIBUTES_KEY):
+        photo.set_attributes(metadata[manifest.DICOM_ATTRIBUTES_KEY])
+    return photo
+
+
+def build_photo(metadata, uids=None, timings=None):
+    ''' A new OrthodonticPhotograph, or OrthodonticRadiograph, of metadata
+    with its image set. See SimpleController.convert_image_to_dicom4orthograph()
+    for metadata and timings. uids: optional uid.UIDAllocator.
+    '''
+    if timings is not None:
+        with timings.stage('header'):
+            photo = _build_dataset(metadata, uids, timings)
+    else:
+        photo = _build_dataset(metadata, uids, None)
+    photo.set_image()
+    if timings is not None:
+        timings.pixel_hashes = photo.pixel_hashes
+    return photo
+
+
+def convert(metadata, uids=None, writer=None, timings=None):
+    ''' Convert the image of metadata into a DICOM file. See
+    SimpleController.convert_image_to_dicom4orthograph() for metadata and
+    timings. Returns the photograph, once written.
+
+    Keeps no state and does not change metadata, so that several threads
+    may convert at the same time. They may share uids, a uid.UIDAllocator,
+    and writer, a fastwriter.TemplateWriter.
+    '''
+    if metadata.get('output_image_filename') is None:
+        metadata = dict(metadata, output_image_filename=default_output_filename(
+            metadata['input_image_filename']))
+        if is_member_path(metadata['input_image_filename']):
+            os.makedirs(os.path.dirname(metadata['output_image_filename']),
+                        exist_ok=True)
+    photo = build_photo(metadata, uids, timings)
+    photo.save(writer=writer)
+    return photo
+
+
+def convert_to_bytes(metadata, uids=None, writer=None, timings=None):
+    ''' Same as convert(), but nothing is written to disk: returns the
+    DICOM file as bytes.
+    '''
+    return build_photo(metadata, uids, timings).to_bytes(writer=writer)
+
 
 class SimpleController(object):
     """
     Simple Controller
     """
 
-    def __init__(self, args):
+    def __init__(self, args, uid_namespace=None):
+        ''' uid_namespace: derive the UIDs which the metadata do not give
+        from this namespace, see uid.UIDAllocator. Defaults to the
+        uid_namespace of args. Without it UIDs are random.
+        '''
         self._cli_args = args
-        self._load_image_types()
+        if uid_namespace is None:
+            uid_namespace = getattr(args, 'uid_namespace', None)
+        self.uid_namespace = uid_namespace
+        self.uids = uid.DEFAULT_ALLOCATOR if uid_namespace is None \
+            else uid.UIDAllocator(uid_namespace)
+        # The last image converted. Threads converting with the same
+        # controller should use what the conversion methods return instead.
         self.photo = None
+        self._writer = TemplateWriter()
+        self.preflight = None
+        self.failed = []
+        self.duplicates = []
+
+    def _read_csv(self, csv_input, teeth, **options):
+        ''' Yield (row, arcname) for each row of csv_input, a CSV or JSON
+        Lines manifest, with the input file name relative to the manifest.
+        options are metadata for rows which do not have a column for them,
+        or leave it empty.
+        '''
+        for row in manifest.read_rows(csv_input):
+            arcname = row['input_image_filename']
+            if is_member_path(arcname):
+                arcname = split_member_path(arcname)[1]
+            arcname = row.get('output_image_filename') or str(
+                pathlib.PurePosixPath(arcname).with_suffix('.dcm'))
+            # As written in the manifest, so that deterministic UIDs do
+            # not depend on where the file is.
+            row['uid_key'] = row['input_image_filename']
+            row['input_image_filename'] =\
+                os.path.join(os.path.dirname(csv_input),
+                             row['input_image_filename'])
+            # A teeth column, like "11-18 21", is used instead of teeth.
+            row['teeth'] = row.get('teeth') or teeth
+            for key, value in options.items():
+                if row.get(key) in (None, ''):
+                    row[key] = value
+            yield row, arcname
+
+    def validate_csv(self, csv_input, check_files=True):
+        ''' Check all rows of csv_input without converting anything. Returns
+        a list of manifest.ManifestError, empty if all is well.
+        '''
+        return manifest.validate(csv_input, check_files)
 
-    def _load_image_types(self):
-        ''' Loads image_types.csv into a dictionary in defaults.image_types
+    def preflight_csv(self, csv_input):
+        ''' Read the headers of all images listed in csv_input. Returns a
+        list of preflight.ImageProbe.
+        '''
+        return preflight.probe_all(
+            [row['input_image_filename'] for row, _ in self._read_csv(csv_input, None)])
+
+    def bulk_convert_from_csv(self, csv_input, teeth=None, sender=None, spool=None,
+                              stow=None, archive=None, workers=None, memory_budget=None,
+                              report=None, mirror_correction=None, exif_orientation=False,
+                              max_dimension=None, max_megapixels=None,
+                              duplicates=None, perceptual_distance=None, validate=False,
+                              pixel_hash=None, max_pixels=None, timeout=None,
+                              memory_limit=None):
+        ''' Convert all images listed in csv_input, a CSV file or a JSON Lines
+        manifest (.jsonl), see manifest.
+
+        teeth: teeth shown in the images, see convert_image_to_dicom4orthograph().
+        An optional teeth column of csv_input, like "11-18 21", gives them for
+        each image instead.
+
+        sender: optional sender.MultiAssociationSender. Each converted image
+        is also sent to it. Conversion waits whenever the sender has too many
+        instances outstanding.
+
+        spool: optional spool.OutboundSpool. Each converted image is queued
+        there instead of being sent right away. Drain the spool with a sender
+        afterwards.
+
+        stow: optional stow.StowClient. Each converted image is uploaded to
+        it, streamed from the output file.
+
+        archive: optional archive.ArchiveWriter. Converted images are written
+        into it rather than into separate files. Entries are named like the
+        output files would have been, relative to the CSV file, or to the
+        input archive for images read from one.
+
+        workers: convert in this many worker processes. Before anything is
+        converted, the headers of all images are read to estimate the memory
+        each conversion needs, and conversions start largest first.
+        Conversions which fail are logged and listed in self.failed, instead
+        of stopping the run.
+
+        memory_budget: with workers, bytes the running conversions may use
+        together. Default is MEMORY_BUDGET_FRACTION of the physical memory.
+
+        report: optional timing.RunReport. The time each stage of each
+        conversion takes is recorded into it. The caller closes it.
+
+        mirror_correction, exif_orientation, max_dimension, max_megapixels:
+        see convert_image_to_dicom4orthograph(). Columns of the same name in
+        csv_input give them for each image instead.
+
+        duplicates: look for duplicate images before converting, and list
+        them in self.duplicates as (input, input of the original, kind). The
+        first one listed is the original. What happens to the others:
+        dedup.LINK: not converted, their output is a link to the output of
+        the original. dedup.SKIP: not converted. dedup.REPORT: converted.
+        Duplicates which are not converted are not sent either.
+
+        perceptual_distance: with duplicates, images whose perceptual hashes
+        differ by at most this many bits are duplicates as well. See
+        dedup.find_duplicates().
+
+        pixel_hash: hash the pixels of each image as it is encoded, into
+        the report: 'report', or into the report and the file: 'attribute'.
+        See integrity.
 
-        This is needed to save the full text of the image type in the Image Comments DICOM tag.
+        validate: check all of csv_input first, and raise
+        manifest.InvalidManifest listing all errors found before converting
+        anything. See manifest.validate().
+
+        max_pixels, timeout, memory_limit: limits for each image, which
+        imply converting in worker processes. Images larger than max_pixels,
+        according to their header, are not decoded at all. A conversion
+        running longer than timeout seconds, or allocating more than
+        memory_limit bytes, has its worker process killed and replaced. The
+        image is listed in self.failed with the limit it exceeded.
         '''
-        image_types_filename = pkg_resources.resource_filename(
-            'dicom4ortho.resources', 'image_types.csv')
-        logging.debug("Image type filenames is: {}".format(image_types_filename))
-        with open(image_types_filename) as image_types_csvfile:
-            defaults.image_types = {}
-            reader = csv.reader(image_types_csvfile)
-            for row in reader:
-                defaults.image_types[row[0]] = row[1:]
-
-    def bulk_convert_from_csv(self, csv_input, teeth=None):
-        with open(csv_input, mode='r') as csv_file:
-            csv_reader = csv.DictReader(csv_file, delimiter=',')
-            for row in csv_reader:
-                row['input_image_filename'] =\
-                    os.path.join(os.path.dirname(csv_input),
-                                 row['input_image_filename'])
-                row['teeth'] = teeth
-                self.convert_image_to_dicom4orthograph(metadata=row)
-
-    def convert_image_to_dicom4orthograph(self, metadata):
+        if validate:
+            errors = manifest.validate(csv_input)
+            if errors:
+                raise manifest.InvalidManifest(errors)
+        rows = self._read_csv(csv_input, teeth, mirror_correction=mirror_correction,
+                              exif_orientation=exif_orientation,
+                              max_dimension=max_dimension, max_megapixels=max_megapixels,
+                              pixel_hash=pixel_hash is not None,
+                              pixel_hash_attribute=pixel_hash == integrity.ATTRIBUTE)
+        all_rows = found = None
+        if duplicates is not None:
+            all_rows = rows = list(rows)
+            found = self._find_duplicates(rows, perceptual_distance)
+            if duplicates != dedup.REPORT:
+                skipped = {duplicate.index for duplicate in found}
+                rows = [row for i, row in enumerate(rows) if i not in skipped]
+        if report is not None:
+            rows = list(rows)
+            if report.total is None:
+                report.total = len(rows)
+        limits = {'max_pixels': max_pixels, 'timeout': timeout, 'memory_limit': memory_limit}
+        if workers is None and memory_budget is None and \
+                all(limit is None for limit in limits.values()):
+            for row, arcname in rows:
+                timings = None if report is None else _start_timings(row)
+                try:
+                    if archive is not None:
+                        photo = self.photo = build_photo(row, self.uids, timings)
+                        with archive.open(arcname) as entry:
+                            photo.save(entry, writer=self._writer)
+                            output_bytes = entry.tell()
+                    else:
+                        photo = self.convert_image_to_dicom4orthograph(row, timings)
+                        output_bytes = _output_size(photo.output_image_filename)
+                except Exception as e:
+                    if report is not None:
+                        report.add(timings, '{}: {}'.format(type(e).__name__, e))
+                    raise
+                if report is not None:
+                    timings.output_filename = arcname if archive is not None \
+                        else photo.output_image_filename
+                    timings.output_bytes = output_bytes
+                    report.add(timings)
+                if spool is not None:
+                    spool.enqueue(photo.dataset)
+                elif sender is not None:
+                    sender.send(photo.dataset)
+                if stow is not None:
+                    stow.add(photo.dataset if archive is not None
+                             else photo.output_image_filename)
+        else:
+            self._bulk_convert_in_workers(
+                list(rows), workers, memory_budget, sender, spool, stow, archive, report,
+                **limits)
+        if duplicates == dedup.LINK:
+            self._link_duplicates(all_rows, found, archive)
+
+    def _find_duplicates(self, rows, perceptual_distance):
+        filenames = [row['input_image_filename'] for row, _ in rows]
+        found = dedup.find_duplicates(filenames, perceptual=perceptual_distance is not None,
+                                      distance=perceptual_distance or 0)
+        self.duplicates = []
+        for duplicate in found:
+            self.duplicates.append((filenames[duplicate.index],
+                                    filenames[duplicate.original], duplicate.kind))
+            logging.info("{} duplicates {} ({})".format(*self.duplicates[-1]))
+        return found
+
+    def _link_duplicates(self, rows, found, archive):
+        failed = {input_image_filename for input_image_filename, _ in self.failed}
+        for duplicate in found:
+            row, arcname = rows[duplicate.index]
+            original, original_arcname = rows[duplicate.original]
+            if original['input_image_filename'] in failed:
+                continue
+            if archive is not None:
+                if not archive.link(arcname, original_arcname):
+                    logging.warning("Cannot link {} to {} in another archive".format(
+                        arcname, original_arcname))
+            else:
+                dedup.link_file(_output_filename(original), _output_filename(row))
+
+    def _bulk_convert_in_workers(self, rows, workers, memory_budget,
+                                 sender, spool, stow, archive, report,
+                                 max_pixels=None, timeout=None, memory_limit=None):
+        probes = preflight.probe_all([row['input_image_filename'] for row, _ in rows])
+        self.preflight = preflight.summarize(probes)
+        logging.info("Preflight: {images} images, {pixels} pixels, {memory} bytes "
+                     "to decode, largest {largest} ({largest_memory} bytes)".format(
+                         **self.preflight))
+        if memory_budget is None:
+            memory = preflight.physical_memory()
+            if memory is not None:
+                memory_budget = int(memory * defaults.MEMORY_BUDGET_FRACTION)
+
+        self.failed = []
+        tasks = []
+        for (row, arcname), probe in zip(rows, probes):
+            if probe.error is not None:
+                self._failed(row['input_image_filename'], probe.error, report)
+                continue
+            if max_pixels is not None and probe.width * probe.height > max_pixels:
+                self._failed(row['input_image_filename'],
+                             "{}x{} pixels, over the limit of {}".format(
+                                 probe.width, probe.height, max_pixels), report)
+                continue
+            tasks.append(Task(probe.memory, _convert_in_worker,
+                              (row, archive is not None, report is not None),
+                              (row, arcname)))
+
+        with WorkerPool(processes=workers, initializer=_init_worker,
+                        initargs=(self.uid_namespace,),
+                        task_timeout=timeout, memory_limit=memory_limit) as pool:
+            scheduler = MemoryScheduler(pool, memory_budget)
+            for task, future in scheduler.run(tasks):
+                row, arcname = task.tag
+                try:
+                    result, timings = future.result()
+                except Exception as e:  # pylint: disable=broad-except
+                    self._failed(row['input_image_filename'],
+                                 '{}: {}'.format(type(e).__name__, e), report)
+                    continue
+                if report is not None:
+                    timings['output'] = arcname if archive is not None else result
+                    timings['output_bytes'] = len(result) if archive is not None \
+                        else _output_size(result)
+                    report.add(timings)
+                # result is the DICOM file itself with an archive, otherwise
+                # the name of the file written.
+                if archive is not None:
+                    archive.add(arcname, result)
+                if spool is not None or sender is not None:
+                    dataset = pydicom.dcmread(
+                        io.BytesIO(result) if archive is not None else result)
+                    if spool is not None:
+                        spool.enqueue(dataset)
+                    else:
+                        sender.send(dataset)
+                if stow is not None:
+                    stow.add(result)
+        logging.info("Peak estimated memory {} bytes, budget {}".format(
+            scheduler.peak, memory_budget))
+
+    def _failed(self, input_image_filename, reason, report=None):
+        logging.error("Cannot convert {}: {}".format(input_image_filename, reason))
+        self.failed.append((input_image_filename, reason))
+        if report is not None:
+            report.add(Timings(input_image_filename), reason)
+
+    def convert_image_to_dicom4orthograph(self, metadata, timings=None):
         ''' Converts a plain image into a DICOM object.
 
         All image metadata are passed as a dict in metadata with the following keys:
 
-        input_image_filename: Input image file name
+        input_image_filename: Input image file name. May point into a ZIP or
+        TAR archive: export.zip!/patient1/IV25.jpg
+
+        input_image: the input image itself, instead of input_image_filename.
+        Either bytes, a binary file-like object or a PIL Image.
 
         output_image_filename: the filename of the output .DCM image. You must
-        provide your extension here.
+        provide your extension here. May also be a binary stream to write the
+        DICOM file into.
 
         metadata:
 
@@ -71,45 +453,62 @@ class SimpleController(object):
             patient_birthdate           :
             dental_provider_firstname   :
             dental_provider_lastname    :
+            image_type                  : photograph type from image_types.csv (EV01), or
+                                          radiograph type (RV01 to RV03), which is stored as
+                                          a Digital X-Ray image
             teeth                       : array of teeth visible in the photograph.
                                           Use ISO notation in string. Example:
                                           teeth=['24','25','26','27','28','34','35','36','37','38']
+                                          Ranges and quadrants work too: teeth=['24-28', 'Q3'],
+                                          or one string: teeth='24-28 Q3'. See
+                                          m_tooth_codes.ToothSet.parse()
             output_image_filename       : filename to write dicom image into.
                                           Default is the same name as the input file name with replaced
-                                          extension.
+                                          extension. For images inside an archive, the file goes into a
+                                          directory named like the archive: export/patient1/IV25.dcm
+            mirror_correction           : optional. Undo the mirror of an intraoral photograph
+                                          taken through one: FLIP_LEFT_RIGHT, FLIP_TOP_BOTTOM or
+                                          another PIL.Image.Transpose name, or auto for the usual
+                                          one for the view. The image is stored as mirror
+                                          corrected and derived.
+            exif_orientation            : optional. If true, turn the image upright according to
+                                          its EXIF Orientation, in the same pass.
+            pixel_hash,
+            pixel_hash_attribute        : optional. If true, hash the pixels while packing them,
+                                          and store the hashes in the file, see integrity.
+            max_dimension,
+            max_megapixels              : optional. Scale larger images down to this width or
+                                          height in pixels, or to this many million pixels, while
+                                          decoding. The image is stored as derived, with its
+                                          original size in Derivation Description.
+            study_instance_uid,
+            series_instance_uid         : may be empty. The UID is then allocated, see
+                                          uid.UIDAllocator.
+            transfer_syntax             : optional. UID of the transfer syntax to write: Implicit
+                                          VR Little Endian (default), Explicit VR Little Endian or
+                                          Explicit VR Big Endian.
+            dicom                       : optional dict of any other DICOM attributes, keyword
+                                          to value. See model.DicomBase.set_attributes()
+
+        timings: optional timing.Timings to record the stages of the
+        conversion into.
+
+        Returns the photograph, also kept in self.photo. metadata is not
+        changed. See convert() to convert without a controller.
         '''
+        self.photo = photo = convert(metadata, self.uids, self._writer, timings)
+        return photo
+
+    def convert_image_to_dicom_bytes(self, metadata, timings=None):
+        ''' Converts a plain image into a DICOM file held in memory.
 
-        if ('output_image_filename' not in metadata) or (metadata['output_image_filename'] is None):
-            p = pathlib.Path(metadata['input_image_filename'])
-            metadata['output_image_filename'] = str(p.with_suffix('.dcm'))
-
-        self.photo = OrthodonticPhotograph(**metadata)
-
-        self.photo.study_instance_uid = metadata['study_instance_uid']
-        self.photo.study_description = metadata['study_description']
-        self.photo.series_instance_uid = metadata['series_instance_uid']
-        self.photo.series_description = metadata['series_description']
-        self.photo.patient_firstname = metadata['patient_firstname']
-        self.photo.patient_lastname = metadata['patient_lastname']
-        self.photo.patient_id = metadata['patient_id']
-        self.photo.patient_sex = metadata['patient_sex']
-        self.photo.patient_birthdate = datetime.datetime.strptime(
-            metadata['patient_birthdate'], defaults.IMPORT_DATE_FORMAT).date()
-        self.photo.dental_provider_firstname = metadata['dental_provider_firstname']
-        self.photo.dental_provider_lastname = metadata['dental_provider_lastname']
-        self.photo.equipment_manufacturer = metadata['manufacturer']
-
-        # TODO: check if metadata['teeth'] contains teeth and add
-        # What teeth are shown in the images is something we cannot guess from
-        # what image type is taken, and shold be entered manually or
-        # automtaicaly by the implementing software. Therefore, i would like
-        # the controller to have an option to add teeth and provide this option
-        # to the end user which, in this case, is the CLI, and the CSV import
-        # file.
-        # if metadata['teeth']
-
-        self.photo.set_image()
-        self.photo.save_implicit_little_endian()
+        Same as convert_image_to_dicom4orthograph(), but nothing is written
+        to disk: returns the DICOM file as bytes. Pass the image as
+        input_image to avoid reading from disk as well. Unlike
+        convert_image_to_dicom4orthograph(), keeps no state, so that
+        threads may share the controller.
+        '''
+        return convert_to_bytes(metadata, self.uids, self._writer, timings)
 
     # def convert_image_to_dicom4orthograph(
     #     self,
@@ -0,0 +1,173 @@
+"""
+Detection of duplicate input images in a batch.
+
+Two files are exact duplicates when they have the same size and the same
+content hash. Only files sharing their size with another one are hashed.
+
+Optionally, images are also compared by a perceptual hash (dHash): a 9x8
+grayscale thumbnail, decoded at reduced scale, of which each bit tells
+whether a pixel is brighter than its right neighbour. Copies re-encoded or
+resized by the export get the same or a very close hash.
+"""
+import collections
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import PIL.Image
+
+import dicom4ortho.archive as archive
+import dicom4ortho.preflight as preflight
+
+# What to do with duplicates.
+LINK = 'link'        # convert once, the duplicates point to the converted file
+SKIP = 'skip'        # convert once, leave the duplicates out
+REPORT = 'report'    # convert all, only list the duplicates
+POLICIES = (LINK, SKIP, REPORT)
+
+# Threads hashing files at the same time.
+HASH_THREADS = 8
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Size of the thumbnail of the perceptual hash.
+DHASH_SIZE = (9, 8)
+
+Duplicate = collections.namedtuple('Duplicate', ['index', 'original', 'kind'])
+
+
+def _open(filename):
+    if archive.is_member_path(filename):
+        return archive.open_member(filename)
+    return open(filename, 'rb')
+
+
+def content_hash(filename):
+    ''' BLAKE2b digest of the content of filename, or of an archive member.
+    '''
+    digest = hashlib.blake2b(digest_size=32)
+    with _open(filename) as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.digest()
+
+
+def perceptual_hash(filename):
+    ''' 64 bit dHash of image filename, as an int.
+    '''
+    with _open(filename) as f, PIL.Image.open(f) as im:
+        im.draft('L', (DHASH_SIZE[0] * 8, DHASH_SIZE[1] * 8))
+        pixels = im.convert('L').resize(DHASH_SIZE, PIL.Image.Resampling.BOX).tobytes()
+    value = 0
+    width = DHASH_SIZE[0]
+    for row in range(0, len(pixels), width):
+        for left, right in zip(pixels[row:row + width - 1], pixels[row + 1:row + width]):
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class _Groups(object):
+    """ Union-find of indices. The smallest index of a group is its root,
+    so that the first file listed is the one kept.
+    """
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, i):
+        root = i
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while i != root:
+            self.parent[i], i = root, self.parent.get(i, i)
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def _safe(fn, filename):
+    try:
+        return fn(filename)
+    except Exception:  # pylint: disable=broad-except
+        # Files which cannot be read are left to the conversion to report.
+        return None
+
+
+def find_duplicates(filenames, perceptual=False, distance=0, threads=HASH_THREADS):
+    ''' Duplicates among filenames, as a list of Duplicate: index of the
+    duplicate in filenames, index of the file it duplicates, which comes
+    first in filenames, and kind, 'exact' or 'perceptual'.
+
+    perceptual: also compare perceptual hashes. Images whose hashes differ
+    by at most distance bits are duplicates.
+    '''
+    groups = _Groups()
+    kinds = {}
+
+    by_size = collections.defaultdict(list)
+    for i, filename in enumerate(filenames):
+        size = _safe(preflight.file_size, filename)
+        if size is not None:
+            by_size[size].append(i)
+    candidates = [i for same_size in by_size.values() if len(same_size) > 1
+                  for i in same_size]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        hashes = executor.map(lambda i: _safe(content_hash, filenames[i]), candidates)
+        first = {}
+        for i, digest in zip(candidates, hashes):
+            if digest is None:
+                continue
+            if digest in first:
+                groups.union(first[digest], i)
+                kinds[i] = 'exact'
+            else:
+                first[digest] = i
+
+        if perceptual:
+            todo = [i for i in range(len(filenames)) if i not in kinds]
+            dhashes = [(i, h) for i, h in zip(
+                todo, executor.map(lambda i: _safe(perceptual_hash, filenames[i]), todo))
+                       if h is not None]
+            # Hashes within distance bits agree exactly on at least one of
+            # distance + 1 bands of bits: only those are compared.
+            bands = distance + 1
+            width = -(-64 // bands)
+            buckets = collections.defaultdict(list)
+            for i, h in dhashes:
+                for band in range(bands):
+                    buckets[band, (h >> (band * width)) & ((1 << width) - 1)].append((i, h))
+            for bucket in buckets.values():
+                for n, (i, h) in enumerate(bucket):
+                    for j, other in bucket[:n]:
+                        if groups.find(i) != groups.find(j) and _hamming(h, other) <= distance:
+                            groups.union(i, j)
+                            kinds.setdefault(max(i, j), 'perceptual')
+
+    duplicates = []
+    for i in range(len(filenames)):
+        root = groups.find(i)
+        if root != i:
+            duplicates.append(Duplicate(i, root, kinds.get(i, 'perceptual')))
+    return duplicates
+
+
+def link_file(target, filename):
+    ''' Make filename a hard link to target, or a copy of it where hard
+    links are not possible.
+    '''
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    if os.path.lexists(filename):
+        os.remove(filename)
+    try:
+        os.link(target, filename)
+    except OSError:
+        shutil.copyfile(target, filename)
@@ -1,9 +1,12 @@
 """
 Defaults and Constants.
 """
+import csv
+import types
 
-import uuid
-import logging
+import pkg_resources
+
+from dicom4ortho.uid import DEFAULT_ALLOCATOR
 
 VERSION = '0.1.4'
 __url__ = 'https://github.com/open-ortho/dicom4ortho'
@@ -38,17 +41,51 @@ IDS_NUMBERS = '000'
 
 ADD_MAX_ALLOWED_TEETH = 'ALL'
 
-# This is populated by controller.SimpleController._load_image_types()
-image_types = {}
+# Our own AE Title, used when sending to a PACS.
+AE_TITLE = 'DICOM4ORTHO'
+
+# Default number of concurrent associations used when sending to a PACS.
+SEND_ASSOCIATIONS = 4
+
+# Outbound spool: number of instances sent per batch, and retry delays in
+# seconds. The delay doubles at each failure, up to SPOOL_MAX_DELAY.
+SPOOL_BATCH_SIZE = 100
+SPOOL_BASE_DELAY = 30
+SPOOL_MAX_DELAY = 3600
+
+# DICOMweb STOW-RS: instances per request, and concurrent requests.
+STOW_BATCH_SIZE = 50
+STOW_PARALLELISM = 2
+
+# Conversion service: address to listen on, number of requests allowed to
+# wait for a free worker, and largest request body accepted, in bytes.
+SERVE_ADDRESS = '127.0.0.1:8080'
+SERVE_QUEUE_LIMIT = 64
+SERVE_MAX_REQUEST_SIZE = 256 * 1024**2
+
+# Bulk conversion in worker processes: part of the physical memory the
+# running conversions may use together, when no budget is given.
+MEMORY_BUDGET_FRACTION = 0.5
+
+
+def _load_image_types():
+    ''' image_types.csv as a dict of image type to (abbreviation, meaning).
+
+    This is needed to save the full text of the image type in the Image
+    Comments DICOM tag.
+    '''
+    image_types_filename = pkg_resources.resource_filename(
+        'dicom4ortho.resources', 'image_types.csv')
+    with open(image_types_filename) as image_types_csvfile:
+        return {row[0]: tuple(row[1:]) for row in csv.reader(image_types_csvfile)}
+
+
+# Read-only, as conversions running in several threads share it.
+image_types = types.MappingProxyType(_load_image_types())
+
 
 def generate_dicom_uid():
     """
     A function to generate DICOM UIDs for new objects.
     """
-    new_uuid = uuid.uuid4().bytes
-    dicom_uid = '2.25'
-    for i in range(len(new_uuid)-2):
-        dicom_uid += '.' + str(new_uuid[i])
-
-    logging.debug("Generated new Instance UID {}".format(dicom_uid))
-    return dicom_uid
+    return DEFAULT_ALLOCATOR.new()
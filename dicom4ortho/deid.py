@@ -0,0 +1,328 @@
+"""
+De-identification of existing DICOM files.
+
+Only the header of each file is read and rewritten, after a profile: the
+attributes it names are removed, emptied, replaced or pseudonymized, the
+instance UIDs mapped to new ones, and private attributes removed. The Pixel
+Data is copied into the new file as it is, without being decoded, see
+dicomfile.rewrite(). Files are de-identified in worker processes.
+
+UIDs and pseudonyms are derived from the original values with UUID version
+5 and a secret namespace kept in a lookup table (SQLite). The same original
+UID thus gets the same new UID in every file, in every worker and in every
+run using the same table, without the workers having to share anything.
+The table also records every mapping, to identify the originals again.
+"""
+import collections
+import json
+import os
+import sqlite3
+import uuid
+
+import pydicom.datadict
+import pydicom.multival
+from pydicom.tag import Tag
+
+import dicom4ortho.dicomfile as dicomfile
+import dicom4ortho.integrity as integrity
+import dicom4ortho.uid as uid
+from dicom4ortho.workers import run_each
+
+LOOKUP_TABLE_FILENAME = 'deid-lookup.sqlite'
+
+# Kinds of mappings in the lookup table.
+UID = 'uid'
+PSEUDONYM = 'pseudonym'
+
+PSEUDONYM_PREFIX = 'ANON'
+
+# Instance UIDs, mapped to new ones by default. Class UIDs, like SOP Class
+# UID or Transfer Syntax UID, identify nothing and are kept.
+INSTANCE_UIDS = [
+    'StudyInstanceUID',
+    'SeriesInstanceUID',
+    'SOPInstanceUID',
+    'MediaStorageSOPInstanceUID',
+    'ReferencedSOPInstanceUID',
+    'FrameOfReferenceUID',
+    'SynchronizationFrameOfReferenceUID',
+    'IrradiationEventUID',
+    'ConcatenationUID',
+    'DimensionOrganizationUID',
+    'StorageMediaFileSetUID',
+]
+
+DATES = [
+    'StudyDate', 'SeriesDate', 'AcquisitionDate', 'ContentDate',
+    'StudyTime', 'SeriesTime', 'AcquisitionTime', 'ContentTime',
+    'AcquisitionDateTime',
+]
+
+# Built-in profiles, after the Basic Application Level Confidentiality
+# Profile of PS3.15 E.1, restricted to the attributes found in photographs
+# and radiographs.
+PROFILES = {
+    'basic': {
+        'description': 'Basic Application Level Confidentiality Profile',
+        'remove': [
+            'InstitutionName', 'InstitutionAddress', 'InstitutionalDepartmentName',
+            'StationName', 'DeviceSerialNumber', 'OperatorsName',
+            'PerformingPhysicianName', 'PhysiciansOfRecord', 'RequestingPhysician',
+            'OtherPatientIDs', 'OtherPatientIDsSequence', 'OtherPatientNames',
+            'PatientAddress', 'PatientTelephoneNumbers', 'PatientAge', 'PatientSize',
+            'PatientWeight', 'MedicalRecordLocator', 'EthnicGroup', 'Occupation',
+            'AdditionalPatientHistory', 'PatientComments', 'DerivationDescription',
+            'StudyDescription', 'SeriesDescription', 'ImageComments',
+        ],
+        'empty': [
+            'PatientBirthDate', 'AccessionNumber', 'StudyID', 'ReferringPhysicianName',
+        ] + DATES,
+        'replace': {},
+        'pseudonymize': ['PatientID', 'PatientName'],
+        'uids': INSTANCE_UIDS,
+        'remove_private': True,
+        # The hashes of the Pixel Data, which is not changed.
+        'keep_private_creators': [integrity.PRIVATE_CREATOR],
+    },
+}
+PROFILES['basic-retain-dates'] = dict(
+    PROFILES['basic'],
+    description='Basic Application Level Confidentiality Profile, Retain Longitudinal '
+                'Temporal Information Full Dates Option',
+    empty=[keyword for keyword in PROFILES['basic']['empty'] if keyword not in DATES])
+
+DEFAULT_PROFILE = 'basic'
+
+# Outcome of de-identifying a file. error is None if it succeeded.
+Deidentified = collections.namedtuple(
+    'Deidentified', ['filename', 'output_filename', 'error'])
+
+
+class Profile(object):
+    """ What de-identification does to the attributes of a file.
+
+    arguments:
+
+    description: goes into De-identification Method.
+
+    remove: keywords of the attributes to remove.
+
+    empty: keywords of the attributes to keep, empty.
+
+    replace: values to give attributes, by keyword.
+
+    pseudonymize: keywords of the attributes to replace with a pseudonym of
+    their value, the same for the same value.
+
+    uids: keywords of the UIDs to map to new UIDs.
+
+    remove_private: whether to remove private attributes.
+
+    keep_private_creators: private creators of the private attributes to
+    keep nonetheless.
+
+    Attributes are looked for in sequences too.
+    """
+
+    def __init__(self, description='', remove=(), empty=(), replace=None,
+                 pseudonymize=(), uids=(), remove_private=True, keep_private_creators=()):
+        self.description = description
+        self.remove = set(remove)
+        self.empty = set(empty)
+        self.replace = dict(replace or {})
+        self.pseudonymize = set(pseudonymize)
+        self.uids = set(uids)
+        self.remove_private = remove_private
+        self.keep_private_creators = set(keep_private_creators)
+        for keyword in (self.remove | self.empty | self.pseudonymize | self.uids |
+                        set(self.replace)):
+            if pydicom.datadict.tag_for_keyword(keyword) is None:
+                raise ValueError("Unknown attribute keyword {}".format(keyword))
+
+
+def load_profile(profile):
+    ''' The Profile named profile, a built-in one or a JSON file. The JSON
+    object has the arguments of Profile, and may start from a built-in
+    profile with "extends": "basic".
+    '''
+    if profile in PROFILES:
+        return Profile(**PROFILES[profile])
+    with open(profile) as f:
+        options = json.load(f)
+    base = options.pop('extends', None)
+    if base is not None:
+        if base not in PROFILES:
+            raise ValueError("Unknown profile {} in {}".format(base, profile))
+        options = dict(PROFILES[base], **options)
+    return Profile(**options)
+
+
+def pseudonym(namespace, value):
+    ''' The pseudonym of value in namespace, a uuid.UUID.
+    '''
+    return PSEUDONYM_PREFIX + uuid.uuid5(namespace, value).hex[:16].upper()
+
+
+class LookupTable(object):
+    """ The namespace UIDs and pseudonyms are derived in, created at random
+    with the table, and the mappings made with it.
+
+    arguments:
+
+    filename: the SQLite database. Created if missing.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._db = sqlite3.connect(filename)
+        with self._db:
+            self._db.execute('''CREATE TABLE IF NOT EXISTS settings (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL)''')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS mappings (
+                kind TEXT NOT NULL,
+                original TEXT NOT NULL,
+                replacement TEXT NOT NULL,
+                PRIMARY KEY (kind, original))''')
+            self._db.execute('''INSERT OR IGNORE INTO settings (name, value)
+                VALUES ('namespace', ?)''', (str(uuid.uuid4()),))
+        self.namespace = uuid.UUID(self._db.execute(
+            "SELECT value FROM settings WHERE name = 'namespace'").fetchone()[0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def add(self, mappings):
+        ''' Record mappings, (kind, original, replacement) tuples.
+        '''
+        with self._db:
+            self._db.executemany('''INSERT OR IGNORE INTO mappings
+                (kind, original, replacement) VALUES (?, ?, ?)''', mappings)
+
+    def replacement(self, kind, original):
+        row = self._db.execute('''SELECT replacement FROM mappings
+            WHERE kind = ? AND original = ?''', (kind, original)).fetchone()
+        return None if row is None else row[0]
+
+    def original(self, kind, replacement):
+        row = self._db.execute('''SELECT original FROM mappings
+            WHERE kind = ? AND replacement = ?''', (kind, replacement)).fetchone()
+        return None if row is None else row[0]
+
+
+def _private_creator(ds, tag):
+    if not tag.is_private_creator:
+        tag = Tag(tag.group, tag.element >> 8)
+        if tag not in ds:
+            return None
+    value = ds[tag].value
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'replace')
+    return str(value).strip()
+
+
+class _Deidentifier(object):
+    """ Applies a Profile to datasets, and collects the mappings made.
+    """
+
+    def __init__(self, profile, namespace):
+        self.profile = profile
+        self.namespace = namespace
+        self.mappings = set()
+
+    def _map(self, kind, value):
+        if not value:
+            return value
+        if kind == UID:
+            replacement = uid.name_uid(self.namespace, value)
+        else:
+            replacement = pseudonym(self.namespace, value)
+        self.mappings.add((kind, value, replacement))
+        return replacement
+
+    def _values(self, kind, value):
+        if isinstance(value, pydicom.multival.MultiValue):
+            return [self._map(kind, str(v)) for v in value]
+        return self._map(kind, str(value))
+
+    def apply(self, ds):
+        profile = self.profile
+        for tag in list(ds.keys()):
+            if tag.is_private:
+                if profile.remove_private and \
+                        _private_creator(ds, tag) not in profile.keep_private_creators:
+                    del ds[tag]
+                continue
+            keyword = pydicom.datadict.keyword_for_tag(tag)
+            if keyword in profile.remove:
+                del ds[tag]
+                continue
+            elem = ds[tag]
+            if keyword in profile.empty:
+                elem.value = [] if elem.VR == 'SQ' else None
+            elif keyword in profile.replace:
+                elem.value = profile.replace[keyword]
+            elif keyword in profile.uids:
+                elem.value = self._values(UID, elem.value)
+            elif keyword in profile.pseudonymize:
+                elem.value = self._values(PSEUDONYM, elem.value)
+            elif elem.VR == 'SQ':
+                for item in elem.value:
+                    self.apply(item)
+
+    def __call__(self, ds):
+        self.apply(ds)
+        self.apply(ds.file_meta)
+        ds.PatientIdentityRemoved = 'YES'
+        if self.profile.description:
+            ds.DeidentificationMethod = self.profile.description[:64]
+        return sorted(self.mappings)
+
+
+def deidentify_file(filename, output_filename, profile, namespace):
+    ''' Write a de-identified copy of DICOM file filename as
+    output_filename, after Profile profile, in namespace, a uuid.UUID.
+    Returns the mappings made, as (kind, original, replacement) tuples.
+    '''
+    return dicomfile.rewrite(filename, output_filename, _Deidentifier(profile, namespace))
+
+
+def deidentify(paths, output_directory, lookup_table, profile=DEFAULT_PROFILE, workers=None):
+    ''' De-identify the DICOM files of paths, and those found under the
+    directories of paths, into output_directory, where they keep their
+    names relative to those directories.
+
+    lookup_table: file name of the LookupTable, created if missing. Keep
+    it out of the de-identified data.
+
+    profile: name of a built-in profile or of a JSON file, see
+    load_profile(), or a Profile.
+
+    workers: with more than one, de-identify in that many worker
+    processes.
+
+    Returns a list of Deidentified.
+    '''
+    if not isinstance(profile, Profile):
+        profile = load_profile(profile)
+    files = [(filename, os.path.join(output_directory, name))
+             for filename, name in dicomfile.relative_dicom_files(paths)]
+    results = []
+    with LookupTable(lookup_table) as table:
+        tasks = [(filename, output_filename, profile, table.namespace)
+                 for filename, output_filename in files]
+        for (filename, output_filename, _, _), mappings, error in run_each(
+                deidentify_file, tasks, workers):
+            if error is None:
+                try:
+                    table.add(mappings)
+                except Exception as e:  # pylint: disable=broad-except
+                    error = '{}: {}'.format(type(e).__name__, e)
+            results.append(Deidentified(filename, None if error else output_filename, error))
+    return results
@@ -0,0 +1,166 @@
+"""
+Reading and rewriting existing DICOM files without decoding their pixels.
+
+Only the header is parsed. Pixel Data is located in the file, and then
+streamed in large blocks, to hash it or copy it as it is into another file.
+"""
+import collections
+import os
+import shutil
+import struct
+import uuid
+
+import pydicom
+
+# Bytes read or copied at a time when streaming Pixel Data.
+BLOCK_SIZE = 4 * 1024 * 1024
+
+PIXEL_DATA_TAG = 0x7FE00010
+UNDEFINED_LENGTH = 0xFFFFFFFF
+
+# Where the Pixel Data element is in a file: offset of its tag, length of
+# the tag, VR and length fields, and length of the value, None if undefined
+# (encapsulated), in which case the value runs to the end of the file.
+PixelDataLocation = collections.namedtuple(
+    'PixelDataLocation', ['offset', 'header_length', 'length'])
+
+
+def relative_dicom_files(paths):
+    ''' Yield (filename, name) for the files of paths, and for the .dcm
+    files found under those of paths which are directories, in name order.
+    name is relative to the directory given, or the file name alone.
+    '''
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, os.path.basename(path)
+            continue
+        for directory, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith('.dcm'):
+                    filename = os.path.join(directory, filename)
+                    yield filename, os.path.relpath(filename, path)
+
+
+def dicom_files(paths):
+    ''' Yield the file names of relative_dicom_files().
+    '''
+    for filename, _ in relative_dicom_files(paths):
+        yield filename
+
+
+def read_header(fp):
+    ''' Read the dataset of binary stream fp up to its Pixel Data. Returns
+    (dataset, PixelDataLocation), the location being None if there is no
+    Pixel Data. fp is left at the start of the Pixel Data element.
+    '''
+    ds = pydicom.dcmread(fp, stop_before_pixels=True)
+    offset = fp.tell()
+    header = fp.read(12)
+    fp.seek(offset)
+    if len(header) < 8:
+        return ds, None
+    implicit_vr, little_endian = (True if v is None else v for v in ds.original_encoding)
+    order = '<' if little_endian else '>'
+    group, element = struct.unpack(order + 'HH', header[:4])
+    if (group << 16) | element != PIXEL_DATA_TAG:
+        return ds, None
+    if implicit_vr:
+        header_length = 8
+        length, = struct.unpack(order + 'L', header[4:8])
+    else:
+        header_length = 12
+        length, = struct.unpack(order + 'L', header[8:12])
+    if length == UNDEFINED_LENGTH:
+        length = None
+    return ds, PixelDataLocation(offset, header_length, length)
+
+
+def stream(fp, length=None, block_size=BLOCK_SIZE):
+    ''' Yield the next length bytes of fp, or all that is left if length
+    is None, in blocks of at most block_size bytes.
+    '''
+    while length is None or length > 0:
+        block = fp.read(block_size if length is None else min(block_size, length))
+        if not block:
+            if length is not None:
+                raise EOFError("File ends {} bytes before the end of Pixel Data".format(length))
+            return
+        if length is not None:
+            length -= len(block)
+        yield block
+
+
+def pixel_data_blocks(fp, location, block_size=BLOCK_SIZE):
+    ''' Yield the value of the Pixel Data at location in fp, in blocks.
+    '''
+    fp.seek(location.offset + location.header_length)
+    return stream(fp, location.length, block_size)
+
+
+def _copy_rest(src, dst, offset, block_size=BLOCK_SIZE):
+    ''' Copy src from offset to its end to dst, in the kernel where the
+    platform allows.
+    '''
+    dst.flush()
+    if hasattr(os, 'sendfile'):
+        try:
+            while True:
+                sent = os.sendfile(dst.fileno(), src.fileno(), offset, block_size)
+                if sent == 0:
+                    return
+                offset += sent
+        except OSError:
+            # Not supported between these files: copy in user space from
+            # where sendfile stopped.
+            pass
+    src.seek(offset)
+    shutil.copyfileobj(src, dst, block_size)
+
+
+def _create_temporary(filename):
+    ''' Create a new file next to filename, with the permissions filename
+    has, or else those new files get. Returns (file object, name).
+    '''
+    directory, name = os.path.split(os.path.abspath(filename))
+    temporary = os.path.join(directory, '.{}.{}.tmp'.format(name, uuid.uuid4().hex))
+    fp = open(os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666), 'wb')
+    if os.path.exists(filename):
+        shutil.copymode(filename, temporary)
+    return fp, temporary
+
+
+def rewrite(filename, output_filename, edit, block_size=BLOCK_SIZE):
+    ''' Write DICOM file filename as output_filename, which may be the
+    same file, with its header changed by edit(dataset). The dataset has no
+    Pixel Data: the Pixel Data element, and anything after it, is copied as
+    it is, in blocks of block_size bytes, so edit() must not change the
+    transfer syntax. Returns what edit() returns.
+
+    The new file is written next to output_filename and then renamed, so
+    output_filename is never left half written.
+    '''
+    directory = os.path.dirname(os.path.abspath(output_filename))
+    os.makedirs(directory, exist_ok=True)
+    with open(filename, 'rb') as src:
+        ds, location = read_header(src)
+        transfer_syntax = ds.file_meta.get('TransferSyntaxUID')
+        result = edit(ds)
+        if ds.file_meta.get('TransferSyntaxUID') != transfer_syntax:
+            raise ValueError("Cannot change the transfer syntax of {}".format(filename))
+        dst, temporary = _create_temporary(output_filename)
+        try:
+            with dst:
+                ds.save_as(dst, write_like_original=False)
+                if location is not None:
+                    _copy_rest(src, dst, location.offset, block_size)
+        except BaseException:
+            os.remove(temporary)
+            raise
+    # Once filename is closed, as some platforms do not replace open files.
+    try:
+        os.replace(temporary, output_filename)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return result
@@ -0,0 +1,245 @@
+"""
+Export of DICOM images back to PNG, JPEG or WebP.
+
+Pixel Data is decoded by PIL, never pixel by pixel in Python:
+
+- native (uncompressed) Pixel Data is wrapped as it is into an image, its
+  planes merged when Planar Configuration is 1,
+- RLE Lossless segments are PackBits, which PIL decodes, one plane each,
+- JPEG and JPEG 2000 frames are opened by PIL like any JPEG file.
+
+YBR_FULL is converted to RGB, MONOCHROME1 inverted, and images of more
+than 8 bits are windowed to 8 bits with their VOI window, or their range.
+
+Only the first frame of multi-frame images is exported.
+"""
+import collections
+import io
+import os
+import re
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import PIL.Image
+import PIL.ImageOps
+import pydicom
+import pydicom.encaps
+import pydicom.uid
+from pydicom.multival import MultiValue
+
+import dicom4ortho.dicomfile as dicomfile
+from dicom4ortho.m_orthodontic_photograph import IMAGE_TYPES
+from dicom4ortho.m_orthodontic_radiograph import is_radiograph_type
+from dicom4ortho.workers import run_each
+
+# Output formats, by extension.
+FORMATS = {'png': 'PNG', 'jpg': 'JPEG', 'jpeg': 'JPEG', 'webp': 'WEBP'}
+
+QUALITY = 90
+
+# Threads reading headers at the same time.
+HEADER_THREADS = 8
+
+Exported = collections.namedtuple('Exported', ['filename', 'output_filename', 'error'])
+
+
+def _window(im, ds):
+    ''' Map a 16 or 32 bit image to 8 bits with the VOI window of ds, or
+    the range of the image.
+    '''
+    im = im.convert('I')
+    center = ds.get('WindowCenter')
+    width = ds.get('WindowWidth')
+    if center is not None and width is not None:
+        # Multi-valued windows: the first one is the default.
+        center = float(center[0] if isinstance(center, MultiValue) else center)
+        width = float(width[0] if isinstance(width, MultiValue) else width)
+        low = center - 0.5 - (width - 1) / 2
+    else:
+        low, high = im.getextrema()
+        width = max(high - low, 1)
+    scale = 255 / max(width, 1)
+    # Converting I to L clips to 0..255.
+    return im.point(lambda value: value * scale - low * scale).convert('L')
+
+
+def _packbits_plane(segment, size):
+    # Decoded as a single row, as runs may cross rows.
+    row = PIL.Image.frombytes('L', (size[0] * size[1], 1), segment, 'packbits', 'L')
+    return PIL.Image.frombuffer('L', size, row.tobytes(), 'raw', 'L', 0, 1)
+
+
+def _rle_image(frame, size, samples, bits):
+    ''' Decode an RLE Lossless frame: a header of segment offsets, then one
+    PackBits segment per byte of each sample, most significant first.
+    '''
+    count, = struct.unpack('<L', frame[:4])
+    offsets = list(struct.unpack('<15L', frame[4:64])[:count]) + [len(frame)]
+    planes = [_packbits_plane(frame[start:end], size)
+              for start, end in zip(offsets, offsets[1:])]
+    if bits == 8:
+        return planes[0] if samples == 1 else PIL.Image.merge('RGB', planes)
+    if bits == 16 and samples == 1:
+        return PIL.Image.frombuffer(
+            'I;16B', size, PIL.Image.merge('LA', planes).tobytes(), 'raw', 'I;16B', 0, 1)
+    raise ValueError("Unsupported RLE image: {} samples of {} bits".format(samples, bits))
+
+
+def _native_image(ds, size, samples, bits):
+    data = ds.PixelData
+    big_endian = ds.file_meta.TransferSyntaxUID == pydicom.uid.ExplicitVRBigEndian
+    if samples == 1:
+        if bits == 8:
+            mode = rawmode = 'L'
+        elif bits == 16:
+            mode = rawmode = 'I;16B' if big_endian else 'I;16'
+        elif bits == 32:
+            # PIL has no 32 bit mode of its own: they are read into I.
+            mode, rawmode = 'I', 'I;32B' if big_endian else 'I;32'
+        else:
+            raise ValueError("Unsupported Bits Allocated {}".format(bits))
+        frame = size[0] * size[1] * bits // 8
+        return PIL.Image.frombuffer(mode, size, data[:frame], 'raw', rawmode, 0, 1)
+    if samples == 3 and bits == 8:
+        frame = size[0] * size[1] * 3
+        mode = 'YCbCr' if ds.PhotometricInterpretation == 'YBR_FULL' else 'RGB'
+        if ds.get('PlanarConfiguration', 0) == 0:
+            return PIL.Image.frombuffer(mode, size, data[:frame], 'raw', mode, 0, 1)
+        plane = frame // 3
+        return PIL.Image.merge(mode, [
+            PIL.Image.frombuffer('L', size, data[i * plane:(i + 1) * plane], 'raw', 'L', 0, 1)
+            for i in range(3)])
+    raise ValueError("Unsupported image: {} samples of {} bits".format(samples, bits))
+
+
+def dataset_image(ds):
+    ''' The first frame of the Pixel Data of dataset ds as an L or RGB PIL
+    Image, ready to be saved for presentation.
+    '''
+    size = (ds.Columns, ds.Rows)
+    samples = ds.get('SamplesPerPixel', 1)
+    bits = ds.BitsAllocated
+    photometric = ds.PhotometricInterpretation
+    transfer_syntax = ds.file_meta.TransferSyntaxUID
+    if transfer_syntax.is_encapsulated:
+        frame = next(pydicom.encaps.generate_frames(
+            ds.PixelData, number_of_frames=ds.get('NumberOfFrames', 1)))
+        if transfer_syntax == pydicom.uid.RLELossless:
+            im = _rle_image(frame, size, samples, bits)
+            if photometric == 'YBR_FULL':
+                im = PIL.Image.merge('YCbCr', im.split())
+        else:
+            # PIL converts YBR JPEG to RGB itself.
+            im = PIL.Image.open(io.BytesIO(frame))
+            im.load()
+    else:
+        im = _native_image(ds, size, samples, bits)
+    if im.mode == 'YCbCr':
+        im = im.convert('RGB')
+    elif im.mode not in ('L', 'RGB'):
+        im = _window(im, ds)
+    elif im.mode == 'L' and ds.get('BitsStored', 8) < 8:
+        maximum = (1 << ds.BitsStored) - 1
+        im = im.point(lambda value: min(value, maximum) * 255 // maximum)
+    if photometric == 'MONOCHROME1':
+        im = PIL.ImageOps.invert(im)
+    return im
+
+
+def view_code(ds):
+    ''' The view code of an image converted by dicom4ortho, like IV25, from
+    its Image Comments, or None.
+    '''
+    code = str(ds.get('ImageComments', '')).split('^')[0]
+    if code in IMAGE_TYPES or is_radiograph_type(code):
+        return code
+    return None
+
+
+def export_file(filename, output_filename, quality=QUALITY):
+    ''' Export DICOM file filename as output_filename, whose extension
+    gives the format. Returns output_filename.
+    '''
+    image_format = FORMATS[os.path.splitext(output_filename)[1][1:].lower()]
+    im = dataset_image(pydicom.dcmread(filename))
+    if os.path.dirname(output_filename):
+        os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+    options = {} if image_format == 'PNG' else {'quality': quality}
+    im.save(output_filename, image_format, **options)
+    return output_filename
+
+
+def _header(filename):
+    try:
+        with open(filename, 'rb') as fp:
+            return dicomfile.read_header(fp)[0]
+    except Exception:  # pylint: disable=broad-except
+        # The export reports it.
+        return None
+
+
+def _path_component(value):
+    ''' value made into a single, safe component of a path: path
+    separators and other unusual characters replaced, and None for names
+    like . and .. or an empty one.
+    '''
+    name = re.sub(r'[^\w.-]', '_', str(value))
+    if not name.strip('.'):
+        return None
+    return name
+
+
+def output_filenames(filenames, output_directory=None, extension='png', by_view=False,
+                     names=None):
+    ''' Where to export each of filenames: next to it, or in
+    output_directory, with extension. by_view names the files after the
+    patient and the view code instead, like 99999/IV25.png, reading only
+    the headers of the files.
+
+    names: the paths of filenames relative to output_directory, as given
+    by dicomfile.relative_dicom_files(). Default is their file name alone.
+
+    Where two files would be exported as the same one, a -2, -3 ... suffix
+    is added to the further ones.
+    '''
+    if names is None:
+        names = [os.path.basename(filename) for filename in filenames]
+    if by_view:
+        with ThreadPoolExecutor(max_workers=HEADER_THREADS) as executor:
+            headers = list(executor.map(_header, filenames))
+    else:
+        headers = [None] * len(filenames)
+    used = collections.Counter()
+    outputs = []
+    for filename, name, ds in zip(filenames, names, headers):
+        if output_directory is None:
+            directory, name = os.path.dirname(filename), os.path.basename(filename)
+        else:
+            directory = output_directory
+        name = os.path.splitext(name)[0]
+        code = None if ds is None else view_code(ds)
+        if code is not None:
+            name = os.path.join(_path_component(ds.get('PatientID') or '') or 'unknown', code)
+        output = os.path.normpath(os.path.join(directory, name))
+        used[output] += 1
+        if used[output] > 1:
+            output = '{}-{}'.format(output, used[output])
+        outputs.append(output + '.' + extension)
+    return outputs
+
+
+def export(filenames, output_directory=None, image_format='png', by_view=False,
+           workers=None, quality=QUALITY, names=None):
+    ''' Export DICOM files filenames as images of image_format: png, jpeg
+    or webp. See output_filenames() for where they go, and names. With
+    workers, in that many worker processes. Returns a list of Exported, the
+    error of which is None if the export succeeded.
+    '''
+    extension = image_format.lower()
+    if extension not in FORMATS:
+        raise ValueError("Unsupported image format {}".format(image_format))
+    outputs = output_filenames(filenames, output_directory, extension, by_view, names)
+    return [Exported(filename, output, error)
+            for (filename, _, _), output, error in run_each(
+                export_file, [(filename, output, quality)
+                              for filename, output in zip(filenames, outputs)], workers)]
@@ -0,0 +1,295 @@
+"""
+Fast DICOM file writer.
+
+Saving with pydicom encodes every element of a dataset each time, although
+in a bulk conversion most of them are the same for all images of a view:
+file meta, SOP class, modality, coded sequences. TemplateWriter encodes
+those once into a header template, and for each file only encodes the
+elements which change from image to image, then appends the pixel data.
+
+The output is byte for byte the same as FileDataset.save_as() with
+write_like_original=False.
+"""
+import copy
+import struct
+import threading
+
+from pydicom.charset import default_encoding
+from pydicom.dataelem import RawDataElement
+from pydicom.filebase import DicomBytesIO
+from pydicom.dataset import validate_file_meta
+from pydicom.filewriter import correct_ambiguous_vr_element, write_data_element
+from pydicom.multival import MultiValue
+from pydicom.tag import Tag
+from pydicom.valuerep import PersonName
+from pydicom.uid import ImplicitVRLittleEndian, UID
+
+import dicom4ortho.integrity as integrity
+
+# Elements which usually differ between two images of the same view. They
+# are encoded again for each file.
+VARIABLE_KEYWORDS = (
+    'SOPInstanceUID', 'StudyInstanceUID', 'SeriesInstanceUID',
+    'StudyDate', 'StudyTime', 'ContentDate', 'ContentTime',
+    'PatientName', 'PatientID', 'PatientSex', 'PatientBirthDate',
+    'ReferringPhysicianName', 'StudyDescription', 'SeriesDescription',
+    'Manufacturer', 'Rows', 'Columns', 'SamplesPerPixel',
+    'PlanarConfiguration', 'PhotometricInterpretation', 'BitsAllocated',
+    'BitsStored', 'HighBit', 'WindowCenter', 'WindowWidth',
+    'DerivationDescription', 'PixelData',
+    integrity.SOURCE_HASH_TAG, integrity.PIXEL_DATA_HASH_TAG,
+)
+
+# Templates kept at most. Beyond that the cache starts over, so that a
+# dataset which keeps changing in unexpected places cannot grow it forever.
+MAX_TEMPLATES = 256
+
+PIXEL_DATA_TAG = 0x7FE00010
+_GROUP_LENGTH_TAG = Tag('FileMetaInformationGroupLength')
+_STRING_VRS = frozenset((
+    'AE', 'AS', 'CS', 'DA', 'DT', 'LO', 'LT', 'PN', 'SH', 'ST', 'TM', 'UC',
+    'UI', 'UR', 'UT'))
+# VRs with a 4 byte length in explicit VR transfer syntaxes.
+_LONG_VRS = frozenset((
+    'OB', 'OD', 'OF', 'OL', 'OV', 'OW', 'SQ', 'SV', 'UC', 'UN', 'UR', 'UT', 'UV'))
+_META_INSTANCE_TAG = Tag('MediaStorageSOPInstanceUID')
+
+
+def _encode(elem, dataset, implicit_vr, little_endian, encodings):
+    fp = DicomBytesIO()
+    fp.is_implicit_VR = implicit_vr
+    fp.is_little_endian = little_endian
+    elem = correct_ambiguous_vr_element(elem, dataset, little_endian)
+    write_data_element(fp, elem, encodings)
+    return fp.getvalue()
+
+
+def _encode_simple(tag, vr, value, implicit_vr, little_endian):
+    ''' Encode the usual variable elements (ASCII strings, names and US
+    numbers) without going through pydicom. Returns None for anything else.
+    '''
+    if isinstance(value, PersonName) and vr == 'PN':
+        value = str(value)
+    if isinstance(value, str) and vr in _STRING_VRS:
+        if not value.isascii():
+            return None
+        data = value.encode('ascii')
+        if len(data) % 2:
+            data += b'\0' if vr == 'UI' else b' '
+    elif vr == 'US' and type(value) is int:  # pylint: disable=unidiomatic-typecheck
+        data = struct.pack('<H' if little_endian else '>H', value)
+    else:
+        return None
+    order = '<' if little_endian else '>'
+    if implicit_vr:
+        header = struct.pack(order + 'HHL', tag >> 16, tag & 0xFFFF, len(data))
+    elif vr in _LONG_VRS:
+        header = struct.pack(order + 'HH2sHL', tag >> 16, tag & 0xFFFF,
+                             vr.encode('ascii'), 0, len(data))
+    elif len(data) <= 0xFFFF:
+        header = struct.pack(order + 'HH2sH', tag >> 16, tag & 0xFFFF,
+                             vr.encode('ascii'), len(data))
+    else:
+        return None
+    return header + data
+
+
+def _frozen(value):
+    ''' A hashable copy of an element value, or None if there is none.
+    '''
+    if isinstance(value, (list, tuple, MultiValue)):
+        value = tuple(value)
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return value
+
+
+class _Template(object):
+    """ The encoded file, with holes for the variable elements.
+
+    segments is a list of bytes (runs of invariant elements) and tags (the
+    elements to encode for each file).
+    """
+
+    def __init__(self, dataset, transfer_syntax, variable, encodings):
+        self.implicit_vr = transfer_syntax.is_implicit_VR
+        self.little_endian = transfer_syntax.is_little_endian
+        self.encodings = encodings
+
+        # The same File Meta Information save_as() would write.
+        file_meta = copy.deepcopy(dataset.file_meta)
+        file_meta.TransferSyntaxUID = transfer_syntax
+        sop_class = dataset.get('SOPClassUID')
+        if file_meta.get('MediaStorageSOPClassUID') is None or (
+                sop_class and sop_class != file_meta.MediaStorageSOPClassUID):
+            file_meta.MediaStorageSOPClassUID = sop_class
+        if dataset.get('SOPInstanceUID'):
+            file_meta.MediaStorageSOPInstanceUID = dataset.SOPInstanceUID
+        validate_file_meta(file_meta, enforce_standard=True)
+        self.file_meta = file_meta
+        self.meta_before = b''.join(
+            _encode(file_meta[tag], file_meta, False, True, None)
+            for tag in sorted(file_meta.keys())
+            if tag < _META_INSTANCE_TAG and tag != _GROUP_LENGTH_TAG)
+        self.meta_after = b''.join(
+            _encode(file_meta[tag], file_meta, False, True, None)
+            for tag in sorted(file_meta.keys()) if tag > _META_INSTANCE_TAG)
+        self.preamble = (dataset.preamble or b'\0' * 128) + b'DICM'
+
+        self.segments = []
+        run = []
+        for tag in sorted(dataset.keys()):
+            if tag.element == 0 and tag.group > 6:
+                continue
+            if tag in variable:
+                if run:
+                    self.segments.append(b''.join(run))
+                    run = []
+                self.segments.append(int(tag))
+            else:
+                run.append(self._encode(dataset, tag))
+        if run:
+            self.segments.append(b''.join(run))
+
+    def _encode(self, dataset, tag):
+        return _encode(dataset[tag], dataset, self.implicit_vr,
+                       self.little_endian, self.encodings)
+
+    def _meta(self, dataset):
+        uid = dataset.get('SOPInstanceUID') or \
+            dataset.file_meta.MediaStorageSOPInstanceUID
+        instance = _encode_simple(_META_INSTANCE_TAG, 'UI', uid, False, True)
+        length = len(self.meta_before) + len(instance) + len(self.meta_after)
+        return (b'\x02\x00\x00\x00UL\x04\x00' + struct.pack('<L', length) +
+                self.meta_before + instance + self.meta_after)
+
+    def _pixel_data_header(self, elem, dataset, length):
+        fp = DicomBytesIO()
+        fp.is_implicit_VR = self.implicit_vr
+        fp.is_little_endian = self.little_endian
+        fp.write_tag(elem.tag)
+        if not self.implicit_vr:
+            elem = correct_ambiguous_vr_element(elem, dataset, self.little_endian)
+            fp.write(elem.VR.encode('ascii'))
+            fp.write_US(0)
+        fp.write_UL(length)
+        return fp.getvalue()
+
+    def write(self, dataset, fp):
+        parts = [self.preamble, self._meta(dataset)]
+        for segment in self.segments:
+            if isinstance(segment, bytes):
+                parts.append(segment)
+                continue
+            elem = dataset[segment]
+            if (segment == PIXEL_DATA_TAG and isinstance(elem.value, bytes)
+                    and not elem.is_undefined_length):
+                # Write the pixels as they are, rather than copying them
+                # into the encoded element first.
+                value = elem.value
+                padding = b'\0' if len(value) % 2 else b''
+                parts.append(self._pixel_data_header(
+                    elem, dataset, len(value) + len(padding)))
+                fp.write(b''.join(parts))
+                fp.write(value)
+                parts = [padding]
+            else:
+                encoded = _encode_simple(segment, elem.VR, elem.value,
+                                         self.implicit_vr, self.little_endian)
+                if encoded is None:
+                    encoded = self._encode(dataset, segment)
+                parts.append(encoded)
+        fp.write(b''.join(parts))
+
+
+class TemplateWriter(object):
+    """ Writes DICOM files from header templates.
+
+    A template is built from the first dataset written with a new
+    combination of key, transfer syntax, elements present and values of the
+    invariant elements, and reused for all following ones.
+
+    The content of sequences is not compared. With key=None sequences are
+    encoded for each file. Callers which know what determines their
+    sequences (for orthodontic photographs: the view and the teeth) pass
+    that as key, and sequences become part of the template.
+
+    Only uncompressed transfer syntaxes are supported.
+
+    A TemplateWriter can be shared by several threads.
+
+    arguments:
+
+    variable_keywords: keywords of the elements to encode for each file.
+    Any other element whose value changes still gives a correct file, but
+    makes a new template.
+    """
+
+    def __init__(self, variable_keywords=VARIABLE_KEYWORDS):
+        self.variable = frozenset(Tag(keyword) for keyword in variable_keywords)
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def _signature(self, dataset, key, transfer_syntax):
+        signature = [key, transfer_syntax, dataset.preamble]
+        variable = set(self.variable)
+        for tag, elem in dataset.items():
+            if tag in self.variable:
+                signature.append(tag)
+                continue
+            if isinstance(elem, RawDataElement) or elem.is_buffered:
+                value = None
+            elif elem.VR == 'SQ':
+                value = () if key is not None else None
+            else:
+                value = _frozen(elem.value)
+            if value is None:
+                variable.add(tag)
+                signature.append(tag)
+            else:
+                signature.append((tag, elem.VR, value))
+        file_meta = dataset.file_meta
+        signature.extend(
+            (tag, _frozen(file_meta[tag].value)) for tag in file_meta.keys()
+            if tag not in (_GROUP_LENGTH_TAG, _META_INSTANCE_TAG))
+        return tuple(signature), variable
+
+    def _template(self, dataset, key, transfer_syntax):
+        signature, variable = self._signature(dataset, key, transfer_syntax)
+        with self._lock:
+            template = self._templates.get(signature)
+        if template is None:
+            encodings = dataset.get('SpecificCharacterSet', default_encoding)
+            template = _Template(dataset, transfer_syntax, variable, encodings)
+            with self._lock:
+                if len(self._templates) >= MAX_TEMPLATES:
+                    self._templates.clear()
+                self._templates[signature] = template
+        return template
+
+    def __len__(self):
+        return len(self._templates)
+
+    def write(self, dataset, fp, key=None, transfer_syntax=ImplicitVRLittleEndian):
+        ''' Write dataset, a FileDataset, as a DICOM file into the binary
+        stream fp.
+        '''
+        transfer_syntax = UID(transfer_syntax)
+        if not transfer_syntax.is_transfer_syntax or transfer_syntax.is_compressed \
+                or transfer_syntax.is_deflated:
+            raise ValueError(
+                "Unsupported transfer syntax {}".format(transfer_syntax.name))
+        if not getattr(dataset, 'file_meta', None):
+            raise ValueError("dataset needs File Meta Information.")
+        self._template(dataset, key, transfer_syntax).write(dataset, fp)
+
+    def save(self, dataset, filename, key=None, transfer_syntax=ImplicitVRLittleEndian):
+        ''' Same as write(), into a file or a binary stream.
+        '''
+        if isinstance(filename, str):
+            with open(filename, 'wb') as fp:
+                self.write(dataset, fp, key, transfer_syntax)
+        else:
+            self.write(dataset, filename, key, transfer_syntax)
@@ -0,0 +1,145 @@
+"""
+Pixel integrity hashes.
+
+While an image is converted, its packed pixel buffer is hashed once. The
+hash of the Pixel Data value as written, which only adds the padding byte
+of odd length buffers, continues from the same hash state, so the pixels
+are not read a second time.
+
+The hashes go into the run report, and optionally into private attributes
+of the file. verify() checks files against either, reading only their
+header and streaming their Pixel Data through the hash.
+"""
+import collections
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import dicom4ortho.dicomfile as dicomfile
+
+ALGORITHM = 'blake2b-256'
+
+# Where bulk conversions put the hashes: into the run report only, or also
+# into the files.
+REPORT = 'report'
+ATTRIBUTE = 'attribute'
+
+# Private attributes holding the hashes in the files.
+PRIVATE_GROUP = 0x0011
+PRIVATE_CREATOR = 'DICOM4ORTHO INTEGRITY'
+ALGORITHM_ELEMENT = 0x01
+SOURCE_HASH_ELEMENT = 0x02
+PIXEL_DATA_HASH_ELEMENT = 0x03
+# The tags of the hashes when the private block is the first one of the
+# group, as in the files written here.
+SOURCE_HASH_TAG = (PRIVATE_GROUP << 16) | 0x1000 | SOURCE_HASH_ELEMENT
+PIXEL_DATA_HASH_TAG = (PRIVATE_GROUP << 16) | 0x1000 | PIXEL_DATA_HASH_ELEMENT
+
+# Files verified at the same time.
+VERIFY_THREADS = 8
+
+PixelHashes = collections.namedtuple('PixelHashes', ['algorithm', 'source', 'pixel_data'])
+
+# Outcome of verifying a file. ok is None when there was no hash to compare.
+Verification = collections.namedtuple('Verification', ['filename', 'ok', 'message'])
+
+
+def new_hash():
+    return hashlib.blake2b(digest_size=32)
+
+
+def pixel_hashes(pixel_data, padding=b''):
+    ''' PixelHashes of the packed pixel buffer pixel_data, and of the Pixel
+    Data value it is written as, pixel_data followed by padding.
+    '''
+    digest = new_hash()
+    digest.update(pixel_data)
+    source = digest.hexdigest()
+    if padding:
+        digest.update(padding)
+    return PixelHashes(ALGORITHM, source, digest.hexdigest())
+
+
+def set_hash_attributes(ds, hashes):
+    ''' Store PixelHashes hashes in private attributes of dataset ds.
+    '''
+    block = ds.private_block(PRIVATE_GROUP, PRIVATE_CREATOR, create=True)
+    block.add_new(ALGORITHM_ELEMENT, 'LO', hashes.algorithm)
+    block.add_new(SOURCE_HASH_ELEMENT, 'LO', hashes.source)
+    block.add_new(PIXEL_DATA_HASH_ELEMENT, 'LO', hashes.pixel_data)
+
+
+def stored_hash(ds):
+    ''' The Pixel Data hash stored in dataset ds, or None.
+    '''
+    try:
+        block = ds.private_block(PRIVATE_GROUP, PRIVATE_CREATOR)
+        algorithm = _text(block[ALGORITHM_ELEMENT].value)
+        pixel_data_hash = _text(block[PIXEL_DATA_HASH_ELEMENT].value)
+    except KeyError:
+        return None
+    return pixel_data_hash if algorithm == ALGORITHM else None
+
+
+def _text(value):
+    # Unknown private elements of Implicit VR files are read as bytes.
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'replace')
+    return value.strip()
+
+
+def report_hashes(report_filename):
+    ''' Pixel Data hashes of a run report, by absolute output file name.
+    '''
+    hashes = {}
+    with open(report_filename) as report:
+        for line in report:
+            record = json.loads(line)
+            if record.get('output') and record.get('pixel_data_hash'):
+                hashes[os.path.abspath(record['output'])] = record['pixel_data_hash']
+    return hashes
+
+
+def verify_file(filename, expected=None):
+    ''' Hash the Pixel Data of DICOM file filename, and compare it with
+    expected, or else with the hash stored in the file. Returns a
+    Verification.
+    '''
+    try:
+        with open(filename, 'rb') as fp:
+            ds, location = dicomfile.read_header(fp)
+            if expected is None:
+                expected = stored_hash(ds)
+            if expected is None:
+                return Verification(filename, None, "no hash")
+            if location is None:
+                return Verification(filename, False, "no Pixel Data")
+            digest = new_hash()
+            for block in dicomfile.pixel_data_blocks(fp, location):
+                digest.update(block)
+    except Exception as e:  # pylint: disable=broad-except
+        return Verification(filename, False, '{}: {}'.format(type(e).__name__, e))
+    if digest.hexdigest() != expected:
+        return Verification(filename, False, "Pixel Data hash differs")
+    return Verification(filename, True, "ok")
+
+
+def verify(filenames, report_filename=None, threads=VERIFY_THREADS):
+    ''' verify_file() each of filenames, against the hashes of run report
+    report_filename if given. Files missing from the report fail: it may
+    name them differently, as with relative paths from another working
+    directory, and they would otherwise not be checked at all. Returns a
+    list of Verification.
+    '''
+    expected = None if report_filename is None else report_hashes(report_filename)
+
+    def verify_one(filename):
+        if expected is None:
+            return verify_file(filename)
+        pixel_data_hash = expected.get(os.path.abspath(filename))
+        if pixel_data_hash is None:
+            return Verification(filename, False, "not in {}".format(report_filename))
+        return verify_file(filename, pixel_data_hash)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(verify_one, filenames))
@@ -5,11 +5,14 @@ Adds SNOMED CT codes in DICOM object for Orthodontic Views.
 
 '''
 
+import functools
 import logging
+import PIL.Image
 from pydicom.sequence import Sequence
+from pydicom.dataelem import DataElement
 from pydicom.dataset import Dataset
 
-from dicom4ortho.model import PhotographBase
+from dicom4ortho.model import PhotographBase, _is_true, parse_transpose
 import dicom4ortho.m_tooth_codes as ToothCodes
 from dicom4ortho import defaults
 
@@ -383,6 +386,29 @@ def _get_sct_code_sequence(value, meaning):
     return Sequence([_get_sct_code_dataset(value, meaning)])
 
 
+@functools.lru_cache(maxsize=1024)
+def _tooth_code_elements(teeth):
+    """ The elements of the code datasets of teeth, a ToothSet, as (tag, VR,
+    value) tuples. They are looked up once for each set of teeth.
+    """
+    return tuple(
+        tuple((elem.tag, elem.VR, elem.value) for elem in
+              _get_sct_code_dataset(*ToothCodes.SCT_TOOTH_CODES[tooth]))
+        for tooth in teeth)
+
+
+def _tooth_code_datasets(teeth):
+    """ New code datasets of teeth, a ToothSet, one for each tooth: each
+    image gets its own, to change as it likes.
+    """
+    return [Dataset({tag: DataElement(tag, vr, value) for tag, vr, value in elements})
+            for elements in _tooth_code_elements(teeth)]
+
+
+def _set_teeth(dataset, teeth):
+    dataset.PrimaryAnatomicStructureSequence = Sequence(_tooth_code_datasets(teeth))
+
+
 IMAGE_TYPES = {
     "EV01": [_EO, _RP, _LR, _CO],
     "EV02": [_EO, _RP, _LR, _CR],
@@ -550,6 +576,21 @@ ALLOWED_TEETH = {
 
 }
 
+# How to undo the mirror of intraoral views taken through one, for
+# mirror_correction=True: buccal views are mirrored left to right, occlusal
+# views top to bottom.
+MIRROR_CORRECTIONS = {
+    _RB: PIL.Image.Transpose.FLIP_LEFT_RIGHT,
+    _LB: PIL.Image.Transpose.FLIP_LEFT_RIGHT,
+    _MX: PIL.Image.Transpose.FLIP_TOP_BOTTOM,
+    _MD: PIL.Image.Transpose.FLIP_TOP_BOTTOM,
+}
+
+# ALLOWED_TEETH as ToothSet.
+ALLOWED_TEETH_SETS = {
+    image_type: ToothCodes.ToothSet.parse(teeth) for image_type, teeth in ALLOWED_TEETH.items()
+}
+
 
 class OrthodonticPhotograph(PhotographBase):
     """ An Orthodontic Photograph as defined in WP-1100
@@ -561,10 +602,21 @@ class OrthodonticPhotograph(PhotographBase):
         input_image_filename: name of input image file
 
         output_image_filename: name of output image file
+
+        teeth: teeth visible in the photograph, see add_teeth()
+
+        mirror_correction: undo the mirror of a photograph taken through
+        one: a PIL.Image.Transpose or its name, or True for the one of
+        MIRROR_CORRECTIONS for the view. The view is then stored as mirror
+        corrected.
+
+        exif_orientation: turn the image upright according to its EXIF
+        Orientation tag.
     """
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.image_type = None
         if callable(kwargs['image_type']):
             # If a custom function was passed, then use it.
             self._type = kwargs['image_type']
@@ -577,6 +629,8 @@ class OrthodonticPhotograph(PhotographBase):
             # Get the array of functions to set this required type.
             self._type = (IMAGE_TYPES[self.image_type])
 
+        self._teeth = ToothCodes.ToothSet()
+        self._is_mirror_corrected = False
         if "teeth" in kwargs:
             self.add_teeth(kwargs['teeth'])
         ImageComments = "{}^{}".format(
@@ -588,22 +642,55 @@ class OrthodonticPhotograph(PhotographBase):
         self._set_dicom_attributes()
 
 
+    @property
+    def template_key(self):
+        # The sequences only depend on the view and the teeth, and on those
+        # set as attributes.
+        view = self._type if callable(self._type) else self.image_type
+        return (type(self), view, self._teeth, self._is_mirror_corrected,
+                self._attributes_key)
+
+    def _mirror_transpose(self, mirror_correction):
+        if mirror_correction is True or (
+                isinstance(mirror_correction, str) and
+                (_is_true(mirror_correction) or mirror_correction.lower() == 'auto')):
+            views = [self._type] if callable(self._type) else self._type
+            for set_attr in views:
+                if set_attr in MIRROR_CORRECTIONS:
+                    return MIRROR_CORRECTIONS[set_attr]
+            raise ValueError("No mirror correction known for {}".format(self.image_type))
+        return parse_transpose(mirror_correction)
+
+    def _mirror_corrected(self):
+        _WM_BC(self._ds)
+        self._is_mirror_corrected = True
+
     def _set_dicom_attributes(self):
         for set_attr in self._type:
             logging.debug('Setting DICOM attributes for {}', self._type)
             set_attr(self._ds)
 
     def add_teeth(self, teeth):
+        """ Add teeth to the teeth visible in the photograph.
+
+        teeth: a ToothSet, ISO tooth numbers, ranges and quadrants, like
+        ['11-18', '21'] or '11-18 21 Q3', see ToothSet.parse(), or
+        defaults.ADD_MAX_ALLOWED_TEETH for all teeth of ALLOWED_TEETH.
+
+        Anything which is not a tooth is logged and skipped. Teeth which are
+        not among ALLOWED_TEETH of the view are logged.
+        """
         logging.debug("Adding teeth")
         if teeth == defaults.ADD_MAX_ALLOWED_TEETH:
             logging.debug("Setting all possibly allowed teeth.")
-            teeth = ALLOWED_TEETH[self.image_type]
-
-        if len(teeth) > 0:
-            if not hasattr(self._ds, 'PrimaryAnatomicStructureSequence'):
-                self._ds.PrimaryAnatomicStructureSequence = Sequence([])
-
-            for tooth in teeth:
-                if ToothCodes.is_valid_tooth_number(tooth):
-                    self._ds.PrimaryAnatomicStructureSequence.append(
-                        _get_sct_code_dataset(*ToothCodes.SCT_TOOTH_CODES[tooth]))
+            teeth = ALLOWED_TEETH_SETS[self.image_type]
+
+        teeth = ToothCodes.ToothSet.parse(teeth, strict=False)
+        if teeth:
+            allowed = ALLOWED_TEETH_SETS.get(self.image_type)
+            # An empty list means the view does not tell.
+            if allowed and teeth - allowed:
+                logging.warning("Teeth {} are not expected in {} photographs".format(
+                    ' '.join(teeth - allowed), self.image_type))
+            self._teeth |= teeth
+            _set_teeth(self._ds, self._teeth)
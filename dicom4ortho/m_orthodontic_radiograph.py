@@ -0,0 +1,129 @@
+# pylint: disable=invalid-name
+''' Orthodontic Radiograph Classes.
+
+Cephalometric and panoramic radiographs, usually exported by the X-ray
+software as 16 bit grayscale TIFF or PNG files.
+
+'''
+
+import logging
+
+from dicom4ortho.model import RadiographBase
+import dicom4ortho.m_tooth_codes as ToothCodes
+from dicom4ortho.m_orthodontic_photograph import (
+    _get_sct_code_sequence, _jaw_region, _null, _set_teeth)
+from dicom4ortho import defaults
+
+
+def _skull(dataset):
+    a_r_s = _get_sct_code_sequence(
+        '89546000', 'Bone structure of cranium (body structure)')
+    a_r_s[0].AnatomicRegionModifierSequence = _null()
+    dataset.AnatomicRegionSequence = a_r_s
+
+
+def _PX(dataset):
+    """ Panoramic
+    """
+    _jaw_region(dataset)
+    dataset.Modality = 'PX'
+    dataset.ImageLaterality = 'B'
+    dataset.PatientOrientation = ['R', 'F']  # Right, Foot
+
+
+def _LC(dataset):
+    """ Lateral Cephalometric
+
+    the subject's right side is towards the detector
+    """
+    _skull(dataset)
+    dataset.ImageLaterality = 'U'
+    dataset.ViewPosition = 'RL'
+    dataset.AcquisitionView = _get_sct_code_sequence(
+        '30730003', 'Sagittal (qualifier value)')
+    dataset.PatientOrientation = ['A', 'F']  # Anterior, Foot
+
+
+def _PA(dataset):
+    """ Posteroanterior Cephalometric
+    """
+    _skull(dataset)
+    dataset.ImageLaterality = 'U'
+    dataset.ViewPosition = 'PA'
+    dataset.AcquisitionView = _get_sct_code_sequence(
+        '81654009', 'Coronal (qualifier value)')
+    dataset.PatientOrientation = ['L', 'F']  # Left, Foot
+
+
+RADIOGRAPH_TYPES = {
+    "RV01": [_PX],
+    "RV02": [_LC],
+    "RV03": [_PA],
+}
+
+RADIOGRAPH_DESCRIPTIONS = {
+    "RV01": "Panoramic",
+    "RV02": "Lateral Cephalometric",
+    "RV03": "Posteroanterior Cephalometric",
+}
+
+
+def is_radiograph_type(image_type):
+    return isinstance(image_type, str) and \
+        image_type.replace('-', '') in RADIOGRAPH_TYPES
+
+
+class OrthodonticRadiograph(RadiographBase):
+    """ An Orthodontic Radiograph, stored as Digital X-Ray Image
+
+        arguments:
+
+        image_type: a radiograph type code from RADIOGRAPH_TYPES. Ex. RV02
+
+        input_image_filename: name of input image file
+
+        output_image_filename: name of output image file
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if callable(kwargs['image_type']):
+            # If a custom function was passed, then use it.
+            self._type = [kwargs['image_type']]
+            self.image_type = None
+        else:
+            # Allow for both dash separated and not separated naming
+            self.image_type = kwargs['image_type'].replace('-', '')
+            self._type = RADIOGRAPH_TYPES[self.image_type]
+            self._ds.ImageComments = "{}^{}".format(
+                self.image_type, RADIOGRAPH_DESCRIPTIONS[self.image_type])
+
+        self._teeth = ToothCodes.ToothSet()
+        if kwargs.get('teeth'):
+            self.add_teeth(kwargs['teeth'])
+        self._set_dicom_attributes()
+
+    @property
+    def template_key(self):
+        # The sequences only depend on the view and the teeth, and on those
+        # set as attributes.
+        view = self._type[0] if self.image_type is None else self.image_type
+        return (type(self), view, self._teeth, self._attributes_key)
+
+    def _set_dicom_attributes(self):
+        for set_attr in self._type:
+            logging.debug('Setting DICOM attributes for {}'.format(self._type))
+            set_attr(self._ds)
+
+    def add_teeth(self, teeth):
+        """ Add teeth to the teeth visible in the radiograph, see
+        OrthodonticPhotograph.add_teeth(). There is no list of allowed teeth
+        for radiographs: defaults.ADD_MAX_ALLOWED_TEETH adds none.
+        """
+        logging.debug("Adding teeth")
+        if teeth == defaults.ADD_MAX_ALLOWED_TEETH:
+            return
+        teeth = ToothCodes.ToothSet.parse(teeth, strict=False)
+        if teeth:
+            self._teeth |= teeth
+            _set_teeth(self._ds, self._teeth)
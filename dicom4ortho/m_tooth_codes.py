@@ -3,7 +3,12 @@
 The code meaning is an LO (Long String) VR (Value Representiation, aka data
 type) in DICOM which has a limit of 64 character.
 
+A set of teeth is kept as a ToothSet: a bitmask with one bit for each of
+the 52 ISO teeth.
+
 '''
+import logging
+import re
 
 SCT_TOOTH_CODES = {
     '11': ['245575001', '11 Entire permanent maxillary right central incisor tooth'],
@@ -61,9 +66,139 @@ SCT_TOOTH_CODES = {
 }
 
 
+# All teeth, in ISO order. Tooth TEETH[i] is bit i of a ToothSet.
+TEETH = tuple(SCT_TOOTH_CODES)
+
+_BITS = {tooth: 1 << i for i, tooth in enumerate(TEETH)}
+
+# The teeth of each arch, from the patient's right to left. A range like
+# 13-23 is read along one of them.
+ARCHES = [
+    [t for q in ('1', '2') for t in sorted((t for t in TEETH if t[0] == q), reverse=q == '1')],
+    [t for q in ('4', '3') for t in sorted((t for t in TEETH if t[0] == q), reverse=q == '4')],
+    [t for q in ('5', '6') for t in sorted((t for t in TEETH if t[0] == q), reverse=q == '5')],
+    [t for q in ('8', '7') for t in sorted((t for t in TEETH if t[0] == q), reverse=q == '8')],
+]
+
+
+def _mask(teeth):
+    mask = 0
+    for tooth in teeth:
+        mask |= _BITS[tooth]
+    return mask
+
+
+# Shortcuts for groups of teeth: the ISO quadrants, and the permanent arches.
+QUADRANTS = {
+    'Q{}'.format(q): _mask(t for t in TEETH if t[0] == str(q)) for q in range(1, 9)
+}
+SHORTCUTS = dict(QUADRANTS)
+SHORTCUTS['UPPER'] = QUADRANTS['Q1'] | QUADRANTS['Q2']
+SHORTCUTS['LOWER'] = QUADRANTS['Q3'] | QUADRANTS['Q4']
+SHORTCUTS['PERMANENT'] = SHORTCUTS['UPPER'] | SHORTCUTS['LOWER']
+SHORTCUTS['DECIDUOUS'] = QUADRANTS['Q5'] | QUADRANTS['Q6'] | QUADRANTS['Q7'] | QUADRANTS['Q8']
+
+_SEPARATORS = re.compile(r'[\s,;]+')
+
+
 def is_valid_tooth_number(tooth):
     ''' Check if string is a valid ISO tooth number
     '''
 
     # True if tooth exists as key in dict above, false otherwise.
-    return tooth in SCT_TOOTH_CODES.keys()
+    return tooth in SCT_TOOTH_CODES
+
+
+def _range_mask(first, last):
+    for arch in ARCHES:
+        if first in arch and last in arch:
+            i, j = sorted((arch.index(first), arch.index(last)))
+            return _mask(arch[i:j + 1])
+    raise ValueError('{}-{} is not a range of teeth of one arch'.format(first, last))
+
+
+def _token_mask(token):
+    shortcut = SHORTCUTS.get(token.upper())
+    if shortcut is not None:
+        return shortcut
+    if '-' in token:
+        first, _, last = token.partition('-')
+        if is_valid_tooth_number(first) and is_valid_tooth_number(last):
+            return _range_mask(first, last)
+    elif is_valid_tooth_number(token):
+        return _BITS[token]
+    raise ValueError('{} is not an ISO tooth number, range or quadrant'.format(token))
+
+
+class ToothSet(object):
+    """ A set of ISO teeth, as a bitmask.
+
+    Iterating gives the tooth numbers, as strings, in ISO order.
+    """
+    __slots__ = ('mask',)
+
+    def __init__(self, mask=0):
+        self.mask = mask
+
+    @classmethod
+    def parse(cls, teeth, strict=True):
+        ''' ToothSet from teeth: a ToothSet, a string like '11-18 21,22 Q3',
+        or an iterable of such strings. A range goes along one arch, so
+        13-23 is the upper canines and incisors. Shortcuts are Q1 to Q8 for
+        the ISO quadrants, UPPER, LOWER, PERMANENT and DECIDUOUS.
+
+        Raises ValueError on anything else, unless strict is False, in which
+        case it is logged and left out.
+        '''
+        if isinstance(teeth, ToothSet):
+            return teeth
+        if isinstance(teeth, str):
+            teeth = [teeth]
+        mask = 0
+        for item in teeth or ():
+            for token in _SEPARATORS.split(item.strip()):
+                if not token:
+                    continue
+                try:
+                    mask |= _token_mask(token)
+                except ValueError as e:
+                    if strict:
+                        raise
+                    logging.warning("Skipping {}: {}".format(token, e))
+        return cls(mask)
+
+    def __iter__(self):
+        mask = self.mask
+        i = 0
+        while mask:
+            if mask & 1:
+                yield TEETH[i]
+            mask >>= 1
+            i += 1
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def __bool__(self):
+        return self.mask != 0
+
+    def __contains__(self, tooth):
+        return bool(self.mask & _BITS.get(tooth, 0))
+
+    def __or__(self, other):
+        return ToothSet(self.mask | other.mask)
+
+    def __and__(self, other):
+        return ToothSet(self.mask & other.mask)
+
+    def __sub__(self, other):
+        return ToothSet(self.mask & ~other.mask)
+
+    def __eq__(self, other):
+        return isinstance(other, ToothSet) and self.mask == other.mask
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __repr__(self):
+        return 'ToothSet({!r})'.format(' '.join(self))
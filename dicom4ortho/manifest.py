@@ -0,0 +1,333 @@
+"""
+Bulk conversion manifests and their validation.
+
+A manifest lists the images to convert and their metadata, one row each,
+either as a CSV file or as JSON Lines: one JSON object per line, read one
+line at a time. JSON rows may give teeth as an array, any per-row option
+(mirror_correction, max_dimension, output_image_filename, transfer_syntax,
+...) and extra DICOM attributes in a "dicom" object of keyword to value:
+
+{"input_image_filename": "IV25.jpg", "image_type": "IV-25", ...,
+ "teeth": ["11", "12"], "transfer_syntax": "1.2.840.10008.1.2.1",
+ "dicom": {"AccessionNumber": "A123"}}
+
+Columns, or keys of JSON rows, which are none of these are reported, as
+they would otherwise be ignored, like a misspelt option.
+
+The whole manifest is checked before any image is decoded, so that a bad
+row is reported in seconds rather than after hours of conversion.
+
+Checks run column by column. Values like birth dates, image types or UIDs
+repeat a lot across rows, so each distinct value of a column is checked
+only once. Input files are looked up with one directory listing per
+directory, or the index of the archive they are in, instead of one stat
+call per file.
+"""
+import collections
+import csv
+import datetime
+import json
+import os
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pydicom.uid
+
+import dicom4ortho.archive as archive
+import dicom4ortho.defaults as defaults
+import dicom4ortho.model as model
+from dicom4ortho.m_orthodontic_photograph import IMAGE_TYPES
+from dicom4ortho.m_orthodontic_radiograph import is_radiograph_type
+from dicom4ortho.m_tooth_codes import ToothSet
+
+# Columns every row needs.
+REQUIRED_COLUMNS = (
+    'patient_firstname', 'patient_lastname', 'patient_id', 'patient_sex',
+    'patient_birthdate', 'dental_provider_firstname', 'dental_provider_lastname',
+    'image_type', 'manufacturer', 'input_image_filename',
+    'study_description', 'series_description',
+)
+
+# Columns rows may have.
+OPTIONAL_COLUMNS = (
+    'study_instance_uid', 'series_instance_uid', 'teeth', 'output_image_filename',
+    'mirror_correction', 'exif_orientation', 'max_dimension', 'max_megapixels',
+    'pixel_hash', 'pixel_hash_attribute', 'transfer_syntax',
+)
+
+# Extensions of JSON Lines manifests. Anything else is read as CSV.
+JSONL_EXTENSIONS = ('.jsonl', '.ndjson')
+
+# Key of the extra DICOM attributes of a JSON row.
+DICOM_ATTRIBUTES_KEY = 'dicom'
+
+# Values of Patient's Sex.
+SEX_VALUES = ('M', 'F', 'O', '')
+
+# Threads listing directories at the same time.
+LIST_THREADS = 8
+
+ManifestError = collections.namedtuple('ManifestError', ['row', 'column', 'value', 'message'])
+
+
+class InvalidManifest(ValueError):
+    """ The manifest has errors, listed in errors.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("{} errors in manifest, first: {}".format(
+            len(errors), format_error(errors[0])))
+
+
+def format_error(error):
+    return "row {}, {} {!r}: {}".format(error.row, error.column, error.value, error.message)
+
+
+def _check_date(value):
+    datetime.datetime.strptime(value, defaults.IMPORT_DATE_FORMAT)
+
+
+def _check_image_type(value):
+    if value.replace('-', '') not in IMAGE_TYPES and not is_radiograph_type(value):
+        raise ValueError("unknown image type")
+
+
+def _check_sex(value):
+    if value not in SEX_VALUES:
+        raise ValueError("not one of M, F, O or empty")
+
+
+def _check_uid(value):
+    if value and not pydicom.uid.UID(value).is_valid:
+        raise ValueError("not a valid UID")
+
+
+def _check_teeth(value):
+    if value:
+        ToothSet.parse(value)
+
+
+def _check_transfer_syntax(value):
+    model.transfer_syntax_uid(value)
+
+
+def _check_attributes(value):
+    if not isinstance(value, dict):
+        raise ValueError("not an object of DICOM keyword to value")
+    model.attributes_dataset(value)
+
+
+COLUMN_CHECKS = {
+    'patient_birthdate': _check_date,
+    'image_type': _check_image_type,
+    'patient_sex': _check_sex,
+    'study_instance_uid': _check_uid,
+    'series_instance_uid': _check_uid,
+    'teeth': _check_teeth,
+    'transfer_syntax': _check_transfer_syntax,
+    DICOM_ATTRIBUTES_KEY: _check_attributes,
+}
+
+KNOWN_COLUMNS = frozenset(REQUIRED_COLUMNS + OPTIONAL_COLUMNS + (DICOM_ATTRIBUTES_KEY,))
+
+
+def check_column(values, check):
+    ''' Yield (index, message) for each of values which check() rejects by
+    raising ValueError or TypeError. check() runs once for each distinct
+    value.
+    '''
+    messages = {}
+    for i, value in enumerate(values):
+        key = tuple(value) if isinstance(value, list) else value
+        try:
+            message = messages[key]
+        except (KeyError, TypeError):
+            try:
+                check(value)
+                message = None
+            except (ValueError, TypeError) as e:
+                message = str(e) or type(e).__name__
+            try:
+                messages[key] = message
+            except TypeError:
+                pass
+        if message is not None:
+            yield i, message
+
+
+def _list(key):
+    """ Names of the files in a directory, or the members of an archive,
+    or the error listing it.
+    """
+    is_archive, container = key
+    try:
+        if is_archive:
+            return set(archive.open_archive(container).names())
+        with os.scandir(container or '.') as entries:
+            return {entry.name for entry in entries if entry.is_file()}
+    except (OSError, ValueError, tarfile.TarError) as e:
+        return e
+
+
+def missing_files(filenames, base='', threads=LIST_THREADS):
+    ''' Yield (index, message) for each of filenames, relative to directory
+    base, which does not exist.
+    '''
+    members = collections.defaultdict(list)
+    for i, filename in enumerate(filenames):
+        if archive.MEMBER_SEPARATOR in filename:
+            container, _, member = filename.partition(archive.MEMBER_SEPARATOR)
+            members[True, container].append((i, member))
+        else:
+            container, sep, member = filename.rpartition(os.sep)
+            if os.altsep and os.altsep in member:
+                container, member = os.path.split(filename)
+            members[False, container or sep].append((i, member))
+    keys = list(members)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        listings = executor.map(
+            lambda key: _list((key[0], os.path.join(base, key[1]))), keys)
+        for key, listing in zip(keys, listings):
+            for i, member in members[key]:
+                if isinstance(listing, Exception):
+                    yield i, "{}: {}".format(type(listing).__name__, listing)
+                elif member not in listing:
+                    yield i, "no such file"
+
+
+def validate_columns(columns, rows, base='', check_files=True):
+    ''' Check a manifest of rows rows, given as a dict of column name to
+    the values of that column, None where a row has no value. Returns the
+    list of ManifestError found, by row number counting from 1, empty if all
+    is well.
+
+    base: the directory input file names are relative to.
+
+    check_files: also check that input files exist.
+    '''
+    errors = [ManifestError(None, column, None, "missing column")
+              for column in REQUIRED_COLUMNS if column not in columns]
+    for column in REQUIRED_COLUMNS:
+        if column in columns:
+            errors.extend(ManifestError(i + 1, column, None, "missing value")
+                          for i, value in enumerate(columns[column]) if value is None)
+    for column, check in COLUMN_CHECKS.items():
+        values = columns.get(column)
+        if values is None:
+            continue
+        present = [i for i, value in enumerate(values) if value is not None]
+        if len(present) < rows:
+            values = [values[i] for i in present]
+        else:
+            present = range(rows)
+        errors.extend(ManifestError(present[j] + 1, column, values[j], message)
+                      for j, message in check_column(values, check))
+    if check_files and 'input_image_filename' in columns:
+        values = columns['input_image_filename']
+        errors.extend(ManifestError(i + 1, 'input_image_filename', value, "not a file name")
+                      for i, value in enumerate(values)
+                      if value is not None and not isinstance(value, str))
+        present = [i for i, value in enumerate(values) if value and isinstance(value, str)]
+        filenames = [values[i] for i in present]
+        errors.extend(ManifestError(present[j] + 1, 'input_image_filename', filenames[j], message)
+                      for j, message in missing_files(filenames, base))
+    errors.sort(key=lambda e: (e.row or 0, e.column))
+    return errors
+
+
+def validate_rows(rows, columns=None, check_files=True):
+    ''' Check the rows of a manifest, dicts of metadata as taken by
+    controller.SimpleController.convert_image_to_dicom4orthograph(). See
+    validate_columns().
+
+    columns: the columns of the manifest. Those of the first row by default.
+    '''
+    if columns is None:
+        columns = rows[0].keys() if rows else ()
+    return validate_columns({column: [row.get(column) for row in rows] for column in columns},
+                            len(rows), check_files=check_files)
+
+
+def validate_csv(csv_input, check_files=True):
+    ''' Check the CSV manifest csv_input, which gives input file names
+    relative to itself. See validate_columns().
+    '''
+    with open(csv_input, mode='r', newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, [])
+        rows = [row for row in reader if row]
+    for row in rows:
+        if len(row) < len(header):
+            row.extend([None] * (len(header) - len(row)))
+    columns = {column: [row[i] for row in rows] for i, column in enumerate(header)}
+    errors = [ManifestError(None, column, None, "unknown column")
+              for column in header if column not in KNOWN_COLUMNS]
+    return errors + validate_columns(columns, len(rows), os.path.dirname(csv_input), check_files)
+
+
+def is_jsonl(filename):
+    return os.path.splitext(filename)[1].lower() in JSONL_EXTENSIONS
+
+
+def read_jsonl(jsonl_input):
+    ''' Yield the rows of JSON Lines manifest jsonl_input as dicts, one
+    line at a time. Empty lines are skipped.
+    '''
+    with open(jsonl_input, mode='r', encoding='utf-8') as jsonl_file:
+        for line_number, line in enumerate(jsonl_file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise ValueError("{} line {}: {}".format(jsonl_input, line_number, e))
+            if not isinstance(row, dict):
+                raise ValueError("{} line {}: not a JSON object".format(
+                    jsonl_input, line_number))
+            yield row
+
+
+def read_rows(manifest_input):
+    ''' Yield the rows of manifest_input, CSV or JSON Lines, as dicts.
+    '''
+    if is_jsonl(manifest_input):
+        yield from read_jsonl(manifest_input)
+        return
+    with open(manifest_input, mode='r') as csv_file:
+        yield from csv.DictReader(csv_file, delimiter=',')
+
+
+def validate_jsonl(jsonl_input, check_files=True):
+    ''' Check the JSON Lines manifest jsonl_input, which gives input file
+    names relative to itself. See validate_columns(). Only the checked
+    columns are kept in memory.
+    '''
+    checked = set(REQUIRED_COLUMNS) | set(COLUMN_CHECKS)
+    columns = {}
+    # The first row of each unknown key.
+    unknown = {}
+    rows = 0
+    for rows, row in enumerate(read_jsonl(jsonl_input), 1):
+        for column in row.keys() - KNOWN_COLUMNS:
+            unknown.setdefault(column, rows)
+        for column in checked.intersection(row):
+            if column not in columns:
+                columns[column] = [None] * (rows - 1)
+            columns[column].append(row[column])
+        for values in columns.values():
+            if len(values) < rows:
+                values.append(None)
+    errors = validate_columns(columns, rows, os.path.dirname(jsonl_input), check_files)
+    errors.extend(ManifestError(row, column, None, "unknown column")
+                  for column, row in unknown.items())
+    errors.sort(key=lambda e: (e.row or 0, e.column))
+    return errors
+
+
+def validate(manifest_input, check_files=True):
+    ''' Check manifest_input, CSV or JSON Lines. See validate_columns().
+    '''
+    if is_jsonl(manifest_input):
+        return validate_jsonl(manifest_input, check_files)
+    return validate_csv(manifest_input, check_files)
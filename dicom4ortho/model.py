@@ -1,7 +1,10 @@
 """
 The model.
 """
+import contextlib
 import datetime
+import io
+import json
 import logging
 
 import pydicom
@@ -9,21 +12,138 @@ from pydicom.sequence import Sequence
 from pydicom.dataset import Dataset, FileDataset
 
 # pylint: disable=no-name-in-module
-from pynetdicom.sop_class import VLPhotographicImageStorage
+from pynetdicom.sop_class import (
+    DigitalXRayImageStorageForPresentation, VLPhotographicImageStorage)
 import PIL
+import PIL.Image
 
+import dicom4ortho.archive as archive
 import dicom4ortho.defaults as defaults
+import dicom4ortho.integrity as integrity
+import dicom4ortho.uid as uid
+from dicom4ortho.timing import NULL_TIMINGS
+
+# Resampling when scaling images down. With reducing_gap, most of the
+# reduction is done by fast box averaging first.
+DOWNSCALE_FILTER = PIL.Image.Resampling.BILINEAR
+DOWNSCALE_REDUCING_GAP = 3.0
+
+# Transfer syntaxes files may be written in, the first one by default.
+TRANSFER_SYNTAXES = (
+    pydicom.uid.ImplicitVRLittleEndian,
+    pydicom.uid.ExplicitVRLittleEndian,
+    pydicom.uid.ExplicitVRBigEndian,
+)
+
+
+def _optional_number(value):
+    """ For options which may come from a CSV file as strings.
+    """
+    if value is None or value == '':
+        return None
+    return float(value)
+
+
+def transfer_syntax_uid(value):
+    """ The UID of transfer syntax value, one of TRANSFER_SYNTAXES, or the
+    default one if value is None or empty.
+    """
+    if value is None or value == '':
+        return TRANSFER_SYNTAXES[0]
+    value = pydicom.uid.UID(str(value).strip())
+    if value not in TRANSFER_SYNTAXES:
+        raise ValueError("Unsupported transfer syntax {}, use one of {}".format(
+            value, ', '.join(TRANSFER_SYNTAXES)))
+    return value
+
+
+def scaled_size(size, max_dimension=None, max_megapixels=None):
+    """ size, (width, height), scaled down to fit max_dimension and
+    max_megapixels, or None if it already fits.
+    """
+    width, height = size
+    scale = 1.0
+    if max_dimension:
+        scale = min(scale, max_dimension / max(width, height))
+    if max_megapixels:
+        scale = min(scale, (max_megapixels * 1e6 / (width * height)) ** 0.5)
+    if scale >= 1.0:
+        return None
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def attributes_dataset(attributes):
+    """ A Dataset of attributes, a dict of DICOM keyword to value, as read
+    from JSON: a list of dicts is a sequence of items.
+    """
+    ds = Dataset()
+    for keyword, value in attributes.items():
+        if pydicom.datadict.tag_for_keyword(keyword) is None:
+            raise ValueError("Unknown DICOM keyword {}".format(keyword))
+        if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+            value = Sequence([attributes_dataset(item) for item in value])
+        setattr(ds, keyword, value)
+    return ds
+
 
 class DicomBase(object):
     """ Functions and fields common to most DICOM images.
+
+    arguments:
+
+    input_image_filename: name of input image file, or of a member of a ZIP
+    or TAR archive like export.zip!/patient1/IV25.jpg
+
+    input_image: the input image itself, instead of input_image_filename.
+    Either bytes, a binary file-like object or a PIL Image.
+
+    output_image_filename: name of output file, or a binary stream to write
+    into. May be omitted when the result is only needed in memory, see
+    to_bytes().
+
+    timings: optional timing.Timings, to record how long reading, decoding,
+    packing and writing the image take.
+
+    uids: optional uid.UIDAllocator. Study, Series and SOP Instance UIDs
+    which are not set are allocated from it when the dataset is first
+    needed, see _assign_uids().
+
+    uid_key: what tells this image apart from the others of its series,
+    for deterministic UIDs. Default is input_image_filename.
+
+    max_dimension: optional largest width or height, in pixels. Larger
+    images are scaled down when they are read, see _open_image().
+
+    max_megapixels: optional largest number of pixels, in millions.
+
+    pixel_hash: if true, hash the pixels into pixel_hashes as they are
+    packed, see integrity.pixel_hashes().
+
+    pixel_hash_attribute: with pixel_hash, also store the hashes in private
+    attributes of the file.
+
+    transfer_syntax: UID of the transfer syntax save() and to_bytes() write,
+    one of TRANSFER_SYNTAXES. Default is Implicit VR Little Endian.
     """
 
     def __init__(self, **kwargs):
-        self.sop_instance_uid = defaults.generate_dicom_uid()
+        self.timings = kwargs.get('timings') or NULL_TIMINGS
+        self.uids = kwargs.get('uids') or uid.DEFAULT_ALLOCATOR
+        self.uid_key = kwargs.get('uid_key')
+        self.transfer_syntax = transfer_syntax_uid(kwargs.get('transfer_syntax'))
+        self._sop_instance_uid = None
+        # Sequences given to set_attributes(), by keyword.
+        self._sequence_attributes = {}
+        self.max_dimension = _optional_number(kwargs.get('max_dimension'))
+        self.max_megapixels = _optional_number(kwargs.get('max_megapixels'))
+        self.pixel_hash = _is_true(kwargs.get('pixel_hash'))
+        self.pixel_hash_attribute = _is_true(kwargs.get('pixel_hash_attribute'))
+        self.pixel_hashes = None
         self.time_string = datetime.datetime.now().strftime(defaults.TIME_FORMAT)
         self.date_string = datetime.datetime.now().strftime(defaults.DATE_FORMAT)
-        self.input_image_filename = kwargs['input_image_filename']
-        self.output_image_filename = kwargs['output_image_filename']
+        self.input_image_filename = kwargs.get('input_image_filename')
+        self.input_image = kwargs.get('input_image')
+        self.output_image_filename = kwargs.get('output_image_filename')
         self.file_meta = Dataset()
         self._ds = None
         self._set_dataset()
@@ -34,12 +154,14 @@ class DicomBase(object):
         self._set_sop_common()
 
     def set_file_meta(self):
-        self.file_meta.MediaStorageSOPInstanceUID = self.sop_instance_uid
         self.file_meta.ImplementationClassUID = defaults.IMPLEMENTATION_CLASS_UID
 
     def _set_dataset(self):
+        filename = self.output_image_filename
+        if not isinstance(filename, str):
+            filename = None
         self._ds = FileDataset(
-            self.output_image_filename,
+            filename,
             {},
             file_meta=self.file_meta,
             preamble=defaults.DICOM_PREAMBLE)
@@ -48,13 +170,11 @@ class DicomBase(object):
 
     def _set_general_study(self):
         self._ds.AccessionNumber = ''
-        self._ds.StudyInstanceUID = defaults.generate_dicom_uid()
         self._ds.StudyID = defaults.IDS_NUMBERS
         self._ds.StudyDate = self.date_string
         self._ds.StudyTime = self.time_string
 
     def _set_general_series(self):
-        self._ds.SeriesInstanceUID = defaults.generate_dicom_uid()
         self._ds.SeriesNumber = defaults.IDS_NUMBERS
 
     def _set_general_image(self):
@@ -65,10 +185,65 @@ class DicomBase(object):
         self._ds.AcquisitionContextSequence = Sequence([])
 
     def _set_sop_common(self):
-        self._ds.SOPInstanceUID = self.sop_instance_uid
+        # The SOP Instance UID is allocated later, see _assign_uids().
+        pass
+
+    def _assign_uids(self):
+        """ Allocate the Study, Series and SOP Instance UIDs which were not
+        set. They are allocated this late so that UIDs which are set anyway
+        are never generated, and so that deterministic UIDs are derived from
+        the final attributes.
+        """
+        if self._sop_instance_uid is None:
+            name = self.uid_key
+            if name is None and isinstance(self.input_image_filename, str):
+                name = self.input_image_filename
+            self.sop_instance_uid = self.uids.instance_uid(self.series_instance_uid, name)
+
+    def set_attributes(self, attributes):
+        """ Set any DICOM attributes, given as a dict of keyword to value,
+        see attributes_dataset(). They replace what was set before.
+        """
+        for elem in attributes_dataset(attributes):
+            if elem.keyword == 'SOPInstanceUID':
+                self.sop_instance_uid = elem.value
+            else:
+                self._ds.add(elem)
+                if elem.VR == 'SQ':
+                    self._sequence_attributes[elem.keyword] = attributes[elem.keyword]
+                else:
+                    self._sequence_attributes.pop(elem.keyword, None)
+
+    @property
+    def _attributes_key(self):
+        """ The sequences given to set_attributes(), as part of
+        template_key: templates keep the sequences as they were.
+        """
+        if not self._sequence_attributes:
+            return None
+        return json.dumps(self._sequence_attributes, sort_keys=True, default=str)
+
+    @property
+    def dataset(self):
+        self._assign_uids()
+        return self._ds
+
+    @property
+    def sop_instance_uid(self):
+        self._assign_uids()
+        return self._sop_instance_uid
+
+    @sop_instance_uid.setter
+    def sop_instance_uid(self, sop_instance_uid):
+        self._sop_instance_uid = sop_instance_uid
+        self.file_meta.MediaStorageSOPInstanceUID = sop_instance_uid
+        self._ds.SOPInstanceUID = sop_instance_uid
 
     @property
     def study_instance_uid(self):
+        if 'StudyInstanceUID' not in self._ds:
+            self._ds.StudyInstanceUID = self.uids.study_uid(
+                self._ds.get('PatientID'), self._ds.get('StudyDescription'))
         return self._ds.StudyInstanceUID
 
     @study_instance_uid.setter
@@ -77,6 +252,9 @@ class DicomBase(object):
 
     @property
     def series_instance_uid(self):
+        if 'SeriesInstanceUID' not in self._ds:
+            self._ds.SeriesInstanceUID = self.uids.series_uid(
+                self.study_instance_uid, self._ds.get('SeriesDescription'))
         return self._ds.SeriesInstanceUID
 
     @series_instance_uid.setter
@@ -203,20 +381,72 @@ class DicomBase(object):
         self._ds.ContentTime = time_captured.strftime(
             defaults.TIME_FORMAT)  # long format with micro seconds
 
-    def save_implicit_little_endian(self, filename=None):
+    def _set_transfer_syntax(self, transfer_syntax):
+        self._ds.file_meta.TransferSyntaxUID = transfer_syntax
+        self._ds.is_little_endian = transfer_syntax != pydicom.uid.ExplicitVRBigEndian
+        self._ds.is_implicit_VR = transfer_syntax == pydicom.uid.ImplicitVRLittleEndian
+
+    @property
+    def _big_endian(self):
+        return self.transfer_syntax == pydicom.uid.ExplicitVRBigEndian
+
+    @property
+    def template_key(self):
+        """ What determines the sequences of this image, for
+        fastwriter.TemplateWriter. None means unknown.
+        """
+        return None
+
+    def _save(self, filename, writer):
+        self._assign_uids()
+        with self.timings.stage('write'):
+            if writer is None:
+                self._ds.save_as(filename, write_like_original=False)
+            else:
+                writer.save(self._ds, filename, key=self.template_key,
+                            transfer_syntax=self._ds.file_meta.TransferSyntaxUID)
+
+    def save(self, filename=None, writer=None):
+        """ Write in transfer_syntax.
+
+        filename may also be any writable binary stream.
+
+        writer: optional fastwriter.TemplateWriter to encode the file with.
+        """
         if filename is None:
             filename = self.output_image_filename
 
-        # Set the transfer syntax
-        self._ds.file_meta.TransferSyntaxUID = pydicom.uid.ImplicitVRLittleEndian
-        self._ds.is_little_endian = True
-        self._ds.is_implicit_VR = True
+        self._set_transfer_syntax(self.transfer_syntax)
 
         logging.debug(
-            "Writing test file as Little Endian Implicit VR [{}]", filename)
-        self._ds.save_as(filename, write_like_original=False)
+            "Writing file as {} [{}]".format(self.transfer_syntax.name, filename))
+        self._save(filename, writer)
         logging.info("File [{}] saved.".format(filename))
 
+    def save_implicit_little_endian(self, filename=None, writer=None):
+        """ Write as Implicit VR Little Endian. Same as save(), for images
+        whose transfer_syntax is the default.
+        """
+        if self.transfer_syntax != pydicom.uid.ImplicitVRLittleEndian:
+            raise ValueError("Image to be written as {}".format(self.transfer_syntax.name))
+        self.save(filename, writer)
+
+    def _to_buffer(self, writer):
+        self._set_transfer_syntax(self.transfer_syntax)
+        buffer = io.BytesIO()
+        self._save(buffer, writer)
+        return buffer
+
+    def to_bytes(self, writer=None):
+        """ The DICOM file, in transfer_syntax, as bytes.
+        """
+        return self._to_buffer(writer).getvalue()
+
+    def to_memoryview(self, writer=None):
+        """ Same as to_bytes(), without copying the encoded file.
+        """
+        return self._to_buffer(writer).getbuffer()
+
     def save_explicit_big_endian(self, filename=None):
         if filename is None:
             filename = self.output_image_filename
@@ -228,23 +458,166 @@ class DicomBase(object):
 
         logging.debug(
             "Writing test file as Big Endian Explicit VR [{}]", filename)
+        self._assign_uids()
         self._ds.save_as(filename, write_like_original=False)
         logging.info("File [{}] saved.", filename)
 
+    def _set_pixel_data(self, pixel_data):
+        """ Set Pixel Data to the packed pixels pixel_data, and hash them if
+        asked to, see integrity.
+        """
+        # PixelData has to always be divisible by 2. Add an extra byte if it's not.
+        padding = b'\0' if len(pixel_data) % 2 == 1 else b''
+        if self.pixel_hash:
+            self.pixel_hashes = integrity.pixel_hashes(pixel_data, padding)
+            if self.pixel_hash_attribute:
+                integrity.set_hash_attributes(self._ds, self.pixel_hashes)
+        self._ds.PixelData = pixel_data + padding if padding else pixel_data
+
+    def _derived(self, description):
+        """ Mark the image as DERIVED, and add description to the
+        Derivation Description.
+        """
+        self._ds.ImageType[0] = 'DERIVED'
+        if self._ds.get('DerivationDescription'):
+            description = '{}; {}'.format(self._ds.DerivationDescription, description)
+        self._ds.DerivationDescription = description
+
+    def _downscale(self, im, original_size):
+        """ im scaled down to max_dimension and max_megapixels. im may
+        already be partly reduced, from original_size.
+        """
+        size = scaled_size(original_size, self.max_dimension, self.max_megapixels)
+        if size is None:
+            return im
+        if im.size != size:
+            im = im.resize(size, DOWNSCALE_FILTER, reducing_gap=DOWNSCALE_REDUCING_GAP)
+        self._derived('Downscaled from {}x{}'.format(*original_size))
+        return im
+
+    @contextlib.contextmanager
+    def _open_image(self, source):
+        """ Open source as a PIL Image, to be used as a context manager.
+
+        source may be a file name, a member of an archive
+        (export.zip!/patient1/IV25.jpg), bytes, a binary file-like object or
+        an already opened PIL Image, which is left open for the caller.
+
+        The image is decoded before it is returned, and scaled down if it is
+        larger than max_dimension or max_megapixels. JPEG images are then
+        decoded at a reduced scale already, which is much faster.
+        """
+        if isinstance(source, PIL.Image.Image):
+            with self.timings.stage('decode'):
+                im = self._downscale(source, source.size)
+            yield im
+            return
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        with contextlib.ExitStack() as stack:
+            with self.timings.stage('open'):
+                if archive.is_member_path(source):
+                    source = stack.enter_context(archive.open_member(source))
+                im = stack.enter_context(PIL.Image.open(source))
+                original_size = im.size
+                size = scaled_size(original_size, self.max_dimension, self.max_megapixels)
+                if size is not None:
+                    # Only JPEG decoders do anything here: they decode at
+                    # 1/2, 1/4 or 1/8 scale, still at least size.
+                    im.draft(im.mode, size)
+            with self.timings.stage('decode'):
+                im.load()
+                im = self._downscale(im, original_size)
+            yield im
+
     def load(self, filename):
         self._ds = pydicom.dcmread(filename)
+        self._sop_instance_uid = self._ds.get('SOPInstanceUID')
 
     def print(self):
-        print(self._ds)
+        print(self.dataset)
+
+
+# EXIF Orientation tag, and the transpose which shows an image upright for
+# each of its values.
+EXIF_ORIENTATION_TAG = 0x0112
+EXIF_ORIENTATION_TRANSPOSE = {
+    2: PIL.Image.Transpose.FLIP_LEFT_RIGHT,
+    3: PIL.Image.Transpose.ROTATE_180,
+    4: PIL.Image.Transpose.FLIP_TOP_BOTTOM,
+    5: PIL.Image.Transpose.TRANSPOSE,
+    6: PIL.Image.Transpose.ROTATE_270,
+    7: PIL.Image.Transpose.TRANSVERSE,
+    8: PIL.Image.Transpose.ROTATE_90,
+}
+
+# What each transpose does to the pixel coordinates (x to the right, y
+# down), as a matrix ((a, b), (c, d)): (x, y) goes to (ax + by, cx + dy).
+_TRANSPOSE_MATRICES = {
+    None: ((1, 0), (0, 1)),
+    PIL.Image.Transpose.FLIP_LEFT_RIGHT: ((-1, 0), (0, 1)),
+    PIL.Image.Transpose.FLIP_TOP_BOTTOM: ((1, 0), (0, -1)),
+    PIL.Image.Transpose.ROTATE_90: ((0, 1), (-1, 0)),
+    PIL.Image.Transpose.ROTATE_180: ((-1, 0), (0, -1)),
+    PIL.Image.Transpose.ROTATE_270: ((0, -1), (1, 0)),
+    PIL.Image.Transpose.TRANSPOSE: ((0, 1), (1, 0)),
+    PIL.Image.Transpose.TRANSVERSE: ((0, -1), (-1, 0)),
+}
+_MATRIX_TRANSPOSES = {m: t for t, m in _TRANSPOSE_MATRICES.items()}
+
+
+def combine_transposes(*transposes):
+    """ The single transpose which does all of transposes, one after the
+    other. None stands for no change, and is returned when they cancel out.
+    """
+    (a, b), (c, d) = _TRANSPOSE_MATRICES[None]
+    for transpose in transposes:
+        (e, f), (g, h) = _TRANSPOSE_MATRICES[transpose]
+        (a, b), (c, d) = (e * a + f * c, e * b + f * d), (g * a + h * c, g * b + h * d)
+    return _MATRIX_TRANSPOSES[((a, b), (c, d))]
+
+
+def parse_transpose(value):
+    """ A PIL.Image.Transpose from value: a Transpose, or its name like
+    'FLIP_LEFT_RIGHT' or 'flip-left-right'. None, False, '' and 'no' mean
+    no transpose. Raises ValueError for anything else.
+    """
+    if value is None or value is False or (
+            isinstance(value, str) and value.strip().lower() in ('', '0', 'false', 'no', 'n')):
+        return None
+    if isinstance(value, PIL.Image.Transpose):
+        return value
+    try:
+        return PIL.Image.Transpose[str(value).upper().replace('-', '_')]
+    except KeyError:
+        raise ValueError('{} is not a flip, rotation or transpose'.format(value)) from None
+
+
+def _is_true(value):
+    """ For options which may come from a CSV file as strings.
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
 
 
 class PhotographBase(DicomBase):
     """
     A.32.4 VL Photographic Image IOD
+
+    arguments, besides those of DicomBase:
+
+    mirror_correction: optional PIL.Image.Transpose, or its name, which
+    undoes the mirror of a photograph taken through one. See set_image().
+
+    exif_orientation: if true, turn the image upright according to its EXIF
+    Orientation tag. See set_image().
     """
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.mirror_correction = kwargs.get('mirror_correction')
+        self.exif_orientation = kwargs.get('exif_orientation')
         self.set_file_meta()
         self.file_meta.MediaStorageSOPClassUID = VLPhotographicImageStorage
         self._set_sop_common()
@@ -333,11 +706,58 @@ class PhotographBase(DicomBase):
         elif lossy == False:
             self._ds.LossyImageCompression('00')
 
-    def set_image(self, filename=None):
-        if filename is not None and not hasattr(self._ds, 'input_image_filename'):
-            self._ds.input_image_filename = filename
+    def _mirror_transpose(self, mirror_correction):
+        """ The PIL.Image.Transpose for mirror_correction. Subclasses which
+        know the view may turn True into the right one.
+        """
+        return parse_transpose(mirror_correction)
+
+    def _mirror_corrected(self):
+        """ Called when set_image() has undone the mirror.
+        """
 
-        with PIL.Image.open(self.input_image_filename) as im:
+    def _image_transpose(self, im, mirror_correction, exif_orientation):
+        """ The one transpose doing the EXIF orientation and then the mirror
+        correction of im, or None.
+        """
+        transposes = []
+        if _is_true(exif_orientation):
+            transposes.append(EXIF_ORIENTATION_TRANSPOSE.get(
+                im.getexif().get(EXIF_ORIENTATION_TAG)))
+        mirror = self._mirror_transpose(mirror_correction)
+        if mirror is not None:
+            transposes.append(mirror)
+            self._mirror_corrected()
+        return combine_transposes(*transposes)
+
+    def set_image(self, filename=None, image=None, mirror_correction=None,
+                  exif_orientation=None):
+        """ Read the image and set it as Pixel Data.
+
+        image may be bytes, a binary file-like object or a PIL Image. If
+        neither filename nor image is given, input_image or
+        input_image_filename passed to the constructor is used.
+
+        mirror_correction, exif_orientation: see PhotographBase. Default to
+        those passed to the constructor. The EXIF orientation and the mirror
+        correction are combined into a single transpose of the pixels, done
+        before they are packed. The image is then marked as DERIVED.
+        """
+        if image is None and filename is None:
+            image = self.input_image
+            filename = self.input_image_filename
+        source = image if image is not None else filename
+        if mirror_correction is None:
+            mirror_correction = self.mirror_correction
+        if exif_orientation is None:
+            exif_orientation = self.exif_orientation
+
+        with self._open_image(source) as im:
+            transpose = self._image_transpose(im, mirror_correction, exif_orientation)
+            if transpose is not None:
+                with self.timings.stage('pack'):
+                    im = im.transpose(transpose)
+                self._derived('Transposed: {}'.format(transpose.name))
 
             # Note
 
@@ -433,7 +853,6 @@ class PhotographBase(DicomBase):
                     "ERROR: mode [{}] is not yet implemented.".format(im.mode))
                 raise NotImplementedError
 
-            px = im.load()
             self._ds.PixelRepresentation = 0x0
             # Image Pixel M
             # Pixel Data (7FE0,0010) for this image. The order of pixels encoded for each image plane is left to right, top to bottom, i.e., the upper left pixel (labeled 1,1) is encoded first followed by the remainder of row 1, followed by the first pixel of row 2 (labeled 2,1) then the remainder of row 2 and so on.
@@ -445,21 +864,141 @@ class PhotographBase(DicomBase):
 
             # 0
             # The sample values for the first pixel are followed by the sample values for the second pixel, etc. For RGB images, this means the order of the pixel values encoded shall be R1, G1, B1, R2, G2, B2, …, etc.
-            self._ds.PixelData = b''
-            if self._ds.SamplesPerPixel == 1:
-                for row in range(self._ds.Rows):
-                    for column in range(self._ds.Columns):
-                        self._ds.PixelData += bytes([px[column, row]])
-            elif self._ds.SamplesPerPixel > 1:
-                for row in range(self._ds.Rows):
-                    for column in range(self._ds.Columns):
-                        for sample in range(self._ds.SamplesPerPixel):
-                            self._ds.PixelData += bytes(
-                                [px[column, row][sample]])
+            #
+            # This is exactly PIL's own raw layout for L and RGB images, so
+            # the whole buffer is packed at once. 1-bit images are stored
+            # with one pixel per byte.
+            with self.timings.stage('pack'):
+                if im.mode == '1':
+                    pixel_data = im.convert('L').tobytes()
+                else:
+                    pixel_data = im.tobytes()
+                self._set_pixel_data(pixel_data)
+
+
+# Part of the pixels left out at each end of the histogram when choosing
+# the VOI window of a radiograph.
+WINDOW_TAIL = 0.005
+
+
+def window_from_histogram(histogram, low, high, tail=WINDOW_TAIL):
+    """ VOI window center and width which leave out the darkest and
+    brightest tail of the pixels.
+
+    histogram: pixel counts in equally wide bins from low to high.
+    """
+    if high <= low:
+        return low, 1
+    total = sum(histogram)
+    skip = total * tail
+    count = 0
+    first = 0
+    for first, n in enumerate(histogram):
+        count += n
+        if count > skip:
+            break
+    count = 0
+    last = len(histogram) - 1
+    for last in range(len(histogram) - 1, -1, -1):
+        count += histogram[last]
+        if count > skip:
+            break
+    step = (high - low) / len(histogram)
+    window_low = low + first * step
+    window_high = low + (last + 1) * step
+    return round((window_low + window_high) / 2), max(1, round(window_high - window_low))
+
+
+class RadiographBase(DicomBase):
+    """
+    A.26.1 Digital X-Ray Image IOD, For Presentation
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.set_file_meta()
+        self.file_meta.MediaStorageSOPClassUID = DigitalXRayImageStorageForPresentation
+        self._set_sop_common()
+        self._set_general_series()
+        self._set_dx_image()
+
+    def _set_sop_common(self):
+        super()._set_sop_common()
+        self._ds.SOPClassUID = DigitalXRayImageStorageForPresentation
+
+    def _set_general_series(self):
+        super()._set_general_series()
+        # C.8.11.1 DX Series Module
+        self._ds.Modality = 'DX'
+        self._ds.PresentationIntentType = 'FOR PRESENTATION'
+
+    def _set_dx_image(self):
+        """ C.8.11.3 DX Image Module, for the values which do not depend on
+        the pixels.
+        """
+        self._ds.ImageType = ['ORIGINAL', 'PRIMARY']
+        self._ds.PixelIntensityRelationship = 'LIN'
+        self._ds.PixelIntensityRelationshipSign = 1
+        self._ds.RescaleIntercept = 0
+        self._ds.RescaleSlope = 1
+        self._ds.RescaleType = 'US'
+        self._ds.PresentationLUTShape = 'IDENTITY'
+        self._ds.LossyImageCompression = '00'
+        self._ds.BurnedInAnnotation = 'NO'
+
+    def set_image(self, filename=None, image=None):
+        """ Read the image and set it as Pixel Data, in grayscale.
+
+        16 bit images (PIL modes I;16, I;16B and I) are stored in 16 bits,
+        with Bits Stored as small as the brightest pixel allows. Anything
+        else is converted to 8 bit grayscale.
+
+        The VOI window is set from the histogram of the image.
+
+        image may be bytes, a binary file-like object or a PIL Image. If
+        neither filename nor image is given, input_image or
+        input_image_filename passed to the constructor is used.
+        """
+        if image is None and filename is None:
+            image = self.input_image
+            filename = self.input_image_filename
+        source = image if image is not None else filename
+
+        with self._open_image(source) as im, self.timings.stage('pack'):
+            if im.mode in ('I;16B', 'I'):
+                # Values outside of 0..65535 are clipped.
+                im = im.convert('I').convert('I;16')
+            elif im.mode not in ('I;16', 'I;16L', 'L'):
+                im = im.convert('L')
+
+            low, high = im.getextrema()
+            if im.mode == 'L':
+                bits_allocated = 8
+                bits_stored = 8
+                # One bin per value.
+                histogram = im.histogram()[low:high + 1]
+                center, width = window_from_histogram(histogram, low, high + 1)
             else:
-                print("Error: Incorrect value for SamplesPerPixel {}".format(
-                    self._ds.SamplesPerPixel))
+                bits_allocated = 16
+                bits_stored = max(8, high.bit_length())
+                histogram = im.convert('I').histogram(extrema=(low, high))
+                center, width = window_from_histogram(histogram, low, high)
 
-            # PixelData has to always be divisible by 2. Add an extra byte if it's not.
-            if len(self._ds.PixelData) % 2 == 1:
-                self._ds.PixelData += b'0'
+            self._ds.Rows = im.size[1]
+            self._ds.Columns = im.size[0]
+            self._ds.SamplesPerPixel = 1
+            self._ds.PhotometricInterpretation = 'MONOCHROME2'
+            self._ds.BitsAllocated = bits_allocated
+            self._ds.BitsStored = bits_stored
+            self._ds.HighBit = bits_stored - 1
+            self._ds.PixelRepresentation = 0x0
+            # C.11.2 VOI LUT Module
+            self._ds.WindowCenter = center
+            self._ds.WindowWidth = width
+
+            # I;16 is little endian 16 bit, as Pixel Data is written
+            # unless the transfer syntax is big endian.
+            if self._big_endian and bits_allocated == 16:
+                self._set_pixel_data(im.tobytes('raw', 'I;16B'))
+            else:
+                self._set_pixel_data(im.tobytes())
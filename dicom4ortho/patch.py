@@ -0,0 +1,127 @@
+"""
+Patching the attributes of existing DICOM files.
+
+Correcting a Patient ID or a Study Description of converted files does not
+need the source images: only the header of each file is rewritten, and the
+Pixel Data copied as it is, see dicomfile.rewrite(). Files are replaced
+atomically, and patched in worker processes.
+
+Files are selected by a query on their attributes, by a manifest listing
+them with their own new values, or both.
+"""
+import collections
+import fnmatch
+import os
+
+import dicom4ortho.dicomfile as dicomfile
+import dicom4ortho.manifest as manifest
+from dicom4ortho.model import attributes_dataset
+from dicom4ortho.workers import run_each
+
+# The column of patch manifests naming the file to patch.
+FILENAME_COLUMN = 'filename'
+
+# Outcome of patching a file. patched is False if the file did not match
+# the query. error is None if nothing failed.
+Patched = collections.namedtuple('Patched', ['filename', 'patched', 'error'])
+
+
+def parse_assignment(text):
+    ''' Split a KEYWORD=VALUE string, as given on the command line.
+    '''
+    keyword, sep, value = text.partition('=')
+    if not sep or not keyword.strip():
+        raise ValueError("Invalid attribute [{}], expected <keyword>=<value>".format(text))
+    return keyword.strip(), value
+
+
+def matches(ds, where):
+    ''' Whether dataset ds matches where, a dict of DICOM keyword to
+    pattern, with * and ? wildcards. All must match. A missing attribute
+    matches an empty pattern only.
+    '''
+    for keyword, pattern in where.items():
+        value = ds.get(keyword)
+        value = '' if value is None else str(value)
+        if not fnmatch.fnmatchcase(value, str(pattern)):
+            return False
+    return True
+
+
+def _apply(ds, changes):
+    ds.update(changes)
+    if 'SOPInstanceUID' in changes:
+        ds.file_meta.MediaStorageSOPInstanceUID = changes.SOPInstanceUID
+    if 'SOPClassUID' in changes:
+        ds.file_meta.MediaStorageSOPClassUID = changes.SOPClassUID
+
+
+def patch_file(filename, attributes, where=None, output_filename=None):
+    ''' Set attributes, a dict of DICOM keyword to value as read from JSON,
+    in DICOM file filename, if it matches where (see matches()). Writes
+    output_filename if given, else replaces filename. Returns whether the
+    file was patched.
+    '''
+    changes = attributes_dataset(attributes)
+    if where:
+        with open(filename, 'rb') as fp:
+            if not matches(dicomfile.read_header(fp)[0], where):
+                return False
+    dicomfile.rewrite(filename, output_filename or filename,
+                      lambda ds: _apply(ds, changes))
+    return True
+
+
+def read_manifest(manifest_input):
+    ''' Yield (filename, attributes) for each row of manifest_input, a CSV
+    or JSON Lines file with a filename column, relative to the manifest,
+    and a column per attribute to set. Empty cells leave the attribute as
+    it is. JSON Lines rows may give the attributes in a dicom object too,
+    where null empties the attribute.
+    '''
+    base = os.path.dirname(manifest_input)
+    for row in manifest.read_rows(manifest_input):
+        filename = row.pop(FILENAME_COLUMN, None)
+        if not filename:
+            raise ValueError("Row without {} in {}".format(FILENAME_COLUMN, manifest_input))
+        attributes = {keyword: value for keyword, value in row.items()
+                      if keyword not in (None, manifest.DICOM_ATTRIBUTES_KEY)
+                      and value not in (None, '')}
+        attributes.update(row.get(manifest.DICOM_ATTRIBUTES_KEY) or {})
+        yield os.path.join(base, filename), attributes
+
+
+def patch(paths=(), attributes=None, where=None, manifest_input=None, workers=None):
+    ''' Patch the DICOM files of paths, and those found under the
+    directories of paths, in place.
+
+    attributes: dict of DICOM keyword to value, to set in all files.
+
+    where: only patch the files matching this query, see matches().
+
+    manifest_input: also patch the files listed in this manifest, with the
+    attributes of their row over attributes, see read_manifest(). A file
+    listed more than once is patched once, with all its attributes.
+
+    workers: with more than one, patch in that many worker processes.
+
+    Returns a list of Patched.
+    '''
+    attributes = attributes or {}
+    # One task per file, however many times it is listed: two tasks would
+    # rewrite the same file at the same time, and only one would be kept.
+    tasks = {}
+    for filename in dicomfile.dicom_files(paths):
+        tasks.setdefault(os.path.realpath(filename), (filename, dict(attributes)))
+    if manifest_input is not None:
+        for filename, row_attributes in read_manifest(manifest_input):
+            task = tasks.setdefault(os.path.realpath(filename), (filename, dict(attributes)))
+            task[1].update(row_attributes)
+    tasks = list(tasks.values())
+    # Invalid keywords fail here, not once per file.
+    for _, task_attributes in tasks:
+        attributes_dataset(task_attributes)
+    return [Patched(filename, bool(patched), error)
+            for (filename, _, _), patched, error in run_each(
+                patch_file, [(filename, task_attributes, where)
+                             for filename, task_attributes in tasks], workers)]
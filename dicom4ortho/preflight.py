@@ -0,0 +1,110 @@
+"""
+Preflight checks for bulk conversions.
+
+Reads only the headers of the input images, to know their size, mode and
+bit depth before anything is decoded, and estimates how much memory
+converting each of them takes.
+"""
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import PIL.Image
+
+import dicom4ortho.archive as archive
+
+# Bytes per pixel of the decoded image, for each PIL mode.
+BYTES_PER_PIXEL = {
+    '1': 1, 'L': 1, 'P': 1, 'LA': 2, 'PA': 2,
+    'RGB': 3, 'YCbCr': 3, 'LAB': 3, 'HSV': 3,
+    'RGBA': 4, 'RGBX': 4, 'CMYK': 4,
+    'I': 4, 'F': 4,
+    'I;16': 2, 'I;16L': 2, 'I;16B': 2, 'I;16N': 2,
+}
+
+# Bits per sample, where it is not 8.
+BITS = {'1': 1, 'I': 32, 'F': 32, 'I;16': 16, 'I;16L': 16, 'I;16B': 16, 'I;16N': 16}
+
+# A conversion holds the decoded image, its packed pixels and the encoded
+# DICOM file at the same time: about three times the decoded image.
+MEMORY_FACTOR = 3
+
+# Memory used by a conversion besides the pixels.
+BASE_MEMORY = 4 * 1024 * 1024
+
+# Threads reading image headers at the same time.
+PROBE_THREADS = 8
+
+ImageProbe = collections.namedtuple(
+    'ImageProbe',
+    ['filename', 'width', 'height', 'mode', 'bits', 'file_size', 'memory', 'error'])
+
+
+def estimate_memory(width, height, mode):
+    ''' Bytes needed to convert a width x height image in PIL mode.
+    '''
+    return BASE_MEMORY + MEMORY_FACTOR * width * height * BYTES_PER_PIXEL.get(mode, 4)
+
+
+def file_size(filename):
+    ''' Size in bytes of file or archive member filename.
+    '''
+    if archive.is_member_path(filename):
+        archive_filename, member = archive.split_member_path(filename)
+        return archive.open_archive(archive_filename).size(member)
+    return os.path.getsize(filename)
+
+
+def probe(filename):
+    ''' Read the header of image filename. Never raises: errors are
+    returned in the error field.
+    '''
+    try:
+        size = file_size(filename)
+        if archive.is_member_path(filename):
+            stream = archive.open_member(filename)
+        else:
+            stream = open(filename, 'rb')
+        with stream, PIL.Image.open(stream) as im:
+            width, height = im.size
+            mode = im.mode
+    except Exception as e:  # pylint: disable=broad-except
+        return ImageProbe(filename, 0, 0, None, 0, 0, BASE_MEMORY,
+                          '{}: {}'.format(type(e).__name__, e))
+    return ImageProbe(filename, width, height, mode, BITS.get(mode, 8),
+                      size, estimate_memory(width, height, mode), None)
+
+
+def probe_all(filenames, threads=PROBE_THREADS):
+    ''' probe() each of filenames, in the same order. Headers are read by
+    several threads, as this mostly waits on the disk.
+    '''
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(probe, filenames))
+
+
+def summarize(probes):
+    ''' Totals of a list of ImageProbe, as a dict.
+    '''
+    ok = [p for p in probes if p.error is None]
+    largest = max(ok, key=lambda p: p.memory, default=None)
+    modes = collections.Counter(p.mode for p in ok)
+    return {
+        'images': len(probes),
+        'failed': len(probes) - len(ok),
+        'pixels': sum(p.width * p.height for p in ok),
+        'file_size': sum(p.file_size for p in ok),
+        'memory': sum(p.memory for p in ok),
+        'largest': None if largest is None else largest.filename,
+        'largest_memory': 0 if largest is None else largest.memory,
+        'modes': dict(modes),
+    }
+
+
+def physical_memory():
+    ''' Total physical memory in bytes, or None if unknown.
+    '''
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
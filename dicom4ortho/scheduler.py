@@ -0,0 +1,82 @@
+"""
+Memory-aware scheduling of tasks on a WorkerPool.
+"""
+import bisect
+import collections
+import queue
+import threading
+
+Task = collections.namedtuple('Task', ['cost', 'fn', 'args', 'tag'])
+
+
+class MemoryScheduler(object):
+    """ Runs tasks on a WorkerPool so that the estimated memory of the
+    tasks running at the same time stays under a budget.
+
+    Tasks start largest first. Whenever a worker is free, the largest task
+    that still fits in the budget starts. A task larger than the whole
+    budget runs alone.
+
+    arguments:
+
+    pool: a workers.WorkerPool. At most pool.processes tasks run at once.
+
+    budget: memory budget, in the same unit as the task costs. None means
+    unlimited.
+    """
+
+    def __init__(self, pool, budget=None):
+        self.pool = pool
+        self.budget = budget
+        self.in_use = 0
+        self.peak = 0
+        self._running = 0
+        # Reentrant, as a future which is already done runs its callback
+        # right away, in the thread which holds the lock.
+        self._lock = threading.RLock()
+
+    def _next(self, pending, costs):
+        ''' Index in pending of the task to start now, or None.
+
+        pending is sorted largest first, and costs holds their negated
+        costs, so the first one that fits is the largest that fits.
+        '''
+        if not pending or self._running >= self.pool.processes:
+            return None
+        if self._running == 0 or self.budget is None:
+            return 0
+        i = bisect.bisect_left(costs, self.in_use - self.budget)
+        return i if i < len(pending) else None
+
+    def _start(self, task, done):
+        self.in_use += task.cost
+        self.peak = max(self.peak, self.in_use)
+        self._running += 1
+        future = self.pool.submit(task.fn, *task.args)
+
+        def finished(future):
+            with self._lock:
+                self.in_use -= task.cost
+                self._running -= 1
+            done.put((task, future))
+
+        future.add_done_callback(finished)
+
+    def run(self, tasks):
+        ''' Run tasks, a list of Task, and yield (task, future) as each
+        finishes.
+        '''
+        pending = sorted(tasks, key=lambda t: t.cost, reverse=True)
+        costs = [-t.cost for t in pending]
+        done = queue.Queue()
+        remaining = len(pending)
+        while remaining:
+            with self._lock:
+                i = self._next(pending, costs)
+                while i is not None:
+                    task = pending.pop(i)
+                    del costs[i]
+                    self._start(task, done)
+                    i = self._next(pending, costs)
+            yield done.get()
+            remaining -= 1
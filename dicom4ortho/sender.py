@@ -0,0 +1,246 @@
+"""
+Network sender.
+
+Sends converted objects to a DICOM Storage SCP (i.e. a PACS) with C-STORE,
+fanning out across several concurrent associations.
+"""
+import logging
+import queue
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+
+from pynetdicom import AE
+# pylint: disable=no-name-in-module
+from pynetdicom.sop_class import (
+    DigitalXRayImageStorageForPresentation, VLPhotographicImageStorage)
+
+import dicom4ortho.defaults as defaults
+from dicom4ortho.stats import percentile
+
+# SOP Classes we request a presentation context for when associating.
+STORAGE_SOP_CLASSES = [
+    VLPhotographicImageStorage,
+    DigitalXRayImageStorageForPresentation,
+]
+
+
+class StoreError(Exception):
+    ''' Raised (through the Future returned by send()) when a C-STORE did
+    not succeed.
+    '''
+
+    def __init__(self, sop_instance_uid, status=None, reason=None):
+        super().__init__()
+        self.sop_instance_uid = sop_instance_uid
+        self.status = status
+        self.reason = reason
+
+    def __str__(self):
+        if self.status is not None:
+            return "C-STORE of {} failed with status 0x{:04X}".format(
+                self.sop_instance_uid, self.status)
+        return "C-STORE of {} failed: {}".format(
+            self.sop_instance_uid, self.reason)
+
+
+def is_success_status(status):
+    ''' Success (0x0000) and Warning (0xB000, 0xB006, 0xB007) both mean the
+    SCP has stored the instance.
+    '''
+    return status == 0x0000 or (status & 0xF000) == 0xB000
+
+
+class AssociationStats(object):
+    """ Counters for a single association.
+
+    Latencies are kept in an array of doubles, so long migrations do not
+    accumulate millions of float objects.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.sent = 0
+        self.failed = 0
+        self.associations = 0
+        self.latencies = array('d')
+        self._first = None
+        self._last = None
+
+    def record(self, started, finished, success):
+        if self._first is None:
+            self._first = started
+        self._last = finished
+        self.latencies.append(finished - started)
+        if success:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+    def as_dict(self):
+        elapsed = 0.0
+        if self._first is not None:
+            elapsed = self._last - self._first
+        return {
+            'association': self.name,
+            'sent': self.sent,
+            'failed': self.failed,
+            'associations': self.associations,
+            'throughput': self.sent / elapsed if elapsed > 0 else 0.0,
+            'p50': percentile(self.latencies, 50),
+            'p95': percentile(self.latencies, 95),
+            'p99': percentile(self.latencies, 99),
+        }
+
+
+class _AssociationWorker(threading.Thread):
+    """ Owns one association and sends everything in its queue over it.
+
+    The association is (re-)established lazily, so a dropped connection only
+    costs the instance that was in flight.
+    """
+
+    def __init__(self, sender, index):
+        super().__init__(name="dicom4ortho-sender-{}".format(index), daemon=True)
+        self._sender = sender
+        self.queue = queue.Queue()
+        self.pending = 0
+        self.stats = AssociationStats(index)
+
+    def run(self):
+        assoc = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            dataset, future = item
+            if not future.set_running_or_notify_cancel():
+                self._sender._done(self)
+                continue
+
+            started = time.perf_counter()
+            success = False
+            try:
+                if assoc is None or not assoc.is_established:
+                    assoc = self._sender._associate()
+                    self.stats.associations += 1
+                status = assoc.send_c_store(dataset)
+                if 'Status' not in status:
+                    # Timed out, aborted or invalid response.
+                    assoc.abort()
+                    assoc = None
+                    raise StoreError(dataset.SOPInstanceUID,
+                                     reason='no response from peer')
+                if not is_success_status(status.Status):
+                    raise StoreError(dataset.SOPInstanceUID,
+                                     status=status.Status)
+                success = True
+                future.set_result(status.Status)
+            except Exception as e:  # pylint: disable=broad-except
+                logging.warning("{}: {}".format(self.name, e))
+                future.set_exception(e)
+            finally:
+                self.stats.record(started, time.perf_counter(), success)
+                self._sender._done(self)
+
+        if assoc is not None and assoc.is_established:
+            assoc.release()
+
+
+class MultiAssociationSender(object):
+    """ Sends datasets over several concurrent associations.
+
+    Each new dataset goes to the association with the fewest pending
+    instances. At most max_pending instances are queued or in flight at any
+    time: send() blocks beyond that, which throttles whoever is producing the
+    datasets (the conversion) and keeps memory bounded.
+
+    arguments:
+
+    addr, port: address of the Storage SCP
+
+    called_ae_title: AE Title of the Storage SCP
+
+    calling_ae_title: our own AE Title
+
+    associations: number of concurrent associations
+
+    max_pending: maximum number of instances queued or in flight. Default is
+    twice the number of associations.
+    """
+
+    def __init__(self, addr, port, called_ae_title='ANY-SCP',
+                 calling_ae_title=defaults.AE_TITLE, associations=4,
+                 max_pending=None):
+        if associations < 1:
+            raise ValueError("Need at least one association.")
+        self.addr = addr
+        self.port = port
+        self.called_ae_title = called_ae_title
+        self.calling_ae_title = calling_ae_title
+        if max_pending is None:
+            max_pending = 2 * associations
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [_AssociationWorker(self, i)
+                         for i in range(associations)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _associate(self):
+        ae = AE(ae_title=self.calling_ae_title)
+        for sop_class in STORAGE_SOP_CLASSES:
+            ae.add_requested_context(sop_class)
+        assoc = ae.associate(self.addr, self.port,
+                             ae_title=self.called_ae_title)
+        if not assoc.is_established:
+            raise ConnectionError("Association with {}@{}:{} rejected or aborted".format(
+                self.called_ae_title, self.addr, self.port))
+        return assoc
+
+    def _done(self, worker):
+        with self._lock:
+            worker.pending -= 1
+        self._slots.release()
+
+    def send(self, dataset):
+        ''' Queue dataset for C-STORE and return a Future.
+
+        The Future resolves to the C-STORE status, or raises StoreError.
+        Blocks while max_pending instances are outstanding.
+        '''
+        if self._closed:
+            raise RuntimeError("Sender is closed.")
+        self._slots.acquire()
+        future = Future()
+        with self._lock:
+            worker = min(self._workers, key=lambda w: w.pending)
+            worker.pending += 1
+        worker.queue.put((dataset, future))
+        return future
+
+    def close(self):
+        ''' Wait for all queued instances to be sent and release the
+        associations.
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            worker.queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def stats(self):
+        ''' Per-association throughput (instances/s), latency percentiles (s)
+        and failure counts.
+        '''
+        return [worker.stats.as_dict() for worker in self._workers]
@@ -0,0 +1,204 @@
+"""
+HTTP conversion service.
+
+POST /convert with a multipart/form-data body holding an "image" part (the
+image file) and a "metadata" part (a JSON object with the same keys as a CSV
+row, see controller.SimpleController.convert_image_to_dicom4orthograph())
+returns the DICOM file.
+
+Requests larger than the maximum request size are answered with 413.
+Conversions which fail on their input are answered with 422, and those
+whose worker process died, timed out or ran out of memory with 500.
+
+GET /health returns the state of the worker pool and conversion latencies
+as JSON.
+
+Conversions run in a pool of pre-forked worker processes which keep
+pydicom, PIL and the view types loaded between requests.
+"""
+import collections
+import email.parser
+import json
+import logging
+import queue
+import statistics
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import dicom4ortho.defaults as defaults
+from dicom4ortho.workers import WorkerDied, WorkerPool
+
+# Number of recent requests used to compute the latency statistics.
+LATENCY_WINDOW = 1000
+
+_controller = None
+
+
+def _init_worker():
+    # Import here, so the parent process does not need to load everything.
+    global _controller  # pylint: disable=global-statement
+    import PIL.Image
+    import dicom4ortho.controller as controller
+    # Load all image plugins now, rather than on the first request.
+    PIL.Image.init()
+    _controller = controller.SimpleController(None)
+
+
+def _convert(image, metadata):
+    metadata['input_image'] = image
+    metadata.pop('output_image_filename', None)
+    return _controller.convert_image_to_dicom_bytes(metadata)
+
+
+class BadRequest(Exception):
+    pass
+
+
+def parse_form_data(content_type, body):
+    ''' Split a multipart/form-data body into a dict of name: bytes.
+    '''
+    if not content_type or not content_type.startswith('multipart/form-data'):
+        raise BadRequest("Expected multipart/form-data.")
+    message = email.parser.BytesParser().parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    if not message.is_multipart():
+        raise BadRequest("Cannot parse multipart body.")
+    fields = {}
+    for part in message.get_payload():
+        name = part.get_param('name', header='content-disposition')
+        if name is not None:
+            fields[name] = part.get_payload(decode=True)
+    return fields
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'dicom4ortho/' + defaults.VERSION
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logging.debug("{} - {}".format(self.address_string(), format % args))
+
+    def _reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_json(self, status, obj):
+        self._reply(status, json.dumps(obj).encode('utf-8'), 'application/json')
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path != '/health':
+            self._reply_json(HTTPStatus.NOT_FOUND, {'error': 'Not found'})
+            return
+        self._reply_json(HTTPStatus.OK, self.server.stats())
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        if self.path != '/convert':
+            self._reply_json(HTTPStatus.NOT_FOUND, {'error': 'Not found'})
+            return
+        started = time.perf_counter()
+        try:
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                raise BadRequest("Invalid Content-Length.")
+            if length > self.server.max_request_size:
+                # The body is not read: the connection cannot be reused.
+                self.close_connection = True
+                self._reply_json(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {
+                    'error': 'Request larger than {} bytes.'.format(
+                        self.server.max_request_size)})
+                return
+            fields = parse_form_data(
+                self.headers.get('Content-Type'), self.rfile.read(length))
+            if 'image' not in fields or 'metadata' not in fields:
+                raise BadRequest("Expected 'image' and 'metadata' parts.")
+            try:
+                metadata = json.loads(fields['metadata'])
+            except ValueError as e:
+                raise BadRequest("Invalid metadata: {}".format(e))
+            future = self.server.pool.submit(_convert, fields['image'], metadata)
+        except BadRequest as e:
+            self._reply_json(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+            return
+        except queue.Full:
+            self._reply_json(HTTPStatus.SERVICE_UNAVAILABLE,
+                             {'error': 'Too many requests queued.'})
+            return
+
+        try:
+            dicom_bytes = future.result()
+        except WorkerDied as e:
+            logging.error("Conversion failed: {!r}".format(e))
+            self._reply_json(HTTPStatus.INTERNAL_SERVER_ERROR,
+                             {'error': '{}: {}'.format(type(e).__name__, e)})
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            logging.warning("Conversion failed: {!r}".format(e))
+            self._reply_json(HTTPStatus.UNPROCESSABLE_ENTITY,
+                             {'error': '{}: {}'.format(type(e).__name__, e)})
+            return
+        self.server.record_latency(time.perf_counter() - started)
+        self._reply(HTTPStatus.OK, dicom_bytes, 'application/dicom')
+
+
+class ConversionServer(ThreadingHTTPServer):
+    """ HTTP server handing conversions to a WorkerPool.
+
+    arguments:
+
+    address: (host, port) to listen on
+
+    workers: number of worker processes
+
+    queue_limit: number of requests allowed to wait for a free worker.
+    Further requests are answered with 503.
+
+    max_request_size: largest request body accepted, in bytes. Larger
+    requests are answered with 413.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, workers=None, queue_limit=defaults.SERVE_QUEUE_LIMIT,
+                 max_request_size=defaults.SERVE_MAX_REQUEST_SIZE):
+        self.max_request_size = max_request_size
+        self.pool = WorkerPool(
+            processes=workers, initializer=_init_worker, max_queue=queue_limit)
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        super().__init__(address, ConversionRequestHandler)
+
+    def record_latency(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def stats(self):
+        stats = self.pool.stats()
+        with self._lock:
+            latencies = list(self._latencies)
+        stats['status'] = 'ok'
+        stats['latency_median'] = statistics.median(latencies) if latencies else None
+        stats['latency_max'] = max(latencies) if latencies else None
+        return stats
+
+    def server_close(self):
+        super().server_close()
+        self.pool.close()
+
+
+def serve(address, workers=None, queue_limit=defaults.SERVE_QUEUE_LIMIT,
+          max_request_size=defaults.SERVE_MAX_REQUEST_SIZE):
+    ''' Run the conversion service until interrupted.
+    '''
+    with ConversionServer(address, workers=workers, queue_limit=queue_limit,
+                          max_request_size=max_request_size) as server:
+        logging.info("Listening on http://{}:{}/ with {} workers".format(
+            address[0], server.server_address[1], server.pool.processes))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
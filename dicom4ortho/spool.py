@@ -0,0 +1,209 @@
+"""
+Outbound spool.
+
+Converted instances waiting to be sent are kept on disk, so that nothing
+needs to be converted again when the PACS is unavailable. The spool is a
+directory holding one file per instance, named after its SOP Instance UID,
+plus an SQLite journal keeping track of what still has to be sent.
+"""
+import logging
+import os
+import sqlite3
+import time
+
+import pydicom
+
+import dicom4ortho.defaults as defaults
+
+JOURNAL_FILENAME = 'journal.sqlite'
+
+STATE_PENDING = 'pending'
+STATE_SENT = 'sent'
+# The spooled file disappeared: nothing left to send.
+STATE_LOST = 'lost'
+
+
+class OutboundSpool(object):
+    """ A durable queue of instances to send.
+
+    Instances are deduplicated by SOP Instance UID: enqueuing an instance
+    which is already pending, or which has already been sent, does nothing.
+
+    arguments:
+
+    directory: where to keep the spooled files and the journal. Created if
+    missing.
+
+    base_delay: seconds to wait before retrying an instance which failed for
+    the first time. Doubles at each following failure.
+
+    max_delay: upper limit for the retry delay, in seconds.
+    """
+
+    def __init__(self, directory, base_delay=defaults.SPOOL_BASE_DELAY,
+                 max_delay=defaults.SPOOL_MAX_DELAY):
+        self.directory = directory
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, JOURNAL_FILENAME))
+        with self._db:
+            self._db.execute('''CREATE TABLE IF NOT EXISTS spool (
+                sop_instance_uid TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt REAL NOT NULL,
+                last_error TEXT)''')
+            self._db.execute('''CREATE INDEX IF NOT EXISTS spool_ready
+                ON spool (state, next_attempt)''')
+        self._recover()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def _filename(self, sop_instance_uid):
+        return os.path.join(self.directory, sop_instance_uid + '.dcm')
+
+    def _recover(self):
+        ''' Journal files which were written, but not recorded, before an
+        unclean shutdown.
+        '''
+        now = time.time()
+        with self._db:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.dcm.tmp'):
+                    os.remove(entry.path)
+                elif entry.name.endswith('.dcm'):
+                    self._db.execute(
+                        'INSERT OR IGNORE INTO spool (sop_instance_uid, state, next_attempt) '
+                        'VALUES (?, ?, ?)',
+                        (entry.name[:-len('.dcm')], STATE_PENDING, now))
+
+    def enqueue(self, dataset):
+        ''' Store dataset in the spool.
+
+        Returns False if an instance with the same SOP Instance UID was
+        already spooled.
+        '''
+        sop_instance_uid = dataset.SOPInstanceUID
+        row = self._db.execute(
+            'SELECT state FROM spool WHERE sop_instance_uid = ?',
+            (sop_instance_uid,)).fetchone()
+        if row is not None and row[0] != STATE_LOST:
+            logging.debug("{} already spooled.".format(sop_instance_uid))
+            return False
+
+        filename = self._filename(sop_instance_uid)
+        dataset.save_as(filename + '.tmp', write_like_original=False)
+        os.replace(filename + '.tmp', filename)
+        with self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO spool (sop_instance_uid, state, next_attempt) '
+                'VALUES (?, ?, ?)',
+                (sop_instance_uid, STATE_PENDING, time.time()))
+        return True
+
+    def pending(self):
+        ''' Number of instances not yet sent.
+        '''
+        return self._db.execute(
+            'SELECT COUNT(*) FROM spool WHERE state = ?',
+            (STATE_PENDING,)).fetchone()[0]
+
+    def _ready(self, batch_size):
+        return [r[0] for r in self._db.execute(
+            'SELECT sop_instance_uid FROM spool '
+            'WHERE state = ? AND next_attempt <= ? '
+            'ORDER BY next_attempt LIMIT ?',
+            (STATE_PENDING, time.time(), batch_size))]
+
+    def _next_attempt(self):
+        row = self._db.execute(
+            'SELECT MIN(next_attempt) FROM spool WHERE state = ?',
+            (STATE_PENDING,)).fetchone()
+        return row[0]
+
+    def _sent(self, sop_instance_uid):
+        with self._db:
+            self._db.execute(
+                'UPDATE spool SET state = ?, last_error = NULL WHERE sop_instance_uid = ?',
+                (STATE_SENT, sop_instance_uid))
+        try:
+            os.remove(self._filename(sop_instance_uid))
+        except FileNotFoundError:
+            pass
+
+    def _lost(self, sop_instance_uid):
+        with self._db:
+            self._db.execute(
+                'UPDATE spool SET state = ?, last_error = ? WHERE sop_instance_uid = ?',
+                (STATE_LOST, 'missing file', sop_instance_uid))
+
+    def lost(self):
+        ''' SOP Instance UIDs of the instances whose spooled file went
+        missing before they were sent. They are not retried, but may be
+        enqueued again.
+        '''
+        return [r[0] for r in self._db.execute(
+            'SELECT sop_instance_uid FROM spool WHERE state = ?', (STATE_LOST,))]
+
+    def _failed(self, sop_instance_uid, error):
+        attempts = self._db.execute(
+            'SELECT attempts FROM spool WHERE sop_instance_uid = ?',
+            (sop_instance_uid,)).fetchone()[0] + 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        with self._db:
+            self._db.execute(
+                'UPDATE spool SET attempts = ?, next_attempt = ?, last_error = ? '
+                'WHERE sop_instance_uid = ?',
+                (attempts, time.time() + delay, str(error), sop_instance_uid))
+
+    def drain(self, sender, batch_size=defaults.SPOOL_BATCH_SIZE, wait=False):
+        ''' Send pending instances with sender, batch_size at a time.
+
+        Instances which fail are retried later, with exponential backoff.
+        When wait is False, returns as soon as nothing is ready to be sent;
+        otherwise keeps going until the spool is empty.
+
+        Returns a tuple (sent, failed) with the number of send attempts
+        which succeeded and failed.
+        '''
+        sent = failed = 0
+        while True:
+            batch = self._ready(batch_size)
+            if not batch:
+                next_attempt = self._next_attempt()
+                if not wait or next_attempt is None:
+                    break
+                time.sleep(max(0.0, next_attempt - time.time()))
+                continue
+
+            futures = []
+            for sop_instance_uid in batch:
+                filename = self._filename(sop_instance_uid)
+                try:
+                    dataset = pydicom.dcmread(filename)
+                except FileNotFoundError:
+                    logging.error("Spooled file {} is missing, not retrying.".format(filename))
+                    self._lost(sop_instance_uid)
+                    failed += 1
+                    continue
+                futures.append((sop_instance_uid, sender.send(dataset)))
+
+            for sop_instance_uid, future in futures:
+                error = future.exception()
+                if error is None:
+                    self._sent(sop_instance_uid)
+                    sent += 1
+                else:
+                    self._failed(sop_instance_uid, error)
+                    failed += 1
+            logging.info("Spool batch done: {} sent, {} failed, {} pending.".format(
+                sent, failed, self.pending()))
+        return sent, failed
@@ -0,0 +1,14 @@
+"""
+Statistics shared by the reports of conversions and transfers.
+"""
+import math
+
+
+def percentile(values, p):
+    ''' Nearest-rank percentile of values, p in [0, 100].
+    '''
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[rank - 1]
@@ -0,0 +1,275 @@
+"""
+DICOMweb STOW-RS client.
+
+Uploads instances to a DICOMweb origin server in multipart/related batches.
+Each part is streamed from its file or buffer while the request is sent, so
+a batch is never assembled in memory.
+"""
+import collections
+import http.client
+import io
+import json
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import pydicom
+from pydicom.dataset import Dataset
+
+import dicom4ortho.defaults as defaults
+
+# Size of the blocks read from input files while streaming a request.
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+StowResult = collections.namedtuple(
+    'StowResult', ['sop_instance_uid', 'success', 'reason'])
+
+# DICOM JSON tags of the Store Instances Response Module.
+_FAILED_SOP_SEQUENCE = '00081198'
+_REFERENCED_SOP_SEQUENCE = '00081199'
+_REFERENCED_SOP_INSTANCE_UID = '00081155'
+_FAILURE_REASON = '00081197'
+
+
+class _Part(object):
+    """ One instance of a batch: either a file, or something in memory.
+    """
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.filename = None
+        self.buffer = None
+        if isinstance(instance, (str, os.PathLike)):
+            self.filename = instance
+            self.size = os.path.getsize(instance)
+        elif isinstance(instance, Dataset):
+            fp = io.BytesIO()
+            instance.save_as(fp, write_like_original=False)
+            self.buffer = fp.getbuffer()
+            self.size = len(self.buffer)
+        else:
+            self.buffer = memoryview(instance)
+            self.size = self.buffer.nbytes
+
+    def chunks(self):
+        if self.filename is None:
+            yield self.buffer
+            return
+        with open(self.filename, 'rb') as f:
+            while True:
+                block = f.read(STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                yield block
+
+    @property
+    def sop_instance_uid(self):
+        if isinstance(self.instance, Dataset):
+            return self.instance.SOPInstanceUID
+        source = self.filename
+        if source is None:
+            source = io.BytesIO(self.buffer)
+        return pydicom.dcmread(
+            source, stop_before_pixels=True,
+            specific_tags=['SOPInstanceUID']).SOPInstanceUID
+
+
+def parse_store_response(body):
+    ''' Parse a DICOM JSON Store Instances Response.
+
+    Returns a list of StowResult.
+    '''
+    results = []
+    response = json.loads(body)
+
+    def _items(tag):
+        return response.get(tag, {}).get('Value', [])
+
+    def _value(item, tag):
+        values = item.get(tag, {}).get('Value', [None])
+        return values[0] if values else None
+
+    for item in _items(_REFERENCED_SOP_SEQUENCE):
+        results.append(StowResult(
+            _value(item, _REFERENCED_SOP_INSTANCE_UID), True, None))
+    for item in _items(_FAILED_SOP_SEQUENCE):
+        reason = _value(item, _FAILURE_REASON)
+        results.append(StowResult(
+            _value(item, _REFERENCED_SOP_INSTANCE_UID), False,
+            None if reason is None else "0x{:04X}".format(reason)))
+    return results
+
+
+class StowClient(object):
+    """ Uploads instances with STOW-RS.
+
+    Instances are added one at a time with add(), and sent batch_size at a
+    time over up to parallelism keep-alive connections. add() blocks while
+    twice as many batches as connections are waiting, so that the producer
+    cannot run too far ahead.
+
+    Instances may be file names, bytes-like objects holding a DICOM file, or
+    pydicom Datasets.
+
+    arguments:
+
+    url: the STOW-RS endpoint, for example
+    http://pacs:8080/dicom-web/studies
+
+    batch_size: number of instances per request
+
+    parallelism: number of concurrent requests (and connections)
+
+    timeout: socket timeout, in seconds
+    """
+
+    def __init__(self, url, batch_size=defaults.STOW_BATCH_SIZE,
+                 parallelism=defaults.STOW_PARALLELISM, timeout=60,
+                 headers=None):
+        self.url = urlsplit(url)
+        if self.url.scheme not in ('http', 'https'):
+            raise ValueError("Unsupported URL {}".format(url))
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.results = []
+        self._batch = []
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(2 * parallelism)
+        self._executor = ThreadPoolExecutor(
+            max_workers=parallelism, thread_name_prefix='dicom4ortho-stow')
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self.url.scheme == 'https':
+                conn = http.client.HTTPSConnection(
+                    self.url.hostname, self.url.port, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(
+                    self.url.hostname, self.url.port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _reset_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _request(self, parts):
+        boundary = uuid.uuid4().hex
+        part_header = ('--{}\r\nContent-Type: application/dicom\r\n\r\n'.format(
+            boundary)).encode('ascii')
+        closing = '--{}--\r\n'.format(boundary).encode('ascii')
+        content_length = len(closing) + sum(
+            len(part_header) + part.size + 2 for part in parts)
+
+        def body():
+            for part in parts:
+                yield part_header
+                yield from part.chunks()
+                yield b'\r\n'
+            yield closing
+
+        headers = {
+            'Content-Type': 'multipart/related; type="application/dicom"; boundary={}'.format(boundary),
+            'Content-Length': str(content_length),
+            'Accept': 'application/dicom+json',
+        }
+        headers.update(self.headers)
+        path = self.url.path or '/'
+        if self.url.query:
+            path += '?' + self.url.query
+
+        # A kept-alive connection may have been closed by the server since
+        # the last batch: retry once on a fresh connection.
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request('POST', path, body=body(), headers=headers)
+                response = conn.getresponse()
+                return response.status, response.reason, response.read()
+            except (http.client.RemoteDisconnected, ConnectionError,
+                    http.client.CannotSendRequest, http.client.BadStatusLine):
+                self._reset_connection()
+                if attempt == 2:
+                    raise
+
+    def _send_batch(self, instances):
+        try:
+            parts = [_Part(instance) for instance in instances]
+            status, reason, body = self._request(parts)
+            results = []
+            if body:
+                try:
+                    results = parse_store_response(body)
+                except ValueError:
+                    logging.warning("Cannot parse STOW-RS response: {}".format(body[:200]))
+            if not results and status >= 300:
+                # No per-instance details: the whole batch failed.
+                reason = "HTTP {} {}".format(status, reason)
+                results = [StowResult(part.sop_instance_uid, False, reason)
+                           for part in parts]
+            for result in results:
+                if not result.success:
+                    logging.warning("STOW-RS of {} failed: {}".format(
+                        result.sop_instance_uid, result.reason))
+            with self._lock:
+                self.results.extend(results)
+            return results
+        finally:
+            self._slots.release()
+
+    def add(self, instance):
+        ''' Queue an instance for upload.
+        '''
+        self._batch.append(instance)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        ''' Send the instances added so far, without waiting for the result.
+        '''
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._slots.acquire()
+        self._futures.append(self._executor.submit(self._send_batch, batch))
+
+    def store(self, instances):
+        ''' Upload all instances, wait, and return their StowResult.
+        '''
+        futures_before = len(self._futures)
+        for instance in instances:
+            self.add(instance)
+        self.flush()
+        results = []
+        for future in self._futures[futures_before:]:
+            results.extend(future.result())
+        return results
+
+    def close(self):
+        ''' Send what is left and wait for all requests to finish.
+        '''
+        self.flush()
+        self._executor.shutdown(wait=True)
+        for conn in self._connections:
+            conn.close()
+        for future in self._futures:
+            # Re-raise transport errors, if any.
+            future.result()
@@ -0,0 +1,205 @@
+"""
+Per-stage timing of conversions.
+
+Timing is off unless a RunReport is passed to the controller. The model
+always times its stages through its timings attribute, which is NULL_TIMINGS
+by default: a stage then costs one call returning a shared, empty context
+manager.
+
+Stages:
+
+    open    read the header of the input image
+    decode  decompress the pixels
+    pack    lay the pixels out as Pixel Data
+    header  build the DICOM dataset
+    write   encode and write the DICOM file
+"""
+import contextlib
+import json
+import sys
+import time
+
+from dicom4ortho.stats import percentile
+
+STAGES = ('open', 'decode', 'pack', 'header', 'write')
+
+# Number of slowest files listed in the summary.
+SLOWEST = 10
+
+# Seconds between two updates of the progress line.
+PROGRESS_INTERVAL = 0.5
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class _NullTimings(object):
+    """ Timings which record nothing.
+    """
+    enabled = False
+
+    def stage(self, name):  # pylint: disable=unused-argument
+        return _NULL_CONTEXT
+
+
+NULL_TIMINGS = _NullTimings()
+
+
+class Timings(object):
+    """ Durations of the stages of the conversion of one file, in seconds,
+    its input and output sizes in bytes, and the integrity.PixelHashes of
+    its pixels if they were hashed.
+    """
+    enabled = True
+
+    def __init__(self, input_filename=None):
+        self.input_filename = input_filename
+        self.output_filename = None
+        self.stages = {}
+        self.input_bytes = None
+        self.output_bytes = None
+        self.total = None
+        self.pixel_hashes = None
+        self._start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def stop(self):
+        self.total = time.perf_counter() - self._start
+
+    def as_dict(self):
+        if self.total is None:
+            self.stop()
+        record = {
+            'input': self.input_filename,
+            'output': self.output_filename if isinstance(self.output_filename, str) else None,
+            'input_bytes': self.input_bytes,
+            'output_bytes': self.output_bytes,
+            'total': self.total,
+        }
+        record.update(self.stages)
+        if self.pixel_hashes is not None:
+            record['hash_algorithm'] = self.pixel_hashes.algorithm
+            record['source_hash'] = self.pixel_hashes.source
+            record['pixel_data_hash'] = self.pixel_hashes.pixel_data
+        return record
+
+
+class RunReport(object):
+    """ Collects the Timings of a bulk conversion.
+
+    arguments:
+
+    stream: optional text stream. One JSON object is written per file as it
+    finishes, and close() adds a last line {"summary": {...}}.
+
+    total: number of files expected, for the ETA of the progress line.
+
+    progress: optional text stream, like sys.stderr, to show a progress line
+    on. It is rewritten in place at most every PROGRESS_INTERVAL seconds.
+
+    owns_stream: close stream in close(), rather than only flush it.
+    """
+
+    def __init__(self, stream=None, total=None, progress=None, owns_stream=False):
+        self.stream = stream
+        self.total = total
+        self.progress = progress
+        self.records = []
+        self.failed = 0
+        self._start = time.perf_counter()
+        self._shown = 0.0
+        self._owns_stream = owns_stream
+
+    def add(self, record, error=None):
+        ''' Record a finished conversion. record is a Timings or the dict
+        of one, for conversions timed in another process.
+        '''
+        if isinstance(record, Timings):
+            record = record.as_dict()
+        record['error'] = error
+        if error is not None:
+            self.failed += 1
+        self.records.append(record)
+        if self.stream is not None:
+            self.stream.write(json.dumps(record) + '\n')
+        if self.progress is not None:
+            now = time.perf_counter()
+            if now - self._shown >= PROGRESS_INTERVAL or len(self.records) == self.total:
+                self._shown = now
+                self._show_progress(now - self._start)
+
+    def _show_progress(self, elapsed):
+        done = len(self.records)
+        rate = done / elapsed if elapsed > 0 else 0.0
+        line = '{} files'.format(done) if self.total is None else \
+            '{}/{} files'.format(done, self.total)
+        line += ', {:.1f} files/s'.format(rate)
+        if self.failed:
+            line += ', {} failed'.format(self.failed)
+        if self.total is not None and rate > 0:
+            eta = int((self.total - done) / rate)
+            line += ', ETA {}:{:02d}:{:02d}'.format(eta // 3600, eta // 60 % 60, eta % 60)
+        self.progress.write('\r' + line.ljust(60))
+        self.progress.flush()
+
+    def summary(self):
+        ''' Throughput, total time percentiles, time spent in each stage
+        and the slowest files, as a dict.
+        '''
+        elapsed = time.perf_counter() - self._start
+        done = [r for r in self.records if r['error'] is None]
+        totals = [r['total'] for r in done]
+        input_bytes = sum(r['input_bytes'] or 0 for r in done)
+        output_bytes = sum(r['output_bytes'] or 0 for r in done)
+        slowest = sorted(done, key=lambda r: r['total'], reverse=True)[:SLOWEST]
+        return {
+            'files': len(self.records),
+            'failed': self.failed,
+            'seconds': elapsed,
+            'files_per_second': len(done) / elapsed if elapsed > 0 else 0.0,
+            'input_bytes': input_bytes,
+            'output_bytes': output_bytes,
+            'output_bytes_per_second': output_bytes / elapsed if elapsed > 0 else 0.0,
+            'p50': percentile(totals, 50),
+            'p95': percentile(totals, 95),
+            'p99': percentile(totals, 99),
+            'stages': {stage: sum(r.get(stage, 0.0) for r in done) for stage in STAGES},
+            'slowest': [{'input': r['input'], 'total': r['total']} for r in slowest],
+        }
+
+    def close(self):
+        ''' End the progress line and write the summary. Returns the
+        summary.
+        '''
+        summary = self.summary()
+        if self.progress is not None:
+            if self.records and len(self.records) != self.total:
+                self._show_progress(summary['seconds'])
+            self.progress.write('\n')
+            self.progress.flush()
+        if self.stream is not None:
+            self.stream.write(json.dumps({'summary': summary}) + '\n')
+            if self._owns_stream:
+                self.stream.close()
+            else:
+                self.stream.flush()
+        return summary
+
+
+def open_report(filename=None, progress=False):
+    ''' RunReport writing into filename, '-' for standard output, with the
+    progress line on standard error if progress is set.
+    '''
+    stream = None
+    if filename == '-':
+        stream = sys.stdout
+    elif filename is not None:
+        stream = open(filename, 'w')
+    return RunReport(stream, progress=sys.stderr if progress else None,
+                     owns_stream=stream is not None and stream is not sys.stdout)
@@ -0,0 +1,101 @@
+"""
+Allocation of DICOM UIDs.
+
+UIDs are made from a UUID, as PS3.5 B.2 allows: 2.25 followed by the UUID
+as one decimal integer.
+
+Random UIDs are cut from random bytes read in batches. A process started
+with fork gets its own batches, so that parent and children never hand out
+the same UIDs.
+
+In deterministic mode, Study, Series and SOP Instance UIDs are derived
+from a namespace and stable keys (the patient, the descriptions, the input
+file name) with UUID version 5. Converting the same input again, on any
+machine, gives the same UIDs.
+"""
+import os
+import threading
+import uuid
+
+UID_ROOT = '2.25.'
+
+# Random UIDs generated at once.
+BATCH_SIZE = 256
+
+# Bits of a random 128 bit integer set to make it a version 4 UUID.
+_VERSION_MASK = ~((0xf000 << 64) | (0xc000 << 48))
+_VERSION_BITS = (0x4000 << 64) | (0x8000 << 48)
+
+
+def generate_uids(count):
+    ''' count new random UIDs, as a list.
+    '''
+    data = os.urandom(16 * count)
+    return [UID_ROOT + str(int.from_bytes(data[i:i + 16], 'big') & _VERSION_MASK |
+                           _VERSION_BITS)
+            for i in range(0, 16 * count, 16)]
+
+
+def name_uid(namespace, *key):
+    ''' The UID named by key in namespace, a uuid.UUID.
+    '''
+    return UID_ROOT + str(uuid.uuid5(namespace, '\0'.join(str(k) for k in key)).int)
+
+
+class UIDAllocator(object):
+    """ Hands out UIDs.
+
+    arguments:
+
+    namespace: optional name of a namespace, like the name or domain of the
+    practice. With it, study_uid(), series_uid() and instance_uid() derive
+    the UIDs from their keys. Without it, they are random.
+    """
+
+    def __init__(self, namespace=None):
+        self.namespace = None
+        if namespace is not None:
+            try:
+                self.namespace = uuid.UUID(namespace)
+            except ValueError:
+                self.namespace = uuid.uuid5(uuid.NAMESPACE_DNS, namespace)
+        self._batch = []
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    @property
+    def deterministic(self):
+        return self.namespace is not None
+
+    def new(self):
+        ''' A new random UID.
+        '''
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the batch is the parent's.
+                self._batch = []
+                self._pid = os.getpid()
+            if not self._batch:
+                self._batch = generate_uids(BATCH_SIZE)
+            return self._batch.pop()
+
+    def _derive(self, kind, key):
+        if self.namespace is None or not all(key):
+            return self.new()
+        return name_uid(self.namespace, kind, *key)
+
+    def study_uid(self, patient_id, study_description):
+        return self._derive('study', (patient_id, study_description))
+
+    def series_uid(self, study_uid, series_description):
+        return self._derive('series', (study_uid, series_description))
+
+    def instance_uid(self, series_uid, name):
+        ''' SOP Instance UID of the image name in the series, name being
+        the input file name or anything else which tells the images of the
+        series apart.
+        '''
+        return self._derive('instance', (series_uid, name))
+
+
+DEFAULT_ALLOCATOR = UIDAllocator()
@@ -0,0 +1,288 @@
+"""
+Worker processes.
+
+A pool of pre-forked processes which stay alive between tasks, so that
+pydicom, PIL and the view type tables are only loaded once per process.
+
+Each task may be given a wall-clock timeout and a memory ceiling. A worker
+which exceeds either is killed and replaced, and the task fails, so that a
+single bad input cannot hold a worker or exhaust the memory.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class WorkerDied(Exception):
+    ''' The worker process running a task exited before returning a result.
+    '''
+
+
+class TaskTimeout(WorkerDied):
+    ''' A task ran longer than the task timeout of the pool, and its worker
+    process was killed.
+    '''
+
+
+class MemoryLimitExceeded(WorkerDied):
+    ''' A task needed more memory than the memory limit of the pool, and its
+    worker process was replaced.
+    '''
+
+
+def _limit_memory(limit):
+    ''' Limit the address space of this process to what it maps now, plus
+    limit bytes. Allocating beyond raises MemoryError.
+    '''
+    try:
+        import resource
+        with open('/proc/self/statm') as statm:
+            mapped = int(statm.read().split()[0]) * resource.getpagesize()
+    except (ImportError, OSError):
+        logging.warning("Cannot limit the memory of worker processes on this platform.")
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (mapped + limit, mapped + limit))
+
+
+def _worker_main(conn, initializer, initargs, memory_limit=None):
+    if initializer is not None:
+        initializer(*initargs)
+    if memory_limit is not None:
+        _limit_memory(memory_limit)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        fn, args, kwargs = task
+        try:
+            result = ('ok', fn(*args, **kwargs))
+        except MemoryError:
+            # What failed to allocate may have left the process in a bad
+            # state: have it replaced.
+            conn.send(('memory', None))
+            break
+        except Exception as e:  # pylint: disable=broad-except
+            result = ('error', e)
+        try:
+            conn.send(result)
+        except Exception as e:  # pylint: disable=broad-except
+            # The result or the exception could not be pickled.
+            conn.send(('error', RuntimeError(repr(e))))
+    conn.close()
+
+
+class _Worker(threading.Thread):
+    """ Feeds tasks from the pool queue to one worker process, and replaces
+    the process if it dies.
+    """
+
+    def __init__(self, pool, index):
+        super().__init__(name="dicom4ortho-worker-{}".format(index), daemon=True)
+        self._pool = pool
+        self.busy = False
+        self.process = None
+        self.conn = None
+        self._spawn()
+
+    def _spawn(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_worker_main,
+            args=(child_conn, self._pool.initializer, self._pool.initargs,
+                  self._pool.memory_limit),
+            daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        logging.debug("{} started process {}".format(self.name, self.process.pid))
+
+    def _respawn(self, kill=False):
+        self.conn.close()
+        if kill:
+            self.process.kill()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self._pool._respawned()
+        self._spawn()
+
+    def run(self):
+        while True:
+            item = self._pool._tasks.get()
+            if item is None:
+                break
+            future, task = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.busy = True
+            timeout = self._pool.task_timeout
+            try:
+                try:
+                    self.conn.send(task)
+                except (EOFError, OSError):
+                    raise
+                except Exception as e:  # pylint: disable=broad-except
+                    # The task could not be pickled, and nothing was sent:
+                    # the worker process is still fine.
+                    self._pool._finished(False)
+                    future.set_exception(e)
+                    continue
+                if not self.conn.poll(timeout):
+                    self._respawn(kill=True)
+                    self._pool._finished(False)
+                    future.set_exception(TaskTimeout(
+                        "Worker process killed after {} s".format(timeout)))
+                    continue
+                status, value = self.conn.recv()
+            except (EOFError, OSError):
+                exitcode = self.process.exitcode
+                self._respawn()
+                self._pool._finished(False)
+                future.set_exception(WorkerDied(
+                    "Worker process exited with code {}".format(exitcode)))
+                continue
+            finally:
+                self.busy = False
+            if status == 'ok':
+                self._pool._finished(True)
+                future.set_result(value)
+            elif status == 'memory':
+                self._respawn()
+                self._pool._finished(False)
+                future.set_exception(MemoryLimitExceeded(
+                    "Worker process needed more than {} bytes".format(self._pool.memory_limit)))
+            else:
+                self._pool._finished(False)
+                future.set_exception(value)
+
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool(object):
+    """ A fixed number of long-lived worker processes.
+
+    All processes are started, and the initializer run in each of them, up
+    front. Tasks are functions (and their arguments) which can be pickled.
+
+    arguments:
+
+    processes: number of worker processes. Default is the number of CPUs.
+
+    initializer: called with initargs in each worker process when it starts.
+
+    max_queue: maximum number of tasks waiting for a free worker. submit()
+    raises queue.Full beyond that. Default is unlimited.
+
+    task_timeout: seconds a task may run. Beyond, its worker process is
+    killed and replaced, and the task fails with TaskTimeout. Default is
+    unlimited.
+
+    memory_limit: bytes a task may allocate, on top of what the worker
+    process uses once initialized. Beyond, the task fails with
+    MemoryLimitExceeded and its worker process is replaced. Needs a
+    platform with /proc and resource limits, like Linux. Default is
+    unlimited.
+    """
+
+    def __init__(self, processes=None, initializer=None, initargs=(),
+                 max_queue=None, task_timeout=None, memory_limit=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.initializer = initializer
+        self.initargs = initargs
+        self.task_timeout = task_timeout
+        self.memory_limit = memory_limit
+        self._tasks = queue.Queue(maxsize=max_queue or 0)
+        self._lock = threading.Lock()
+        self._completed = 0
+        self._failed = 0
+        self._respawns = 0
+        self._closed = False
+        self._workers = [_Worker(self, i) for i in range(self.processes)]
+        for worker in self._workers:
+            worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _finished(self, success):
+        with self._lock:
+            if success:
+                self._completed += 1
+            else:
+                self._failed += 1
+
+    def _respawned(self):
+        with self._lock:
+            self._respawns += 1
+
+    def submit(self, fn, *args, **kwargs):
+        ''' Run fn(*args, **kwargs) in a worker process. Returns a Future.
+
+        Raises queue.Full if max_queue tasks are already waiting.
+        '''
+        if self._closed:
+            raise RuntimeError("Pool is closed.")
+        future = Future()
+        self._tasks.put_nowait((future, (fn, args, kwargs)))
+        return future
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.processes,
+                'busy': sum(1 for w in self._workers if w.busy),
+                'queued': self._tasks.qsize(),
+                'completed': self._completed,
+                'failed': self._failed,
+                'respawned': self._respawns,
+            }
+
+    def close(self):
+        ''' Finish queued tasks and stop the worker processes.
+        '''
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+
+
+def run_each(fn, tasks, workers=None):
+    ''' Call fn(*args) for each args of tasks, in that many worker
+    processes with more than one worker, else in this process.
+
+    Yields (args, result, error) in the order of tasks. error is None if
+    the call succeeded, else the exception, as "<type>: <message>", and
+    result None.
+    '''
+    if not workers or workers <= 1:
+        for args in tasks:
+            try:
+                yield args, fn(*args), None
+            except Exception as e:  # pylint: disable=broad-except
+                yield args, None, '{}: {}'.format(type(e).__name__, e)
+        return
+    with WorkerPool(processes=workers) as pool:
+        futures = [pool.submit(fn, *args) for args in tasks]
+        for args, future in zip(tasks, futures):
+            try:
+                yield args, future.result(), None
+            except Exception as e:  # pylint: disable=broad-except
+                yield args, None, '{}: {}'.format(type(e).__name__, e)
@@ -0,0 +1,47 @@
+'''
+Factories shared by the unit tests.
+'''
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ImplicitVRLittleEndian
+# pylint: disable=no-name-in-module
+from pynetdicom.sop_class import VLPhotographicImageStorage
+
+import dicom4ortho.defaults as defaults
+
+
+def make_metadata(image_type='EV01', **values):
+    ''' Metadata of an image, as a row of a CSV file gives it, with new
+    Study and Series Instance UIDs. values replace or add to it.
+    '''
+    metadata = {
+        'patient_firstname': 'John',
+        'patient_lastname': 'Doe',
+        'patient_id': '99999',
+        'patient_sex': 'M',
+        'patient_birthdate': '2000-01-01',
+        'dental_provider_firstname': 'Edward',
+        'dental_provider_lastname': 'Angle',
+        'image_type': image_type,
+        'manufacturer': 'Apple',
+        'study_instance_uid': defaults.generate_dicom_uid(),
+        'study_description': 'Initial Visit',
+        'series_instance_uid': defaults.generate_dicom_uid(),
+        'series_description': 'Orthodontic Extraoral Series',
+    }
+    metadata.update(values)
+    return metadata
+
+
+def make_dataset(patient_id='99999'):
+    ''' A small VL Photographic Image dataset, without pixels, as sent to a
+    PACS.
+    '''
+    ds = Dataset()
+    ds.file_meta = FileMetaDataset()
+    ds.file_meta.TransferSyntaxUID = ImplicitVRLittleEndian
+    ds.file_meta.MediaStorageSOPClassUID = VLPhotographicImageStorage
+    ds.SOPClassUID = VLPhotographicImageStorage
+    ds.SOPInstanceUID = defaults.generate_dicom_uid()
+    ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+    ds.PatientID = patient_id
+    return ds
@@ -0,0 +1,163 @@
+'''
+Unit tests for archive containers.
+'''
+import unittest
+import logging
+import importlib.resources
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+
+import pydicom
+
+import dicom4ortho.controller as controller
+import dicom4ortho.archive as archive_module
+from dicom4ortho.archive import ArchiveWriter
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        archive_module.close_archives()
+        self.tmpdir.cleanup()
+
+    def make_input_archive(self, filename):
+        ''' An archive with the test images under patient1/, and a CSV
+        pointing into it.
+        '''
+        names = ['EV-01_EO.RP.LR.CO.png', 'EV-17_EO.FF.LC.CO.png', 'IV-25_IO.MX.MO.OV.WM.BC.png']
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+            with open(input_csv) as f:
+                csv_text = f.read()
+        if filename.endswith('.zip'):
+            with zipfile.ZipFile(filename, 'w') as zf:
+                for name in names:
+                    zf.write(os.path.join(resources, name), 'patient1/' + name)
+        else:
+            with tarfile.open(filename, 'w') as tf:
+                for name in names:
+                    tf.add(os.path.join(resources, name), 'patient1/' + name)
+        for name in names:
+            csv_text = csv_text.replace(
+                name, '{}!/patient1/{}'.format(os.path.basename(filename), name))
+        csv_filename = os.path.join(self.tmpdir.name, 'input.csv')
+        with open(csv_filename, 'w') as f:
+            f.write(csv_text)
+        return csv_filename
+
+    def test_zip_rollover(self):
+        filename = os.path.join(self.tmpdir.name, 'out.zip')
+        with ArchiveWriter(filename, max_size=2500) as archive:
+            for i in range(5):
+                archive.add('a/{}.dcm'.format(i), bytes([i]) * 1000)
+        self.assertEqual([os.path.basename(f) for f in archive.filenames],
+                         ['out.zip', 'out-0001.zip'])
+        names = []
+        for f in archive.filenames:
+            with zipfile.ZipFile(f) as zf:
+                self.assertIsNone(zf.testzip())
+                for info in zf.infolist():
+                    self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+                names.extend(zf.namelist())
+        self.assertEqual(names, ['a/{}.dcm'.format(i) for i in range(5)])
+
+    def test_failed_entry(self):
+        for extension in ('.zip', '.tar'):
+            filename = os.path.join(self.tmpdir.name, 'out' + extension)
+            with ArchiveWriter(filename) as archive:
+                with self.assertRaises(ValueError):
+                    with archive.open('bad.dcm') as entry:
+                        entry.write(b'truncated')
+                        raise ValueError("encoding failed")
+                self.assertFalse(archive.link('link.dcm', 'bad.dcm'))
+                archive.add('good.dcm', b'complete')
+            if extension == '.zip':
+                with zipfile.ZipFile(filename) as zf:
+                    self.assertIsNone(zf.testzip())
+                    self.assertEqual(zf.namelist(), ['good.dcm'])
+                    self.assertEqual(zf.read('good.dcm'), b'complete')
+            else:
+                with tarfile.open(filename) as tf:
+                    self.assertEqual(tf.getnames(), ['good.dcm'])
+
+    def test_bulk_convert_into_tar(self):
+        filename = os.path.join(self.tmpdir.name, 'out.tar')
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            with ArchiveWriter(filename) as archive:
+                controller.SimpleController(None).bulk_convert_from_csv(
+                    str(input_csv), archive=archive)
+        with tarfile.open(filename) as tf:
+            self.assertEqual(tf.getnames(), [
+                'EV-01_EO.RP.LR.CO.dcm',
+                'EV-17_EO.FF.LC.CO.dcm',
+                'IV-25_IO.MX.MO.OV.WM.BC.dcm'])
+            ds = pydicom.dcmread(tf.extractfile('EV-17_EO.FF.LC.CO.dcm'))
+        self.assertEqual((ds.Columns, ds.Rows), (345, 506))
+
+    def test_bulk_convert_into_zip(self):
+        filename = os.path.join(self.tmpdir.name, 'out.zip')
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            with ArchiveWriter(filename) as archive:
+                controller.SimpleController(None).bulk_convert_from_csv(
+                    str(input_csv), archive=archive)
+        with zipfile.ZipFile(filename) as zf:
+            ds = pydicom.dcmread(zf.open('IV-25_IO.MX.MO.OV.WM.BC.dcm'))
+        self.assertEqual((ds.Columns, ds.Rows), (344, 259))
+
+    def test_bulk_convert_from_zip(self):
+        filename = os.path.join(self.tmpdir.name, 'export.zip')
+        csv_filename = self.make_input_archive(filename)
+        controller.SimpleController(None).bulk_convert_from_csv(csv_filename)
+        ds = pydicom.dcmread(os.path.join(
+            self.tmpdir.name, 'export', 'patient1', 'EV-17_EO.FF.LC.CO.dcm'))
+        self.assertEqual((ds.Columns, ds.Rows), (345, 506))
+        self.assertIs(archive_module.open_archive(filename),
+                      archive_module.open_archive(filename))
+
+    def test_bulk_convert_from_tar_into_zip(self):
+        filename = os.path.join(self.tmpdir.name, 'export.tar')
+        csv_filename = self.make_input_archive(filename)
+        output = os.path.join(self.tmpdir.name, 'out.zip')
+        with ArchiveWriter(output) as archive:
+            controller.SimpleController(None).bulk_convert_from_csv(
+                csv_filename, archive=archive)
+        with zipfile.ZipFile(output) as zf:
+            self.assertIn('patient1/IV-25_IO.MX.MO.OV.WM.BC.dcm', zf.namelist())
+            ds = pydicom.dcmread(zf.open('patient1/IV-25_IO.MX.MO.OV.WM.BC.dcm'))
+        self.assertEqual((ds.Columns, ds.Rows), (344, 259))
+
+    def test_tar_member_stream(self):
+        filename = os.path.join(self.tmpdir.name, 'data.tar')
+        data = bytes(range(256)) * 100
+        with tarfile.open(filename, 'w') as tf:
+            info = tarfile.TarInfo('a/b.bin')
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+        with archive_module.open_member(filename + '!/a/b.bin') as stream:
+            stream.seek(1000)
+            self.assertEqual(stream.read(10), data[1000:1010])
+            stream.seek(0)
+            self.assertEqual(stream.read(), data)
+        with self.assertRaises(FileNotFoundError):
+            archive_module.open_member(filename + '!/missing')
+
+    def test_compressed_tar_member_stream(self):
+        data = bytes(range(256)) * 100
+        for mode, extension in (('w:gz', '.tar.gz'), ('w:bz2', '.tar.bz2'), ('w:xz', '.tar.xz')):
+            filename = os.path.join(self.tmpdir.name, 'data' + extension)
+            with tarfile.open(filename, mode) as tf:
+                info = tarfile.TarInfo('a/b.bin')
+                info.size = len(data)
+                tf.addfile(info, io.BytesIO(data))
+            with archive_module.open_member(filename + '!/a/b.bin') as stream:
+                self.assertEqual(stream.read(), data)
+                stream.seek(1000)
+                self.assertEqual(stream.read(10), data[1000:1010])
@@ -0,0 +1,107 @@
+'''
+Concurrency stress test of the conversion core.
+'''
+import unittest
+import logging
+import copy
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import PIL.Image
+import pydicom
+
+import dicom4ortho.controller as controller
+import dicom4ortho.defaults as defaults
+import dicom4ortho.uid as uid
+from dicom4ortho.fastwriter import TemplateWriter
+from test.helpers import make_metadata
+
+THREADS = 8
+IMAGES = 48
+
+IMAGE_TYPES = ['EV01', 'EV17', 'IV25', 'IV07', 'RV01']
+
+
+def image_metadata(i):
+    image_type = IMAGE_TYPES[i % len(IMAGE_TYPES)]
+    if image_type.startswith('RV'):
+        im = PIL.Image.new('I;16', (40 + i, 30))
+        im.putpixel((i, i % 30), 1000 * i)
+    else:
+        im = PIL.Image.new('RGB', (40 + i, 30), (i, 2 * i, 3 * i))
+    buffer = io.BytesIO()
+    im.save(buffer, 'PNG')
+    # UIDs are left to the allocator.
+    return make_metadata(
+        image_type,
+        input_image=buffer.getvalue(),
+        input_image_filename='image{}.png'.format(i),
+        uid_key='image{}.png'.format(i),
+        patient_id=str(i % 5),
+        study_instance_uid=None,
+        series_instance_uid=None,
+        series_description='Series {}'.format(i % 3),
+        teeth=['11', '21'] if i % 2 else [],
+        dicom={'InstitutionName': 'Clinic {}'.format(i)},
+    )
+
+
+def comparable(dicom_bytes):
+    ''' The dataset of dicom_bytes without the dates and times of the
+    conversion.
+    '''
+    ds = pydicom.dcmread(io.BytesIO(dicom_bytes))
+    for elem in list(ds):
+        if elem.keyword.endswith('Date') or elem.keyword.endswith('Time'):
+            if elem.keyword != 'PatientBirthDate':
+                del ds[elem.tag]
+    return ds
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.metadata = [image_metadata(i) for i in range(IMAGES)]
+
+    def test_image_types_read_only(self):
+        with self.assertRaises(TypeError):
+            defaults.image_types['EV01'] = ('changed',)
+        controller.SimpleController(None)
+        self.assertEqual(defaults.image_types['EV01'][0], 'EO.RP.LR.CO')
+
+    def test_threads(self):
+        uids = uid.UIDAllocator('concurrency.example.com')
+        expected = [comparable(controller.convert_to_bytes(metadata, uids))
+                    for metadata in self.metadata]
+        originals = copy.deepcopy(self.metadata)
+
+        # Threads share the allocator, the writer and the controller.
+        writer = TemplateWriter()
+        c = controller.SimpleController(None, uid_namespace='concurrency.example.com')
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            for _ in range(3):
+                results = list(executor.map(
+                    lambda metadata: controller.convert_to_bytes(metadata, uids, writer),
+                    self.metadata))
+                self.assertEqual([comparable(result) for result in results], expected)
+                results = list(executor.map(c.convert_image_to_dicom_bytes, self.metadata))
+                self.assertEqual([comparable(result) for result in results], expected)
+        self.assertEqual(self.metadata, originals)
+        self.assertEqual(len({ds.SOPInstanceUID for ds in expected}), IMAGES)
+
+    def test_threads_to_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rows = [dict(metadata, output_image_filename=os.path.join(
+                tmpdir, 'image{}.dcm'.format(i))) for i, metadata in enumerate(self.metadata)]
+            originals = copy.deepcopy(rows)
+            with ThreadPoolExecutor(max_workers=THREADS) as executor:
+                photos = list(executor.map(controller.convert, rows))
+            self.assertEqual(rows, originals)
+            for row, photo in zip(rows, photos):
+                self.assertEqual(photo.output_image_filename, row['output_image_filename'])
+                with open(row['output_image_filename'], 'rb') as f:
+                    self.assertEqual(comparable(f.read()), comparable(photo.to_bytes()))
@@ -5,9 +5,16 @@ Unit tests for controller.
 '''
 import unittest
 import logging
-import logging
+import importlib.resources
+import io
+
+import PIL.Image
+import pydicom
+
 import dicom4ortho.defaults as defaults
 import dicom4ortho.controller as controller
+from test.helpers import make_metadata
+
 
 class Test(unittest.TestCase):
 
@@ -25,3 +32,28 @@ class Test(unittest.TestCase):
         self.assertEqual(len(defaults.image_types['EV01']), 2)
         self.assertEqual(defaults.image_types['EV01'][0], "EO.RP.LR.CO")
         self.assertEqual(defaults.image_types['EV04'][1], "Extraoral, Right Profile (subject is facing observer's right), Lips Closed, Centric Relation")
+
+    def test_convert_image_in_memory(self):
+        c = controller.SimpleController(None)
+        with importlib.resources.path("test.resources", "EV-01_EO.RP.LR.CO.png") as png:
+            with open(png, 'rb') as f:
+                image_bytes = f.read()
+            with PIL.Image.open(png) as im:
+                expected = im.tobytes()
+                sources = [image_bytes, io.BytesIO(image_bytes), im.copy()]
+
+        for source in sources:
+            metadata = make_metadata()
+            metadata['input_image'] = source
+            dicom_bytes = c.convert_image_to_dicom_bytes(metadata)
+            ds = pydicom.dcmread(io.BytesIO(dicom_bytes))
+            self.assertEqual((ds.Columns, ds.Rows), (409, 517))
+            self.assertEqual(ds.PixelData[:len(expected)], expected)
+            self.assertEqual(ds.PatientID, '99999')
+
+        output = io.BytesIO()
+        metadata = make_metadata()
+        metadata['input_image'] = image_bytes
+        metadata['output_image_filename'] = output
+        c.convert_image_to_dicom4orthograph(metadata)
+        self.assertEqual(output.getvalue()[128:132], b'DICM')
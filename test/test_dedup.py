@@ -0,0 +1,102 @@
+'''
+Unit tests for duplicate detection.
+'''
+import unittest
+import logging
+import importlib.resources
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+import PIL.Image
+
+import dicom4ortho.controller as controller
+import dicom4ortho.dedup as dedup
+from dicom4ortho.archive import ArchiveWriter
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+        for name in os.listdir(resources):
+            if name.endswith('.png'):
+                shutil.copy(os.path.join(resources, name), self.tmpdir.name)
+        self.path = lambda name: os.path.join(self.tmpdir.name, name)
+        shutil.copy(self.path('EV-01_EO.RP.LR.CO.png'), self.path('copy.png'))
+        with PIL.Image.open(self.path('EV-17_EO.FF.LC.CO.png')) as im:
+            im.convert('RGB').resize((im.width // 2, im.height // 2)).save(
+                self.path('smaller.jpg'), quality=80)
+        with open(os.path.join(resources, 'input_from.csv')) as f:
+            lines = f.read().splitlines()
+        self.csv = self.path('input_from.csv')
+        with open(self.csv, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.write(lines[1].replace('EV-01_EO.RP.LR.CO.png', 'copy.png') + '\n')
+            f.write(lines[2].replace('EV-17_EO.FF.LC.CO.png', 'smaller.jpg') + '\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_find_duplicates(self):
+        filenames = [self.path(name) for name in (
+            'EV-01_EO.RP.LR.CO.png', 'EV-17_EO.FF.LC.CO.png', 'copy.png', 'smaller.jpg')]
+        self.assertEqual(dedup.find_duplicates(filenames), [dedup.Duplicate(2, 0, 'exact')])
+        self.assertEqual(dedup.find_duplicates(filenames, perceptual=True, distance=4),
+                         [dedup.Duplicate(2, 0, 'exact'), dedup.Duplicate(3, 1, 'perceptual')])
+        self.assertEqual(dedup.find_duplicates(filenames + [self.path('missing.png')]),
+                         [dedup.Duplicate(2, 0, 'exact')])
+
+    def test_report(self):
+        c = controller.SimpleController(None)
+        c.bulk_convert_from_csv(self.csv, duplicates=dedup.REPORT)
+        self.assertEqual([(os.path.basename(d), os.path.basename(o), kind)
+                          for d, o, kind in c.duplicates],
+                         [('copy.png', 'EV-01_EO.RP.LR.CO.png', 'exact')])
+        self.assertTrue(os.path.exists(self.path('copy.dcm')))
+        self.assertFalse(os.path.samefile(self.path('copy.dcm'),
+                                          self.path('EV-01_EO.RP.LR.CO.dcm')))
+
+    def test_skip(self):
+        c = controller.SimpleController(None)
+        c.bulk_convert_from_csv(self.csv, duplicates=dedup.SKIP, perceptual_distance=4)
+        self.assertEqual(len(c.duplicates), 2)
+        self.assertFalse(os.path.exists(self.path('copy.dcm')))
+        self.assertFalse(os.path.exists(self.path('smaller.dcm')))
+        self.assertTrue(os.path.exists(self.path('EV-17_EO.FF.LC.CO.dcm')))
+
+    def test_link(self):
+        controller.SimpleController(None).bulk_convert_from_csv(
+            self.csv, duplicates=dedup.LINK, workers=2)
+        self.assertTrue(os.path.samefile(self.path('copy.dcm'),
+                                         self.path('EV-01_EO.RP.LR.CO.dcm')))
+        self.assertFalse(os.path.samefile(self.path('smaller.dcm'),
+                                          self.path('EV-17_EO.FF.LC.CO.dcm')))
+
+    def test_link_in_archive(self):
+        for extension in ('.zip', '.tar'):
+            filename = self.path('output' + extension)
+            with ArchiveWriter(filename) as output:
+                controller.SimpleController(None).bulk_convert_from_csv(
+                    self.csv, archive=output, duplicates=dedup.LINK)
+            if extension == '.zip':
+                with zipfile.ZipFile(filename) as z:
+                    self.assertEqual(z.read('copy.dcm'), b'EV-01_EO.RP.LR.CO.dcm')
+                    self.assertEqual(z.getinfo('copy.dcm').external_attr >> 28, 0o12)
+            else:
+                with tarfile.open(filename) as t:
+                    self.assertEqual(t.getmember('copy.dcm').linkname, 'EV-01_EO.RP.LR.CO.dcm')
+                    self.assertEqual(t.extractfile('copy.dcm').read(),
+                                     t.extractfile('EV-01_EO.RP.LR.CO.dcm').read())
+
+    def test_no_link_across_archives(self):
+        with ArchiveWriter(self.path('output.tar'), max_size=1) as output:
+            controller.SimpleController(None).bulk_convert_from_csv(
+                self.csv, archive=output, duplicates=dedup.LINK)
+            self.assertEqual(len(output.filenames), 4)
@@ -0,0 +1,134 @@
+'''
+Unit tests for de-identification.
+'''
+import unittest
+import logging
+import importlib.resources
+import json
+import os
+import shutil
+import tempfile
+
+import pydicom
+
+import dicom4ortho.controller as controller
+import dicom4ortho.deid as deid
+import dicom4ortho.dicomfile as dicomfile
+import dicom4ortho.integrity as integrity
+from dicom4ortho.__main__ import main
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.tmpdir.name, 'in')
+        os.makedirs(self.input)
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+        for name in os.listdir(resources):
+            if name.endswith('.png') or name.endswith('.csv'):
+                shutil.copy(os.path.join(resources, name), self.input)
+        controller.SimpleController(None).bulk_convert_from_csv(
+            os.path.join(self.input, 'input_from.csv'), pixel_hash=integrity.ATTRIBUTE)
+        self.files = sorted(dicomfile.dicom_files([self.input]))
+        # A second series, referencing the first image.
+        ds = pydicom.dcmread(self.files[0])
+        ds.InstitutionName = 'Clinic'
+        ds.add_new(0x00090010, 'LO', 'SOME VENDOR')
+        ds.add_new(0x00091001, 'LO', 'secret')
+        item = pydicom.Dataset()
+        item.ReferencedSOPInstanceUID = pydicom.dcmread(self.files[1]).SOPInstanceUID
+        item.ReferencedSOPClassUID = ds.SOPClassUID
+        ds.ReferencedImageSequence = [item]
+        os.makedirs(os.path.join(self.input, 'sub'))
+        ds.save_as(os.path.join(self.input, 'sub', 'extra.dcm'), write_like_original=False)
+        self.output = os.path.join(self.tmpdir.name, 'out')
+        self.table = os.path.join(self.tmpdir.name, 'lookup.sqlite')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_rewrite(self):
+        output = os.path.join(self.tmpdir.name, 'copy.dcm')
+
+        def edit(ds):
+            ds.PatientName = 'Changed^Name'
+            return 'done'
+        self.assertEqual(dicomfile.rewrite(self.files[0], output, edit), 'done')
+        original = pydicom.dcmread(self.files[0])
+        copy = pydicom.dcmread(output)
+        self.assertEqual(copy.PatientName, 'Changed^Name')
+        self.assertEqual(copy.PixelData, original.PixelData)
+        self.assertEqual(os.listdir(self.tmpdir.name).count('copy.dcm'), 1)
+        self.assertFalse([name for name in os.listdir(self.tmpdir.name) if name.endswith('.tmp')])
+
+        def change_syntax(ds):
+            ds.file_meta.TransferSyntaxUID = pydicom.uid.RLELossless
+        with self.assertRaises(ValueError):
+            dicomfile.rewrite(self.files[0], output, change_syntax)
+        self.assertEqual(pydicom.dcmread(output).PatientName, 'Changed^Name')
+
+    def test_deidentify(self):
+        results = deid.deidentify([self.input], self.output, self.table, workers=2)
+        self.assertEqual([result.error for result in results], [None] * 4)
+        self.assertEqual(results[3].output_filename,
+                         os.path.join(self.output, 'sub', 'extra.dcm'))
+
+        originals = [pydicom.dcmread(filename) for filename in self.files]
+        copies = [pydicom.dcmread(result.output_filename) for result in results[:3]]
+        extra = pydicom.dcmread(results[3].output_filename)
+        for original, copy in zip(originals, copies):
+            self.assertEqual(copy.PixelData, original.PixelData)
+            self.assertNotEqual(copy.SOPInstanceUID, original.SOPInstanceUID)
+            self.assertEqual(copy.file_meta.MediaStorageSOPInstanceUID, copy.SOPInstanceUID)
+            self.assertEqual(copy.SOPClassUID, original.SOPClassUID)
+            self.assertTrue(str(copy.PatientID).startswith(deid.PSEUDONYM_PREFIX))
+            self.assertEqual(copy.PatientIdentityRemoved, 'YES')
+            self.assertEqual(copy.StudyDate, '')
+            for keyword in ('StudyDescription', 'SeriesDescription', 'ImageComments'):
+                self.assertNotIn(keyword, copy)
+            self.assertTrue(integrity.verify_file(
+                os.path.join(self.output, os.path.basename(original.filename))).ok)
+        # The same originals map to the same UIDs, across files and workers.
+        self.assertEqual(len({copy.StudyInstanceUID for copy in copies}), 1)
+        self.assertEqual(extra.ReferencedImageSequence[0].ReferencedSOPInstanceUID,
+                         copies[1].SOPInstanceUID)
+        self.assertEqual(extra.PatientID, copies[0].PatientID)
+        self.assertNotIn('InstitutionName', extra)
+        self.assertNotIn(0x00091001, extra)
+        self.assertEqual(integrity.stored_hash(extra), integrity.stored_hash(copies[0]))
+
+        with deid.LookupTable(self.table) as table:
+            self.assertEqual(table.replacement(deid.UID, originals[0].SOPInstanceUID),
+                             copies[0].SOPInstanceUID)
+            self.assertEqual(table.original(deid.PSEUDONYM, copies[0].PatientID),
+                             originals[0].PatientID)
+
+        # Later runs with the same table give the same UIDs.
+        again = os.path.join(self.tmpdir.name, 'again')
+        deid.deidentify(self.files[:1], again, self.table, profile='basic-retain-dates')
+        copy = pydicom.dcmread(os.path.join(again, os.path.basename(self.files[0])))
+        self.assertEqual(copy.SOPInstanceUID, copies[0].SOPInstanceUID)
+        self.assertEqual(copy.StudyDate, originals[0].StudyDate)
+
+    def test_profile_file(self):
+        profile = os.path.join(self.tmpdir.name, 'profile.json')
+        with open(profile, 'w') as f:
+            json.dump({'extends': 'basic', 'replace': {'PatientSex': 'O'},
+                       'remove': ['ImageComments']}, f)
+        self.assertEqual(main(['', 'deidentify', self.files[0], '--profile', profile,
+                               '--output-directory', self.output,
+                               '--lookup-table', self.table, '--workers', '1']), 0)
+        copy = pydicom.dcmread(os.path.join(self.output, os.path.basename(self.files[0])))
+        self.assertEqual(copy.PatientSex, 'O')
+        self.assertNotIn('ImageComments', copy)
+
+        with open(profile, 'w') as f:
+            json.dump({'remove': ['NoSuchKeyword']}, f)
+        with self.assertRaises(ValueError):
+            deid.load_profile(profile)
+        self.assertEqual(main(['', 'deidentify', self.files[0], '--profile', profile,
+                               '--output-directory', self.output]), 2)
@@ -0,0 +1,82 @@
+'''
+Unit tests for scaling images down while converting.
+'''
+import unittest
+import logging
+import io
+
+import PIL.Image
+
+import dicom4ortho.controller as controller
+from dicom4ortho.fastwriter import TemplateWriter
+from dicom4ortho.model import scaled_size
+from dicom4ortho.m_orthodontic_photograph import OrthodonticPhotograph
+from dicom4ortho.m_orthodontic_radiograph import OrthodonticRadiograph
+
+
+def jpeg(size):
+    buffer = io.BytesIO()
+    PIL.Image.linear_gradient('L').resize(size).convert('RGB').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        controller.SimpleController(None)
+
+    def test_scaled_size(self):
+        self.assertEqual(scaled_size((4000, 3000), max_dimension=1000), (1000, 750))
+        self.assertEqual(scaled_size((3000, 4000), max_megapixels=3), (1500, 2000))
+        self.assertEqual(scaled_size((4000, 3000), 2000, 1.2), (1264, 948))
+        self.assertIsNone(scaled_size((800, 600), 1000, 1))
+
+    def test_jpeg(self):
+        photo = OrthodonticPhotograph(image_type='EV01', input_image=jpeg((1600, 1200)),
+                                      max_dimension='300')
+        photo.set_image()
+        ds = photo.dataset
+        self.assertEqual((ds.Columns, ds.Rows), (300, 225))
+        self.assertEqual(len(ds.PixelData), 300 * 225 * 3)
+        self.assertEqual(ds.ImageType[0], 'DERIVED')
+        self.assertEqual(ds.DerivationDescription, 'Downscaled from 1600x1200')
+
+    def test_small_image_is_kept(self):
+        photo = OrthodonticPhotograph(image_type='EV01', input_image=jpeg((160, 120)),
+                                      max_dimension=300, max_megapixels=1)
+        photo.set_image()
+        self.assertEqual((photo.dataset.Columns, photo.dataset.Rows), (160, 120))
+        self.assertEqual(photo.dataset.ImageType[0], 'ORIGINAL')
+        self.assertNotIn('DerivationDescription', photo.dataset)
+
+    def test_pil_image_and_transpose(self):
+        im = PIL.Image.new('L', (400, 100))
+        photo = OrthodonticPhotograph(image_type='IV25', input_image=im, max_dimension=200,
+                                      mirror_correction='ROTATE_90')
+        photo.set_image()
+        self.assertEqual((photo.dataset.Columns, photo.dataset.Rows), (50, 200))
+        self.assertEqual(photo.dataset.DerivationDescription,
+                         'Downscaled from 400x100; Transposed: ROTATE_90')
+        self.assertEqual(im.size, (400, 100))
+
+    def test_radiograph(self):
+        im = PIL.Image.linear_gradient('L').resize((512, 256)).point(
+            lambda v: v * 16, 'I').convert('I;16')
+        radiograph = OrthodonticRadiograph(image_type='RV01', input_image=im,
+                                           max_megapixels=0.0328)
+        radiograph.set_image()
+        ds = radiograph.dataset
+        self.assertEqual((ds.Columns, ds.Rows), (256, 128))
+        self.assertEqual(ds.BitsAllocated, 16)
+        self.assertEqual(ds.ImageType[0], 'DERIVED')
+
+    def test_template_writer(self):
+        writer = TemplateWriter()
+        for size in ((800, 600), (1000, 700)):
+            photo = OrthodonticPhotograph(image_type='EV01', input_image=jpeg(size),
+                                          max_dimension=100)
+            photo.set_image()
+            self.assertEqual(photo.to_bytes(writer=writer), photo.to_bytes())
+        self.assertEqual(len(writer), 1)
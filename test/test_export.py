@@ -0,0 +1,185 @@
+'''
+Unit tests for exporting DICOM files as images.
+'''
+import unittest
+import logging
+import importlib.resources
+import io
+import os
+import shutil
+import struct
+import tempfile
+
+import PIL.Image
+import pydicom
+import pydicom.encaps
+import pydicom.uid
+
+import dicom4ortho.controller as controller
+import dicom4ortho.export as export
+from dicom4ortho.__main__ import main
+from dicom4ortho.m_orthodontic_photograph import OrthodonticPhotograph
+from dicom4ortho.m_orthodontic_radiograph import OrthodonticRadiograph
+
+
+def packbits(data):
+    ''' PackBits with literal runs only. '''
+    out = bytearray()
+    for i in range(0, len(data), 128):
+        run = data[i:i + 128]
+        out.append(len(run) - 1)
+        out.extend(run)
+    if len(out) % 2:
+        out.append(0x80)  # no-op
+    return bytes(out)
+
+
+def rle_frame(planes):
+    segments = [packbits(plane) for plane in planes]
+    offsets = []
+    position = 64
+    for segment in segments:
+        offsets.append(position)
+        position += len(segment)
+    header = struct.pack('<16L', len(segments), *(offsets + [0] * (15 - len(offsets))))
+    return header + b''.join(segments)
+
+
+def photo_dataset(im, image_type='EV01'):
+    photo = OrthodonticPhotograph(image_type=image_type, input_image=im)
+    photo.set_image()
+    photo.patient_id = '42'
+    return pydicom.dcmread(io.BytesIO(photo.to_bytes()))
+
+
+def encapsulate(ds, transfer_syntax, frame):
+    ds.file_meta.TransferSyntaxUID = transfer_syntax
+    ds.PixelData = pydicom.encaps.encapsulate([frame])
+    ds['PixelData'].is_undefined_length = True
+    ds['PixelData'].VR = 'OB'
+    return ds
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        controller.SimpleController(None)
+        self.rgb = PIL.Image.linear_gradient('L').resize((31, 17)).convert('RGB')
+        self.rgb.putpixel((3, 4), (255, 0, 10))
+
+    def test_native(self):
+        ds = photo_dataset(self.rgb)
+        self.assertEqual(export.dataset_image(ds).tobytes(), self.rgb.tobytes())
+
+        planes = self.rgb.split()
+        ds.PlanarConfiguration = 1
+        ds.PixelData = b''.join(plane.tobytes() for plane in planes) + b'\0'
+        self.assertEqual(export.dataset_image(ds).tobytes(), self.rgb.tobytes())
+
+        ycbcr = self.rgb.convert('YCbCr')
+        ds.PlanarConfiguration = 0
+        ds.PhotometricInterpretation = 'YBR_FULL'
+        ds.PixelData = ycbcr.tobytes() + b'\0'
+        self.assertEqual(export.dataset_image(ds).tobytes(), ycbcr.convert('RGB').tobytes())
+
+    def test_monochrome(self):
+        gray = self.rgb.convert('L')
+        ds = photo_dataset(gray)
+        self.assertEqual(export.dataset_image(ds).tobytes(), gray.tobytes())
+        ds.PhotometricInterpretation = 'MONOCHROME1'
+        self.assertEqual(export.dataset_image(ds).tobytes(),
+                         gray.point(lambda v: 255 - v).tobytes())
+
+    def test_radiograph_window(self):
+        im = PIL.Image.new('I;16', (4, 1))
+        im.frombytes(struct.pack('<4H', 1000, 2000, 3000, 4000))
+        radiograph = OrthodonticRadiograph(image_type='RV01', input_image=im)
+        radiograph.set_image()
+        ds = pydicom.dcmread(io.BytesIO(radiograph.to_bytes()))
+        ds.WindowCenter = 2500
+        ds.WindowWidth = 2001
+        self.assertEqual(list(export.dataset_image(ds).tobytes()), [0, 63, 191, 255])
+
+        ds.BitsAllocated = ds.BitsStored = 32
+        ds.HighBit = 31
+        ds.PixelData = struct.pack('<4L', 1000, 2000, 3000, 4000)
+        self.assertEqual(list(export.dataset_image(ds).tobytes()), [0, 63, 191, 255])
+        ds.file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRBigEndian
+        ds.PixelData = struct.pack('>4L', 1000, 2000, 3000, 4000)
+        self.assertEqual(list(export.dataset_image(ds).tobytes()), [0, 63, 191, 255])
+
+    def test_rle(self):
+        ds = photo_dataset(self.rgb)
+        frame = rle_frame([plane.tobytes() for plane in self.rgb.split()])
+        encapsulate(ds, pydicom.uid.RLELossless, frame)
+        self.assertEqual(export.dataset_image(ds).tobytes(), self.rgb.tobytes())
+
+        values = list(range(0, 65536, 4096))
+        ds = photo_dataset(PIL.Image.new('L', (4, 4)))
+        ds.BitsAllocated = ds.BitsStored = 16
+        ds.HighBit = 15
+        msb = bytes(v >> 8 for v in values)
+        lsb = bytes(v & 0xFF for v in values)
+        encapsulate(ds, pydicom.uid.RLELossless, rle_frame([msb, lsb]))
+        self.assertEqual(list(export.dataset_image(ds).tobytes()),
+                         [round(v * 255 / 61440) for v in values])
+
+    def test_jpeg(self):
+        buffer = io.BytesIO()
+        self.rgb.save(buffer, 'JPEG', quality=95)
+        ds = photo_dataset(self.rgb)
+        ds.PhotometricInterpretation = 'YBR_FULL_422'
+        encapsulate(ds, pydicom.uid.JPEGBaseline8Bit, buffer.getvalue())
+        buffer.seek(0)
+        self.assertEqual(export.dataset_image(ds).tobytes(),
+                         PIL.Image.open(buffer).convert('RGB').tobytes())
+
+    def test_export_files(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+                resources = os.path.dirname(str(input_csv))
+            for name in os.listdir(resources):
+                if name.endswith('.png') or name.endswith('.csv'):
+                    shutil.copy(os.path.join(resources, name), tmpdir)
+            controller.SimpleController(None).bulk_convert_from_csv(
+                os.path.join(tmpdir, 'input_from.csv'))
+            filenames = sorted(os.path.join(tmpdir, name) for name in os.listdir(tmpdir)
+                               if name.endswith('.dcm'))
+            output = os.path.join(tmpdir, 'out')
+            results = export.export(filenames, output, by_view=True, workers=2)
+            self.assertEqual([os.path.relpath(r.output_filename, output) for r in results],
+                             ['99999/EV01.png', '99999/EV17.png', '99999/IV25.png'])
+            with PIL.Image.open(os.path.join(resources, 'EV-01_EO.RP.LR.CO.png')) as original, \
+                    PIL.Image.open(results[0].output_filename) as exported:
+                self.assertEqual(exported.tobytes(), original.convert(exported.mode).tobytes())
+
+            self.assertEqual(main(['', 'export', '--format', 'webp', '--workers', '1',
+                                   filenames[0], os.path.join(tmpdir, 'missing.dcm')]), 1)
+            self.assertTrue(os.path.exists(os.path.join(tmpdir, 'EV-01_EO.RP.LR.CO.webp')))
+            self.assertEqual(export.output_filenames(filenames[:1] * 2, by_view=True)[1],
+                             os.path.join(tmpdir, '99999', 'EV01-2.png'))
+
+    def test_output_filenames(self):
+        filenames = [os.path.join('in', 'p1', 'IV25.dcm'), os.path.join('in', 'p2', 'IV25.dcm')]
+        self.assertEqual(
+            export.output_filenames(filenames, 'out', names=['p1/IV25.dcm', 'p2/IV25.dcm']),
+            [os.path.join('out', 'p1', 'IV25.png'), os.path.join('out', 'p2', 'IV25.png')])
+        self.assertEqual(export.output_filenames(filenames, 'out'),
+                         [os.path.join('out', 'IV25.png'), os.path.join('out', 'IV25-2.png')])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filenames = []
+            for i, patient_id in enumerate(['../../x', '/etc', '..', 'A/B']):
+                ds = photo_dataset(self.rgb)
+                ds.PatientID = patient_id
+                ds.ImageComments = 'EV01'
+                filenames.append(os.path.join(tmpdir, '{}.dcm'.format(i)))
+                ds.save_as(filenames[-1])
+            output = os.path.join(tmpdir, 'out')
+            self.assertEqual(
+                [os.path.relpath(name, output) for name in
+                 export.output_filenames(filenames, output, by_view=True)],
+                [os.path.join('.._.._x', 'EV01.png'), os.path.join('_etc', 'EV01.png'),
+                 os.path.join('unknown', 'EV01.png'), os.path.join('A_B', 'EV01.png')])
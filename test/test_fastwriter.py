@@ -0,0 +1,84 @@
+'''
+Unit tests for the header template writer.
+'''
+import unittest
+import logging
+import io
+
+import PIL.Image
+import pydicom
+import pydicom.uid
+
+import dicom4ortho.controller as controller
+import dicom4ortho.defaults as defaults
+from dicom4ortho.fastwriter import TemplateWriter
+from dicom4ortho.m_orthodontic_photograph import IMAGE_TYPES, OrthodonticPhotograph
+
+
+def make_photo(image_type, image, teeth=None):
+    photo = OrthodonticPhotograph(image_type=image_type, input_image=image, teeth=teeth)
+    photo.patient_firstname = 'John'
+    photo.patient_lastname = 'Doe'
+    photo.patient_id = '99999'
+    photo.study_instance_uid = defaults.generate_dicom_uid()
+    photo.series_instance_uid = defaults.generate_dicom_uid()
+    photo.set_image()
+    return photo
+
+
+def pydicom_bytes(dataset):
+    buffer = io.BytesIO()
+    pydicom.dcmwrite(buffer, dataset, enforce_file_format=True)
+    return buffer.getvalue()
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        controller.SimpleController(None)
+
+    def test_same_as_pydicom_for_all_views(self):
+        writer = TemplateWriter()
+        image = PIL.Image.new('RGB', (7, 5), (10, 20, 30))
+        for image_type in IMAGE_TYPES:
+            for _ in range(2):
+                photo = make_photo(image_type, image)
+                self.assertEqual(photo.to_bytes(writer=writer), photo.to_bytes(),
+                                 image_type)
+        self.assertEqual(len(writer), len(IMAGE_TYPES))
+
+    def test_same_as_pydicom_for_transfer_syntaxes(self):
+        writer = TemplateWriter()
+        for mode in ('RGB', 'L', '1'):
+            image = PIL.Image.new(mode, (3, 3))
+            for transfer_syntax in (pydicom.uid.ImplicitVRLittleEndian,
+                                    pydicom.uid.ExplicitVRLittleEndian,
+                                    pydicom.uid.ExplicitVRBigEndian):
+                photo = make_photo('IV25', image, teeth=['11', '12', '21'])
+                ds = photo.dataset
+                ds.file_meta.TransferSyntaxUID = transfer_syntax
+                buffer = io.BytesIO()
+                writer.write(ds, buffer, key=photo.template_key,
+                             transfer_syntax=transfer_syntax)
+                self.assertEqual(buffer.getvalue(), pydicom_bytes(ds),
+                                 (mode, transfer_syntax.name))
+
+    def test_changed_values_make_new_template(self):
+        writer = TemplateWriter()
+        image = PIL.Image.new('L', (4, 4))
+        photo = make_photo('EV01', image, teeth=['11'])
+        photo.to_bytes(writer=writer)
+        photo = make_photo('EV01', image, teeth=['11'])
+        photo.is_digitized_image()
+        self.assertEqual(photo.to_bytes(writer=writer), photo.to_bytes())
+        photo = make_photo('EV01', image, teeth=['11', '12'])
+        self.assertEqual(photo.to_bytes(writer=writer), photo.to_bytes())
+        self.assertEqual(len(writer), 3)
+
+    def test_compressed_transfer_syntax(self):
+        photo = make_photo('EV01', PIL.Image.new('L', (4, 4)))
+        with self.assertRaises(ValueError):
+            TemplateWriter().write(photo.dataset, io.BytesIO(),
+                                   transfer_syntax=pydicom.uid.JPEGBaseline8Bit)
@@ -0,0 +1,125 @@
+'''
+Unit tests for pixel integrity hashes.
+'''
+import unittest
+import logging
+import importlib.resources
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import PIL.Image
+import pydicom
+
+import dicom4ortho.controller as controller
+import dicom4ortho.dicomfile as dicomfile
+import dicom4ortho.integrity as integrity
+import dicom4ortho.timing as timing
+from dicom4ortho.__main__ import main
+from dicom4ortho.fastwriter import TemplateWriter
+from dicom4ortho.m_orthodontic_photograph import OrthodonticPhotograph
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+        for name in os.listdir(resources) + ['input_from.csv']:
+            if name.endswith('.png') or name.endswith('.csv'):
+                shutil.copy(os.path.join(resources, name), self.tmpdir.name)
+        self.csv = os.path.join(self.tmpdir.name, 'input_from.csv')
+        self.dcm = os.path.join(self.tmpdir.name, 'EV-01_EO.RP.LR.CO.dcm')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def convert(self, pixel_hash):
+        stream = io.StringIO()
+        report = timing.RunReport(stream)
+        controller.SimpleController(None).bulk_convert_from_csv(
+            self.csv, report=report, pixel_hash=pixel_hash)
+        report.close()
+        filename = os.path.join(self.tmpdir.name, 'report.jsonl')
+        with open(filename, 'w') as f:
+            f.write(stream.getvalue())
+        return filename, [json.loads(line) for line in stream.getvalue().splitlines()[:-1]]
+
+    def tamper(self):
+        with open(self.dcm, 'rb') as fp:
+            _, location = dicomfile.read_header(fp)
+        with open(self.dcm, 'r+b') as fp:
+            fp.seek(location.offset + location.header_length + 100)
+            byte = fp.read(1)
+            fp.seek(-1, io.SEEK_CUR)
+            fp.write(bytes([byte[0] ^ 1]))
+
+    def test_pixel_hashes(self):
+        hashes = integrity.pixel_hashes(b'abc', b'\0')
+        digest = integrity.new_hash()
+        digest.update(b'abc\0')
+        self.assertEqual(hashes.pixel_data, digest.hexdigest())
+        self.assertNotEqual(hashes.source, hashes.pixel_data)
+        hashes = integrity.pixel_hashes(b'ab')
+        self.assertEqual(hashes.source, hashes.pixel_data)
+
+    def test_attribute(self):
+        report, records = self.convert(integrity.ATTRIBUTE)
+        self.assertEqual(len(records), 3)
+        ds = pydicom.dcmread(self.dcm)
+        self.assertEqual(integrity.stored_hash(ds), records[0]['pixel_data_hash'])
+        digest = integrity.new_hash()
+        digest.update(ds.PixelData)
+        self.assertEqual(records[0]['pixel_data_hash'], digest.hexdigest())
+
+        files = list(dicomfile.dicom_files([self.tmpdir.name]))
+        self.assertEqual(len(files), 3)
+        self.assertTrue(all(result.ok for result in integrity.verify(files)))
+        self.assertEqual(main(['', 'verify', self.tmpdir.name]), 0)
+
+        self.tamper()
+        results = integrity.verify(files)
+        self.assertEqual([result.ok for result in results], [False, True, True])
+        self.assertEqual(results[0].message, 'Pixel Data hash differs')
+        self.assertEqual(main(['', 'verify', self.tmpdir.name, '--hashes', report]), 1)
+
+    def test_report(self):
+        report, records = self.convert(integrity.REPORT)
+        self.assertNotIn(integrity.PIXEL_DATA_HASH_TAG, pydicom.dcmread(self.dcm))
+        self.assertIsNone(integrity.verify_file(self.dcm).ok)
+        self.assertTrue(integrity.verify_file(self.dcm, records[0]['pixel_data_hash']).ok)
+        self.assertEqual(main(['', 'verify', self.dcm, '--hashes', report]), 0)
+        # Moved files are not in the report: they fail, not go unchecked.
+        moved = os.path.join(self.tmpdir.name, 'moved.dcm')
+        shutil.copy(self.dcm, moved)
+        results = integrity.verify([moved], report)
+        self.assertEqual([result.ok for result in results], [False])
+        self.assertIn('not in', results[0].message)
+        self.assertEqual(main(['', 'verify', moved, '--hashes', report]), 1)
+        self.tamper()
+        self.assertEqual(main(['', 'verify', self.dcm, '--hashes', report]), 1)
+
+    def test_report_required(self):
+        self.assertEqual(main(['', self.csv, '--pixel-hash']), 2)
+        self.assertFalse(os.path.exists(self.dcm))
+        self.assertEqual(main(['', self.csv, '--pixel-hash', 'attribute']), 0)
+        self.assertIsNotNone(integrity.stored_hash(pydicom.dcmread(self.dcm)))
+
+    def test_no_hash_by_default(self):
+        _, records = self.convert(None)
+        self.assertNotIn('pixel_data_hash', records[0])
+
+    def test_template_writer(self):
+        writer = TemplateWriter()
+        for size in ((3, 3), (5, 1)):
+            photo = OrthodonticPhotograph(image_type='EV01', input_image=PIL.Image.new('RGB', size),
+                                          pixel_hash=True, pixel_hash_attribute=True)
+            photo.set_image()
+            self.assertEqual(photo.to_bytes(writer=writer), photo.to_bytes())
+        self.assertEqual(len(writer), 1)
+        self.assertEqual(integrity.stored_hash(photo.dataset), photo.pixel_hashes.pixel_data)
@@ -0,0 +1,122 @@
+'''
+Unit tests for JSON Lines manifests.
+'''
+import unittest
+import logging
+import importlib.resources
+import csv
+import json
+import os
+import shutil
+import tempfile
+
+import pydicom
+
+import dicom4ortho.controller as controller
+import dicom4ortho.manifest as manifest
+from dicom4ortho.__main__ import main
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+        for name in os.listdir(resources):
+            if name.endswith('.png'):
+                shutil.copy(os.path.join(resources, name), self.tmpdir.name)
+        with open(os.path.join(resources, 'input_from.csv')) as f:
+            self.rows = list(csv.DictReader(f))
+        self.rows[0]['teeth'] = ['16', '11-13']
+        self.rows[0]['dicom'] = {
+            'AccessionNumber': 'A123',
+            'InstitutionName': 'Smile Clinic',
+            'OtherPatientIDsSequence': [{'PatientID': 'X-1', 'IssuerOfPatientID': 'Old PMS'}],
+        }
+        self.rows[1]['max_dimension'] = 100
+        self.rows[1]['output_image_filename'] = os.path.join(self.tmpdir.name, 'small.dcm')
+        self.rows[2]['mirror_correction'] = 'auto'
+        self.rows[2]['transfer_syntax'] = pydicom.uid.ExplicitVRBigEndian
+        self.jsonl = os.path.join(self.tmpdir.name, 'input_from.jsonl')
+        self.write(self.rows)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, rows):
+        with open(self.jsonl, 'w') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+            f.write('\n')
+
+    def read(self, name):
+        return pydicom.dcmread(os.path.join(self.tmpdir.name, name))
+
+    def check_output(self):
+        ds = self.read('EV-01_EO.RP.LR.CO.dcm')
+        self.assertEqual([item.CodeMeaning[:2] for item in ds.PrimaryAnatomicStructureSequence],
+                         ['11', '12', '13', '16'])
+        self.assertEqual(ds.AccessionNumber, 'A123')
+        self.assertEqual(ds.InstitutionName, 'Smile Clinic')
+        self.assertEqual(ds.OtherPatientIDsSequence[0].IssuerOfPatientID, 'Old PMS')
+        self.assertEqual(max(self.read('small.dcm').Columns, self.read('small.dcm').Rows), 100)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'EV-17_EO.FF.LC.CO.dcm')))
+        self.assertEqual(self.read('IV-25_IO.MX.MO.OV.WM.BC.dcm').ImageType[0], 'DERIVED')
+        self.assertEqual(self.read('IV-25_IO.MX.MO.OV.WM.BC.dcm').file_meta.TransferSyntaxUID,
+                         pydicom.uid.ExplicitVRBigEndian)
+        self.assertEqual(self.read('small.dcm').file_meta.TransferSyntaxUID,
+                         pydicom.uid.ImplicitVRLittleEndian)
+
+    def test_convert(self):
+        self.assertEqual(controller.SimpleController(None).validate_csv(self.jsonl), [])
+        controller.SimpleController(None).bulk_convert_from_csv(self.jsonl, validate=True)
+        self.check_output()
+
+    def test_convert_in_workers(self):
+        self.assertEqual(main(['', '--workers', '2', self.jsonl]), 0)
+        self.check_output()
+
+    def test_options_override_defaults(self):
+        self.rows[2]['exif_orientation'] = False
+        self.write(self.rows[2:])
+        rows = [row for row, _ in controller.SimpleController(None)._read_csv(  # pylint: disable=protected-access
+            self.jsonl, ['21'], exif_orientation=True, mirror_correction=None)]
+        self.assertEqual(rows[0]['exif_orientation'], False)
+        self.assertEqual(rows[0]['mirror_correction'], 'auto')
+        self.assertEqual(rows[0]['teeth'], ['21'])
+
+    def test_validate(self):
+        del self.rows[0]['patient_sex']
+        self.rows[1]['dicom'] = {'NoSuchKeyword': 1}
+        self.rows[2]['teeth'] = ['11', '99']
+        self.rows[2]['transfer_syntax'] = pydicom.uid.JPEGBaseline8Bit
+        self.rows[2]['teth'] = ['11']
+        self.rows[1]['teth'] = ['11']
+        self.write(self.rows)
+        errors = manifest.validate(self.jsonl)
+        self.assertEqual([(e.row, e.column) for e in errors],
+                         [(1, 'patient_sex'), (2, 'dicom'), (2, 'teth'), (3, 'teeth'),
+                          (3, 'transfer_syntax')])
+        self.assertEqual(errors[2].message, 'unknown column')
+        self.assertEqual(errors[1].message, 'Unknown DICOM keyword NoSuchKeyword')
+
+    def test_malformed_line(self):
+        with open(self.jsonl, 'a') as f:
+            f.write('{"input_image_filename": \n')
+        with self.assertRaisesRegex(ValueError, 'line 5'):
+            list(manifest.read_jsonl(self.jsonl))
+
+    def test_sequences_per_row(self):
+        rows = []
+        for patient_id in ('AAA', 'BBB'):
+            row = dict(self.rows[0], dicom={
+                'OtherPatientIDsSequence': [{'PatientID': patient_id}]})
+            row['output_image_filename'] = os.path.join(self.tmpdir.name, patient_id + '.dcm')
+            rows.append(row)
+        self.write(rows)
+        controller.SimpleController(None).bulk_convert_from_csv(self.jsonl)
+        self.assertEqual([self.read(name + '.dcm').OtherPatientIDsSequence[0].PatientID
+                          for name in ('AAA', 'BBB')], ['AAA', 'BBB'])
@@ -0,0 +1,82 @@
+'''
+Unit tests for the per-file limits of bulk conversions.
+'''
+import unittest
+import logging
+import importlib.resources
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import dicom4ortho.controller as controller
+from dicom4ortho.__main__ import main
+from dicom4ortho.workers import MemoryLimitExceeded, TaskTimeout, WorkerPool, run_each
+
+
+def allocate(size):
+    return len(bytearray(size))
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+
+    def test_task_timeout(self):
+        with WorkerPool(processes=1, task_timeout=0.5) as pool:
+            start = time.monotonic()
+            with self.assertRaises(TaskTimeout):
+                pool.submit(time.sleep, 30).result()
+            self.assertLess(time.monotonic() - start, 10)
+            self.assertEqual(pool.submit(sum, [1, 2]).result(), 3)
+            self.assertEqual(pool.stats()['respawned'], 1)
+
+    @unittest.skipUnless(os.path.exists('/proc/self/statm'), "needs /proc")
+    def test_memory_limit(self):
+        with WorkerPool(processes=1, memory_limit=256 * 1024**2) as pool:
+            self.assertEqual(pool.submit(allocate, 1024**2).result(), 1024**2)
+            with self.assertRaises(MemoryLimitExceeded):
+                pool.submit(allocate, 4 * 1024**3).result()
+            self.assertEqual(pool.submit(allocate, 1024**2).result(), 1024**2)
+            self.assertEqual(pool.stats()['respawned'], 1)
+
+    def test_task_not_pickled(self):
+        with WorkerPool(processes=1) as pool:
+            with self.assertRaises(TypeError):
+                pool.submit(len, threading.Lock()).result(timeout=10)
+            self.assertEqual(pool.submit(len, [1, 2]).result(timeout=10), 2)
+            self.assertEqual(pool.stats()['respawned'], 0)
+
+    def test_run_each(self):
+        tasks = [(b'ab',), (None,), (b'c',)]
+        for workers in (None, 2):
+            self.assertEqual(list(run_each(len, tasks, workers)), [
+                ((b'ab',), 2, None),
+                ((None,), None, "TypeError: object of type 'NoneType' has no len()"),
+                ((b'c',), 1, None)])
+
+    def test_max_pixels(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+                resources = os.path.dirname(str(input_csv))
+            for name in os.listdir(resources):
+                if name.endswith('.png') or name.endswith('.csv'):
+                    shutil.copy(os.path.join(resources, name), tmpdir)
+            csv_input = os.path.join(tmpdir, 'input_from.csv')
+
+            c = controller.SimpleController(None)
+            c.bulk_convert_from_csv(csv_input, max_pixels=1000)
+            self.assertEqual(len(c.failed), 3)
+            self.assertIn('over the limit of 1000', c.failed[0][1])
+            self.assertFalse([name for name in os.listdir(tmpdir) if name.endswith('.dcm')])
+
+            c.bulk_convert_from_csv(csv_input, workers=2, timeout=60,
+                                    memory_limit=1024**3)
+            self.assertEqual(c.failed, [])
+            self.assertEqual(len([name for name in os.listdir(tmpdir)
+                                  if name.endswith('.dcm')]), 3)
+
+            self.assertEqual(main(['', csv_input, '--max-pixels', '1000', '--workers', '1']), 1)
@@ -0,0 +1,113 @@
+'''
+Unit tests for manifest validation.
+'''
+import unittest
+import logging
+import importlib.resources
+import os
+import shutil
+import tempfile
+import zipfile
+
+import dicom4ortho.controller as controller
+import dicom4ortho.manifest as manifest
+from dicom4ortho.__main__ import main
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+        for name in os.listdir(resources):
+            if name.endswith('.png'):
+                shutil.copy(os.path.join(resources, name), self.tmpdir.name)
+        with zipfile.ZipFile(os.path.join(self.tmpdir.name, 'export.zip'), 'w') as z:
+            z.write(os.path.join(resources, 'EV-01_EO.RP.LR.CO.png'), 'p1/EV01.png')
+        with open(os.path.join(resources, 'input_from.csv')) as f:
+            self.lines = f.read().splitlines()
+        self.csv = os.path.join(self.tmpdir.name, 'input_from.csv')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_csv(self, rows):
+        ''' The first row of the CSV file, with values replaced. '''
+        header = self.lines[0].split(',')
+        with open(self.csv, 'w') as f:
+            f.write(self.lines[0] + '\n')
+            for replace in rows:
+                values = self.lines[1].split(',')
+                for column, value in replace.items():
+                    values[header.index(column)] = value
+                f.write(','.join(values) + '\n')
+
+    def test_valid(self):
+        self.write_csv([{}, {'input_image_filename': 'export.zip!/p1/EV01.png'},
+                        {'image_type': 'RV-01', 'patient_sex': ''}])
+        self.assertEqual(controller.SimpleController(None).validate_csv(self.csv), [])
+
+    def test_errors(self):
+        self.write_csv([
+            {'patient_birthdate': '01/02/2000'},
+            {'image_type': 'EV-99', 'patient_sex': 'X'},
+            {},
+            {'study_instance_uid': '1.02.3', 'input_image_filename': 'missing.png'},
+            {'input_image_filename': 'export.zip!/p1/missing.png'},
+            {'input_image_filename': 'missing.zip!/EV01.png'},
+            {'patient_birthdate': '01/02/2000'},
+        ])
+        errors = controller.SimpleController(None).validate_csv(self.csv)
+        self.assertEqual([(e.row, e.column) for e in errors], [
+            (1, 'patient_birthdate'),
+            (2, 'image_type'),
+            (2, 'patient_sex'),
+            (4, 'input_image_filename'),
+            (4, 'study_instance_uid'),
+            (5, 'input_image_filename'),
+            (6, 'input_image_filename'),
+            (7, 'patient_birthdate'),
+        ])
+        self.assertEqual(errors[3].message, 'no such file')
+        self.assertTrue(errors[6].message.startswith('FileNotFoundError'))
+        self.assertEqual(controller.SimpleController(None).validate_csv(
+            self.csv, check_files=False)[3].column, 'study_instance_uid')
+
+    def test_missing_column(self):
+        with open(self.csv, 'w') as f:
+            for line in self.lines[:2]:
+                f.write(','.join(line.split(',')[1:]) + '\n')
+        errors = controller.SimpleController(None).validate_csv(self.csv)
+        self.assertEqual(errors, [manifest.ManifestError(
+            None, 'patient_firstname', None, 'missing column')])
+
+    def test_unknown_column(self):
+        with open(self.csv, 'w') as f:
+            f.write(self.lines[0] + ',teth\n' + self.lines[1] + ',11\n')
+        errors = controller.SimpleController(None).validate_csv(self.csv)
+        self.assertEqual(errors, [manifest.ManifestError(None, 'teth', None, 'unknown column')])
+
+    def test_fails_before_converting(self):
+        self.write_csv([{}, {'image_type': 'EV-99'}])
+        with self.assertRaises(manifest.InvalidManifest) as cm:
+            controller.SimpleController(None).bulk_convert_from_csv(self.csv, validate=True)
+        self.assertEqual(len(cm.exception.errors), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'EV-01_EO.RP.LR.CO.dcm')))
+        self.assertEqual(main(['', '--check-manifest', self.csv]), 1)
+        self.assertEqual(main(['', self.csv]), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, 'EV-01_EO.RP.LR.CO.dcm')))
+
+    def test_check_column(self):
+        values = ['2000-01-01', '2000-13-01'] * 1000 + [None]
+        calls = []
+
+        def check(value):
+            calls.append(value)
+            manifest._check_date(value)  # pylint: disable=protected-access
+        errors = list(manifest.check_column(values, check))
+        self.assertEqual(len(errors), 1001)
+        self.assertEqual(errors[-1][0], 2000)
+        self.assertEqual(len(calls), 3)
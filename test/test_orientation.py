@@ -0,0 +1,108 @@
+'''
+Unit tests for EXIF orientation and mirror correction.
+'''
+import unittest
+import logging
+import io
+
+import PIL.Image
+
+import dicom4ortho.controller as controller
+from dicom4ortho.model import EXIF_ORIENTATION_TAG, combine_transposes, parse_transpose
+from dicom4ortho.m_orthodontic_photograph import OrthodonticPhotograph
+
+TRANSPOSES = [None] + list(PIL.Image.Transpose)
+
+
+def make_image(size=(3, 2)):
+    im = PIL.Image.new('L', size)
+    im.putdata(range(1, size[0] * size[1] + 1))
+    return im
+
+
+def png_with_orientation(im, orientation):
+    exif = PIL.Image.Exif()
+    exif[EXIF_ORIENTATION_TAG] = orientation
+    buffer = io.BytesIO()
+    im.save(buffer, 'PNG', exif=exif)
+    return buffer.getvalue()
+
+
+def transpose(im, method):
+    return im if method is None else im.transpose(method)
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        controller.SimpleController(None)
+
+    def test_combine_transposes(self):
+        im = make_image()
+        for first in TRANSPOSES:
+            for second in TRANSPOSES:
+                combined = transpose(im, combine_transposes(first, second))
+                expected = transpose(transpose(im, first), second)
+                self.assertEqual((combined.size, combined.tobytes()),
+                                 (expected.size, expected.tobytes()), (first, second))
+        self.assertIsNone(combine_transposes(PIL.Image.Transpose.ROTATE_90,
+                                             PIL.Image.Transpose.ROTATE_270))
+
+    def test_parse_transpose(self):
+        self.assertEqual(parse_transpose('flip-left-right'), PIL.Image.Transpose.FLIP_LEFT_RIGHT)
+        self.assertIsNone(parse_transpose('no'))
+        with self.assertRaises(ValueError):
+            parse_transpose('sideways')
+
+    def test_exif_orientation(self):
+        im = make_image()
+        data = png_with_orientation(im, 6)
+        photo = OrthodonticPhotograph(image_type='EV01', input_image=data)
+        photo.set_image()
+        self.assertEqual((photo.dataset.Columns, photo.dataset.Rows), (3, 2))
+        self.assertEqual(photo.dataset.ImageType[0], 'ORIGINAL')
+
+        photo = OrthodonticPhotograph(image_type='EV01', input_image=data,
+                                      exif_orientation=True)
+        photo.set_image()
+        self.assertEqual((photo.dataset.Columns, photo.dataset.Rows), (2, 3))
+        self.assertEqual(photo.dataset.PixelData,
+                         im.transpose(PIL.Image.Transpose.ROTATE_270).tobytes())
+        self.assertEqual(photo.dataset.ImageType[0], 'DERIVED')
+
+    def test_mirror_correction(self):
+        im = make_image((4, 2))
+        photo = OrthodonticPhotograph(image_type='IV24', input_image=im)
+        uncorrected_key = photo.template_key
+        self.assertEqual(photo.dataset.ImageView[0].CodeValue, '789135000')
+        photo = OrthodonticPhotograph(image_type='IV24', input_image=im,
+                                      mirror_correction=True)
+        photo.set_image()
+        self.assertEqual(photo.dataset.PixelData,
+                         im.transpose(PIL.Image.Transpose.FLIP_TOP_BOTTOM).tobytes())
+        self.assertEqual(photo.dataset.ImageView[0].CodeValue, '787610003')
+        self.assertEqual(photo.dataset.ImageType[0], 'DERIVED')
+        self.assertNotEqual(photo.template_key, uncorrected_key)
+
+        photo = OrthodonticPhotograph(image_type='IV02', input_image=im,
+                                      mirror_correction='auto')
+        photo.set_image()
+        self.assertEqual(photo.dataset.PixelData,
+                         im.transpose(PIL.Image.Transpose.FLIP_LEFT_RIGHT).tobytes())
+
+        with self.assertRaises(ValueError):
+            OrthodonticPhotograph(image_type='EV01', input_image=im,
+                                  mirror_correction=True).set_image()
+
+    def test_exif_and_mirror_in_one_transpose(self):
+        im = make_image((4, 2))
+        photo = OrthodonticPhotograph(image_type='IV25', input_image=png_with_orientation(im, 8),
+                                      exif_orientation='yes',
+                                      mirror_correction='FLIP_LEFT_RIGHT')
+        photo.set_image()
+        expected = im.transpose(PIL.Image.Transpose.ROTATE_90).transpose(
+            PIL.Image.Transpose.FLIP_LEFT_RIGHT)
+        self.assertEqual((photo.dataset.Columns, photo.dataset.Rows), expected.size)
+        self.assertEqual(photo.dataset.PixelData, expected.tobytes())
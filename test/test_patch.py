@@ -0,0 +1,105 @@
+'''
+Unit tests for patching existing DICOM files.
+'''
+import unittest
+import logging
+import importlib.resources
+import json
+import os
+import shutil
+import tempfile
+
+import pydicom
+
+import dicom4ortho.controller as controller
+import dicom4ortho.dicomfile as dicomfile
+import dicom4ortho.patch as patch
+from dicom4ortho.__main__ import main
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+        for name in os.listdir(resources):
+            if name.endswith('.png') or name.endswith('.csv'):
+                shutil.copy(os.path.join(resources, name), self.tmpdir.name)
+        controller.SimpleController(None).bulk_convert_from_csv(
+            os.path.join(self.tmpdir.name, 'input_from.csv'))
+        self.files = sorted(dicomfile.dicom_files([self.tmpdir.name]))
+        self.pixels = [pydicom.dcmread(filename).PixelData for filename in self.files]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_patch_query(self):
+        first = pydicom.dcmread(self.files[0])
+        where = {'SOPInstanceUID': first.SOPInstanceUID[:-3] + '*',
+                 'PatientID': str(first.PatientID)}
+        results = patch.patch([self.tmpdir.name], {'PatientID': '12345'}, where=where,
+                              workers=2)
+        self.assertEqual([result.patched for result in results], [True, False, False])
+        datasets = [pydicom.dcmread(filename) for filename in self.files]
+        self.assertEqual([str(ds.PatientID) for ds in datasets],
+                         ['12345', str(first.PatientID), str(first.PatientID)])
+        self.assertEqual([ds.PixelData for ds in datasets], self.pixels)
+        self.assertEqual(datasets[0].StudyInstanceUID, first.StudyInstanceUID)
+        self.assertFalse([name for name in os.listdir(self.tmpdir.name) if name.endswith('.tmp')])
+
+        self.assertEqual(main(['', 'patch', self.tmpdir.name, '--workers', '1',
+                               '--set', 'StudyDescription=Final records',
+                               '--where', 'PatientID=12345']), 0)
+        self.assertEqual(pydicom.dcmread(self.files[0]).StudyDescription, 'Final records')
+        self.assertNotEqual(pydicom.dcmread(self.files[1]).StudyDescription, 'Final records')
+        self.assertEqual(main(['', 'patch', self.tmpdir.name, '--set', 'NoSuchKeyword=1']), 2)
+
+    def test_patch_manifest(self):
+        csv_manifest = os.path.join(self.tmpdir.name, 'patch.csv')
+        with open(csv_manifest, 'w') as f:
+            f.write('filename,PatientID,StudyDescription\n')
+            f.write('{},A1,\n'.format(os.path.basename(self.files[0])))
+            f.write('{},,Corrected\n'.format(os.path.basename(self.files[1])))
+        results = patch.patch(manifest_input=csv_manifest, attributes={'PatientSex': 'F'})
+        self.assertEqual([result.error for result in results], [None, None])
+        first, second = (pydicom.dcmread(filename) for filename in self.files[:2])
+        self.assertEqual((first.PatientID, first.PatientSex), ('A1', 'F'))
+        self.assertEqual((second.StudyDescription, second.PatientSex), ('Corrected', 'F'))
+        self.assertNotEqual(second.PatientID, 'A1')
+
+        jsonl_manifest = os.path.join(self.tmpdir.name, 'patch.jsonl')
+        uid = pydicom.uid.generate_uid()
+        with open(jsonl_manifest, 'w') as f:
+            f.write(json.dumps({'filename': os.path.basename(self.files[2]),
+                                'dicom': {'SOPInstanceUID': uid, 'PatientSex': None}}) + '\n')
+            f.write(json.dumps({'filename': 'missing.dcm', 'PatientID': 'x'}) + '\n')
+        results = patch.patch(manifest_input=jsonl_manifest, workers=2)
+        self.assertIsNone(results[0].error)
+        self.assertIn('FileNotFoundError', results[1].error)
+        third = pydicom.dcmread(self.files[2])
+        self.assertEqual(third.SOPInstanceUID, uid)
+        self.assertEqual(third.file_meta.MediaStorageSOPInstanceUID, uid)
+        self.assertEqual(third.PatientSex, '')
+        self.assertEqual(third.PixelData, self.pixels[2])
+
+    def test_patch_listed_twice(self):
+        # Each file is found under the directory, and listed in the
+        # manifest, the first one twice.
+        csv_manifest = os.path.join(self.tmpdir.name, 'patch.csv')
+        with open(csv_manifest, 'w') as f:
+            f.write('filename,StudyDescription,PatientSex\n')
+            for i, filename in enumerate(self.files):
+                f.write('{},Study {},\n'.format(os.path.basename(filename), i))
+            f.write('./{},,F\n'.format(os.path.basename(self.files[0])))
+        results = patch.patch([self.tmpdir.name], {'PatientID': 'P'},
+                              manifest_input=csv_manifest, workers=4)
+        self.assertEqual([result.filename for result in results], self.files)
+        self.assertTrue(all(result.patched for result in results))
+        datasets = [pydicom.dcmread(filename) for filename in self.files]
+        self.assertEqual([str(ds.PatientID) for ds in datasets], ['P'] * 3)
+        self.assertEqual([ds.StudyDescription for ds in datasets],
+                         ['Study 0', 'Study 1', 'Study 2'])
+        self.assertEqual(datasets[0].PatientSex, 'F')
@@ -0,0 +1,76 @@
+'''
+Unit tests for preflight checks and memory-aware scheduling.
+'''
+import unittest
+import logging
+import importlib.resources
+import os
+import shutil
+import tempfile
+import time
+
+import pydicom
+
+import dicom4ortho.controller as controller
+import dicom4ortho.preflight as preflight
+from dicom4ortho.scheduler import MemoryScheduler, Task
+from dicom4ortho.workers import WorkerPool
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+        for name in os.listdir(resources):
+            if name.endswith(('.png', '.csv')):
+                shutil.copy(os.path.join(resources, name), self.tmpdir.name)
+        self.csv = os.path.join(self.tmpdir.name, 'input_from.csv')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_probe(self):
+        probes = controller.SimpleController(None).preflight_csv(self.csv)
+        self.assertEqual([(p.width, p.height, p.mode) for p in probes][1],
+                         (345, 506, 'L'))
+        self.assertEqual(probes[1].memory, preflight.estimate_memory(345, 506, 'L'))
+        summary = preflight.summarize(probes + [preflight.probe('missing.png')])
+        self.assertEqual((summary['images'], summary['failed']), (4, 1))
+        self.assertEqual(summary['modes'], {'L': 3})
+        self.assertEqual(summary['memory'], sum(p.memory for p in probes))
+
+    def test_scheduler_budget(self):
+        tasks = [Task(cost, time.sleep, (0.05,), cost) for cost in (1, 5, 2, 4, 3, 1)]
+        with WorkerPool(processes=3) as pool:
+            scheduler = MemoryScheduler(pool, budget=6)
+            finished = [task.tag for task, future in scheduler.run(tasks)
+                        if future.result() is None]
+        self.assertEqual(sorted(finished), [1, 1, 2, 3, 4, 5])
+        self.assertLessEqual(scheduler.peak, 6)
+        # The largest task starts first, with what still fits beside it.
+        self.assertIn(finished[0], (5, 1))
+
+    def test_scheduler_oversized_task_runs_alone(self):
+        with WorkerPool(processes=2) as pool:
+            scheduler = MemoryScheduler(pool, budget=10)
+            results = list(scheduler.run([Task(50, time.sleep, (0,), 'big'),
+                                          Task(1, time.sleep, (0,), 'small')]))
+        self.assertEqual([task.tag for task, _ in results], ['big', 'small'])
+        self.assertEqual(scheduler.peak, 50)
+
+    def test_bulk_convert_in_workers(self):
+        with open(self.csv, 'a') as f:
+            f.write('\nJohn,Doe,99999,M,2000-01-01,Edward,Angle,EV-01,Apple,missing.png,'
+                    '1.2.3,Initial Visit,1.2.3.4,Orthodontic Extraoral Series')
+        c = controller.SimpleController(None)
+        c.bulk_convert_from_csv(self.csv, workers=2, memory_budget=64 * 1024**2)
+        self.assertEqual(c.preflight['images'], 4)
+        self.assertEqual([os.path.basename(f) for f, _ in c.failed], ['missing.png'])
+        ds = pydicom.dcmread(os.path.join(self.tmpdir.name, 'EV-17_EO.FF.LC.CO.dcm'))
+        self.assertEqual((ds.Columns, ds.Rows), (345, 506))
+        for name in ('EV-01_EO.RP.LR.CO.dcm', 'IV-25_IO.MX.MO.OV.WM.BC.dcm'):
+            self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name, name)))
@@ -0,0 +1,99 @@
+'''
+Unit tests for orthodontic radiographs.
+'''
+import unittest
+import logging
+import io
+import os
+
+import PIL.Image
+import pydicom
+from pynetdicom.sop_class import DigitalXRayImageStorageForPresentation  # pylint: disable=no-name-in-module
+
+import dicom4ortho.controller as controller
+from dicom4ortho.fastwriter import TemplateWriter
+from dicom4ortho.model import window_from_histogram
+from dicom4ortho.m_orthodontic_radiograph import OrthodonticRadiograph
+from test.helpers import make_metadata
+
+
+def gradient(mode, size, maximum):
+    ''' A horizontal gradient from 0 to maximum.
+    '''
+    width, height = size
+    row = [x * maximum // (width - 1) for x in range(width)]
+    im = PIL.Image.new('I', size)
+    im.putdata(row * height)
+    return im.convert(mode) if mode != 'I' else im
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+
+    def test_12_bit_png(self):
+        image = io.BytesIO()
+        gradient('I;16', (64, 8), 4095).save(image, 'PNG')
+        dicom_bytes = controller.SimpleController(None).convert_image_to_dicom_bytes(
+            make_metadata('RV02', manufacturer='Planmeca',
+                          series_description='Orthodontic Radiographs',
+                          input_image=image.getvalue()))
+        ds = pydicom.dcmread(io.BytesIO(dicom_bytes))
+        self.assertEqual(ds.SOPClassUID, DigitalXRayImageStorageForPresentation)
+        self.assertEqual(ds.Modality, 'DX')
+        self.assertEqual((ds.BitsAllocated, ds.BitsStored, ds.HighBit), (16, 12, 11))
+        self.assertEqual(ds.PhotometricInterpretation, 'MONOCHROME2')
+        self.assertEqual(ds.pixel_array.max(), 4095)
+        self.assertEqual(ds.pixel_array[0, 1], 4095 // 63)
+        self.assertAlmostEqual(ds.WindowCenter, 2048, delta=64)
+        self.assertAlmostEqual(ds.WindowWidth, 4095, delta=128)
+        self.assertEqual(ds.ImageComments, 'RV02^Lateral Cephalometric')
+
+    def test_one_template(self):
+        # Radiographs of different pixel ranges get different windows and
+        # Bits Stored, but the same template.
+        writer = TemplateWriter()
+        for i in range(20):
+            radiograph = OrthodonticRadiograph(
+                image_type='RV02', input_image=gradient('I;16', (64, 8), 255 + 200 * i))
+            radiograph.set_image()
+            self.assertEqual(radiograph.to_bytes(writer=writer), radiograph.to_bytes())
+        self.assertEqual(len(writer), 1)
+
+    def test_transfer_syntaxes(self):
+        image = gradient('I;16', (64, 8), 4095)
+        for transfer_syntax in (pydicom.uid.ImplicitVRLittleEndian,
+                                pydicom.uid.ExplicitVRLittleEndian,
+                                pydicom.uid.ExplicitVRBigEndian):
+            radiograph = OrthodonticRadiograph(
+                image_type='RV02', input_image=image, transfer_syntax=transfer_syntax)
+            radiograph.set_image()
+            ds = pydicom.dcmread(io.BytesIO(radiograph.to_bytes(writer=TemplateWriter())))
+            self.assertEqual(ds.file_meta.TransferSyntaxUID, transfer_syntax)
+            self.assertEqual(ds.pixel_array[0].tolist(), [x * 4095 // 63 for x in range(64)])
+        with self.assertRaises(ValueError):
+            OrthodonticRadiograph(image_type='RV02', transfer_syntax=pydicom.uid.RLELossless)
+
+    def test_modes(self):
+        controller.SimpleController(None)
+        for mode, maximum, bits in (('I;16', 65535, 16), ('I;16B', 1000, 10),
+                                    ('I', 70000, 16), ('L', 200, 8), ('RGB', 255, 8)):
+            if mode == 'RGB':
+                image = gradient('L', (32, 4), maximum).convert('RGB')
+            else:
+                image = gradient(mode, (32, 4), maximum)
+            photo = OrthodonticRadiograph(image_type='RV01', input_image=image)
+            photo.set_image()
+            ds = photo.dataset
+            self.assertEqual(ds.BitsStored, bits, mode)
+            self.assertEqual(ds.Modality, 'PX')
+            self.assertEqual(len(ds.PixelData), 32 * 4 * ds.BitsAllocated // 8)
+
+    def test_window_from_histogram(self):
+        # The single outliers at both ends are left out.
+        histogram = [1] + [0] * 9 + [98] * 80 + [0] * 9 + [1]
+        center, width = window_from_histogram(histogram, 0, 100)
+        self.assertEqual((center, width), (50, 80))
+        self.assertEqual(window_from_histogram([5], 7, 7), (7, 1))
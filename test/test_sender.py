@@ -0,0 +1,80 @@
+'''
+Unit tests for the multi-association sender.
+
+A local pynetdicom Storage SCP with injected latency stands in for the PACS.
+'''
+import unittest
+import logging
+import threading
+import time
+
+from pynetdicom import AE, evt
+# pylint: disable=no-name-in-module
+from pynetdicom.sop_class import VLPhotographicImageStorage
+
+import dicom4ortho.sender as sender
+from test.helpers import make_dataset
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.received = []
+        self.refuse = set()
+        self.lock = threading.Lock()
+        self.latency = 0.02
+
+        def handle_store(event):
+            time.sleep(self.latency)
+            sop_instance_uid = event.request.AffectedSOPInstanceUID
+            if sop_instance_uid in self.refuse:
+                return 0xA700
+            with self.lock:
+                self.received.append(sop_instance_uid)
+            return 0x0000
+
+        ae = AE()
+        ae.add_supported_context(VLPhotographicImageStorage)
+        self.scp = ae.start_server(
+            ('127.0.0.1', 0), block=False,
+            evt_handlers=[(evt.EVT_C_STORE, handle_store)])
+        self.port = self.scp.server_address[1]
+
+    def tearDown(self):
+        self.scp.shutdown()
+
+    def test_send_fans_out(self):
+        datasets = [make_dataset() for _ in range(12)]
+        with sender.MultiAssociationSender(
+                '127.0.0.1', self.port, associations=3, max_pending=4) as s:
+            futures = [s.send(ds) for ds in datasets]
+        self.assertEqual([f.result() for f in futures], [0x0000] * 12)
+        self.assertEqual(sorted(self.received),
+                         sorted(ds.SOPInstanceUID for ds in datasets))
+
+        stats = s.stats()
+        self.assertEqual(len(stats), 3)
+        self.assertEqual(sum(a['sent'] for a in stats), 12)
+        for a in stats:
+            self.assertGreater(a['sent'], 0)
+            self.assertEqual(a['failed'], 0)
+            self.assertGreaterEqual(a['p50'], self.latency)
+
+    def test_failures_are_counted(self):
+        datasets = [make_dataset() for _ in range(4)]
+        self.refuse.add(datasets[1].SOPInstanceUID)
+        with sender.MultiAssociationSender(
+                '127.0.0.1', self.port, associations=2) as s:
+            futures = [s.send(ds) for ds in datasets]
+        with self.assertRaises(sender.StoreError) as e:
+            futures[1].result()
+        self.assertEqual(e.exception.status, 0xA700)
+        self.assertEqual(sum(a['failed'] for a in s.stats()), 1)
+        self.assertEqual(sum(a['sent'] for a in s.stats()), 3)
+
+    def test_percentile(self):
+        self.assertEqual(sender.percentile([3, 1, 2, 4], 50), 2)
+        self.assertEqual(sender.percentile([3, 1, 2, 4], 99), 4)
+        self.assertIsNone(sender.percentile([], 50))
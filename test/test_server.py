@@ -0,0 +1,127 @@
+'''
+Unit tests for the HTTP conversion service and its worker pool.
+'''
+import unittest
+import logging
+import http.client
+import importlib.resources
+import io
+import json
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from unittest import mock
+
+import pydicom
+
+import dicom4ortho.server as server
+from dicom4ortho.workers import TaskTimeout, WorkerPool
+from test.helpers import make_metadata
+
+
+def form_data(fields):
+    boundary = uuid.uuid4().hex
+    body = b''
+    for name, (content_type, value) in fields.items():
+        body += ('--{}\r\nContent-Disposition: form-data; name="{}"\r\n'
+                 'Content-Type: {}\r\n\r\n'.format(boundary, name, content_type)).encode()
+        body += value + b'\r\n'
+    body += '--{}--\r\n'.format(boundary).encode()
+    return 'multipart/form-data; boundary={}'.format(boundary), body
+
+
+class Test(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        cls.server = server.ConversionServer(('127.0.0.1', 0), workers=2)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1])
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        result = response.status, response.getheader('Content-Type'), response.read()
+        conn.close()
+        return result
+
+    def test_convert(self):
+        with importlib.resources.path("test.resources", "EV-17_EO.FF.LC.CO.png") as png:
+            with open(png, 'rb') as f:
+                image = f.read()
+        content_type, body = form_data({
+            'metadata': ('application/json', json.dumps(make_metadata('EV17')).encode()),
+            'image': ('image/png', image),
+        })
+        status, response_type, dicom_bytes = self.request(
+            'POST', '/convert', body, {'Content-Type': content_type})
+        self.assertEqual(status, 200)
+        self.assertEqual(response_type, 'application/dicom')
+        ds = pydicom.dcmread(io.BytesIO(dicom_bytes))
+        self.assertEqual((ds.Columns, ds.Rows), (345, 506))
+        self.assertEqual(ds.PatientID, '99999')
+
+        status, _, health = self.request('GET', '/health')
+        self.assertEqual(status, 200)
+        health = json.loads(health)
+        self.assertEqual(health['workers'], 2)
+        self.assertGreaterEqual(health['completed'], 1)
+        self.assertIsNotNone(health['latency_median'])
+
+    def test_bad_requests(self):
+        content_type, body = form_data({'image': ('image/png', b'')})
+        status, _, _ = self.request('POST', '/convert', body, {'Content-Type': content_type})
+        self.assertEqual(status, 400)
+
+        metadata = make_metadata('EV17')
+        metadata['image_type'] = 'XX99'
+        content_type, body = form_data({
+            'metadata': ('application/json', json.dumps(metadata).encode()),
+            'image': ('image/png', b'not an image'),
+        })
+        status, _, error = self.request('POST', '/convert', body, {'Content-Type': content_type})
+        self.assertEqual(status, 422)
+        self.assertIn('error', json.loads(error))
+
+    def test_request_too_large(self):
+        status, _, error = self.request('POST', '/convert', b'', {
+            'Content-Type': 'multipart/form-data; boundary=x',
+            'Content-Length': str(self.server.max_request_size + 1)})
+        self.assertEqual(status, 413)
+        self.assertIn('error', json.loads(error))
+
+    def test_worker_failure(self):
+        failed = Future()
+        failed.set_exception(TaskTimeout("Worker process killed after 1 s"))
+        content_type, body = form_data({
+            'metadata': ('application/json', json.dumps(make_metadata('EV17')).encode()),
+            'image': ('image/png', b''),
+        })
+        with mock.patch.object(self.server.pool, 'submit', return_value=failed):
+            status, _, error = self.request(
+                'POST', '/convert', body, {'Content-Type': content_type})
+        self.assertEqual(status, 500)
+        self.assertIn('TaskTimeout', json.loads(error)['error'])
+
+    def test_pool_queue_limit(self):
+        with WorkerPool(processes=1, max_queue=1) as pool:
+            running = pool.submit(time.sleep, 0.3)
+            # Wait for the worker to pick up the first task.
+            while pool.stats()['busy'] == 0:
+                time.sleep(0.01)
+            queued = pool.submit(time.sleep, 0)
+            with self.assertRaises(queue.Full):
+                pool.submit(time.sleep, 0)
+            running.result()
+            queued.result()
+        self.assertEqual(pool.stats()['completed'], 2)
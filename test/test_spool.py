@@ -0,0 +1,93 @@
+'''
+Unit tests for the outbound spool.
+'''
+import unittest
+import logging
+import os
+import tempfile
+import time
+
+from pynetdicom import AE, evt
+# pylint: disable=no-name-in-module
+from pynetdicom.sop_class import VLPhotographicImageStorage
+
+import dicom4ortho.sender as sender
+import dicom4ortho.spool as spool
+from test.helpers import make_dataset
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.received = []
+        self.scp = None
+
+    def tearDown(self):
+        if self.scp is not None:
+            self.scp.shutdown()
+        self.tmpdir.cleanup()
+
+    def start_scp(self, port=0):
+        def handle_store(event):
+            self.received.append(event.request.AffectedSOPInstanceUID)
+            return 0x0000
+
+        ae = AE()
+        ae.add_supported_context(VLPhotographicImageStorage)
+        self.scp = ae.start_server(
+            ('127.0.0.1', port), block=False,
+            evt_handlers=[(evt.EVT_C_STORE, handle_store)])
+        return self.scp.server_address[1]
+
+    def stop_scp(self):
+        self.scp.shutdown()
+        self.scp = None
+
+    def test_deduplicates(self):
+        ds = make_dataset()
+        with spool.OutboundSpool(self.tmpdir.name) as s:
+            self.assertTrue(s.enqueue(ds))
+            self.assertFalse(s.enqueue(ds))
+            self.assertTrue(s.enqueue(make_dataset()))
+            self.assertEqual(s.pending(), 2)
+
+    def test_missing_file(self):
+        ds = make_dataset()
+        with spool.OutboundSpool(self.tmpdir.name, base_delay=0.01) as s:
+            s.enqueue(ds)
+            os.remove(os.path.join(self.tmpdir.name, ds.SOPInstanceUID + '.dcm'))
+            with sender.MultiAssociationSender('127.0.0.1', 1, associations=1) as dicom_sender:
+                self.assertEqual(s.drain(dicom_sender, wait=True), (0, 1))
+            self.assertEqual(s.pending(), 0)
+            self.assertEqual(s.lost(), [ds.SOPInstanceUID])
+            self.assertTrue(s.enqueue(ds))
+            self.assertEqual((s.pending(), s.lost()), (1, []))
+
+    def test_survives_outage_and_restart(self):
+        port = self.start_scp()
+        self.stop_scp()
+
+        ds = make_dataset()
+        with spool.OutboundSpool(self.tmpdir.name, base_delay=0.2) as s:
+            s.enqueue(ds)
+            with sender.MultiAssociationSender('127.0.0.1', port, associations=1) as dicom_sender:
+                self.assertEqual(s.drain(dicom_sender), (0, 1))
+            self.assertEqual(s.pending(), 1)
+
+        # Restart: the instance is still there, and is sent once the PACS is
+        # back and the retry delay has expired.
+        self.start_scp(port)
+        with spool.OutboundSpool(self.tmpdir.name, base_delay=0.2) as s:
+            self.assertEqual(s.pending(), 1)
+            with sender.MultiAssociationSender('127.0.0.1', port, associations=1) as dicom_sender:
+                self.assertEqual(s.drain(dicom_sender), (0, 0))
+                time.sleep(0.25)
+                self.assertEqual(s.drain(dicom_sender), (1, 0))
+            self.assertEqual(s.pending(), 0)
+            self.assertFalse(s.enqueue(ds))
+        self.assertEqual(self.received, [ds.SOPInstanceUID])
+        self.assertFalse(os.path.exists(
+            os.path.join(self.tmpdir.name, ds.SOPInstanceUID + '.dcm')))
@@ -0,0 +1,107 @@
+'''
+Unit tests for the STOW-RS client.
+
+A small local HTTP server stands in for the DICOMweb origin server.
+'''
+import unittest
+import logging
+import email.parser
+import io
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pydicom
+
+import dicom4ortho.stow as stow
+from test.helpers import make_dataset
+
+
+class StowHandler(BaseHTTPRequestHandler):
+    ''' Stores nothing. Refuses instances whose PatientID is FAIL.
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+        stored, failed = [], []
+        for part in message.get_payload():
+            ds = pydicom.dcmread(io.BytesIO(part.get_payload(decode=True)))
+            item = {'00081155': {'vr': 'UI', 'Value': [ds.SOPInstanceUID]}}
+            if ds.PatientID == 'FAIL':
+                item['00081197'] = {'vr': 'US', 'Value': [0xA700]}
+                failed.append(item)
+            else:
+                stored.append(item)
+        with self.server.lock:
+            self.server.batches.append(len(stored) + len(failed))
+        response = json.dumps({
+            '00081199': {'vr': 'SQ', 'Value': stored},
+            '00081198': {'vr': 'SQ', 'Value': failed},
+        }).encode()
+        self.send_response(202 if failed else 200)
+        self.send_header('Content-Type', 'application/dicom+json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StowHandler)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        self.server.batches = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/dicom-web/studies'.format(
+            self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_batches_and_keep_alive(self):
+        datasets = [make_dataset() for _ in range(10)]
+        with stow.StowClient(self.url, batch_size=3, parallelism=2) as client:
+            results = client.store(datasets)
+        self.assertEqual(sorted(self.server.batches), [1, 3, 3, 3])
+        self.assertLessEqual(self.server.connections, 2)
+        self.assertTrue(all(r.success for r in results))
+        self.assertEqual(sorted(r.sop_instance_uid for r in results),
+                         sorted(ds.SOPInstanceUID for ds in datasets))
+
+    def test_files_and_failures(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            instances = []
+            for patient_id in ('1', 'FAIL', '3'):
+                ds = make_dataset(patient_id)
+                filename = os.path.join(tmpdir, ds.SOPInstanceUID + '.dcm')
+                ds.save_as(filename, write_like_original=False)
+                instances.append(filename)
+            refused = make_dataset('FAIL')
+            buffer = io.BytesIO()
+            refused.save_as(buffer, write_like_original=False)
+            instances.append(buffer.getvalue())
+
+            with stow.StowClient(self.url, batch_size=10) as client:
+                results = client.store(instances)
+        self.assertEqual(len(results), 4)
+        failed = [r for r in results if not r.success]
+        self.assertEqual(len(failed), 2)
+        self.assertIn(refused.SOPInstanceUID, [r.sop_instance_uid for r in failed])
+        self.assertEqual(failed[0].reason, '0xA700')
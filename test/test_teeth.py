@@ -0,0 +1,103 @@
+'''
+Unit tests for tooth sets.
+'''
+import unittest
+import logging
+import importlib.resources
+import os
+import shutil
+import tempfile
+
+import PIL.Image
+import pydicom
+
+import dicom4ortho.controller as controller
+import dicom4ortho.defaults as defaults
+from dicom4ortho.m_tooth_codes import TEETH, ToothSet
+from dicom4ortho.m_orthodontic_photograph import OrthodonticPhotograph
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        controller.SimpleController(None)
+
+    def test_parse(self):
+        self.assertEqual(list(ToothSet.parse('11-18')),
+                         ['11', '12', '13', '14', '15', '16', '17', '18'])
+        self.assertEqual(list(ToothSet.parse('13-23')), ['11', '12', '13', '21', '22', '23'])
+        self.assertEqual(ToothSet.parse('33-43'), ToothSet.parse('43-33'))
+        self.assertEqual(ToothSet.parse(['Q1', 'q2']), ToothSet.parse('UPPER'))
+        self.assertEqual(list(ToothSet.parse('85, 21;11')), ['11', '21', '85'])
+        self.assertEqual(len(ToothSet.parse('PERMANENT DECIDUOUS')), len(TEETH))
+        self.assertEqual(len(ToothSet.parse('Q5')), 5)
+        for invalid in ('19', '11-21x', '18-38', 'Q9', '11-55'):
+            with self.assertRaises(ValueError, msg=invalid):
+                ToothSet.parse(invalid)
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(list(ToothSet.parse(['19', '11'], strict=False)), ['11'])
+
+    def test_set_operations(self):
+        upper = ToothSet.parse('UPPER')
+        incisors = ToothSet.parse('12-22 42-32')
+        self.assertEqual(list(upper & incisors), ['11', '12', '21', '22'])
+        self.assertEqual(list(incisors - upper), ['31', '32', '41', '42'])
+        self.assertEqual(upper | incisors, ToothSet.parse('UPPER 31 32 41 42'))
+        self.assertIn('21', upper)
+        self.assertNotIn('31', upper)
+        self.assertFalse(ToothSet())
+
+    def test_sequence_not_shared(self):
+        image = PIL.Image.new('L', (2, 2))
+        first = OrthodonticPhotograph(image_type='IV25', input_image=image, teeth='11-13')
+        second = OrthodonticPhotograph(image_type='IV25', input_image=image,
+                                       teeth=['13', '12', '11'])
+        codes = [item.CodeValue for item in first.dataset.PrimaryAnatomicStructureSequence]
+        self.assertEqual(codes, ['245575001', '245574002', '245572003'])
+        self.assertEqual(first.template_key, second.template_key)
+        # Each image has its own items.
+        second.dataset.PrimaryAnatomicStructureSequence[0].CodeMeaning = 'changed'
+        self.assertEqual(first.dataset.PrimaryAnatomicStructureSequence[0].CodeMeaning[:2], '11')
+        third = OrthodonticPhotograph(image_type='IV25', input_image=image, teeth='11')
+        self.assertEqual(third.dataset.PrimaryAnatomicStructureSequence[0].CodeMeaning[:2], '11')
+        first.add_teeth('21')
+        self.assertEqual(len(first.dataset.PrimaryAnatomicStructureSequence), 4)
+        self.assertEqual(len(second.dataset.PrimaryAnatomicStructureSequence), 3)
+
+    def test_allowed_teeth(self):
+        image = PIL.Image.new('L', (2, 2))
+        photo = OrthodonticPhotograph(image_type='IV01', input_image=image,
+                                      teeth=defaults.ADD_MAX_ALLOWED_TEETH)
+        self.assertEqual(len(photo.dataset.PrimaryAnatomicStructureSequence), 16)
+        with self.assertLogs(level='WARNING') as logs:
+            OrthodonticPhotograph(image_type='IV01', input_image=image, teeth='11 21')
+        self.assertIn('21', logs.output[0])
+        with self.assertLogs(level='WARNING') as logs:
+            photo = OrthodonticPhotograph(image_type='IV25', input_image=image,
+                                          teeth=['11', '19', 'X'])
+        self.assertEqual(len(photo.dataset.PrimaryAnatomicStructureSequence), 1)
+        self.assertEqual(len(logs.output), 2)
+
+    def test_teeth_column(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+                resources = os.path.dirname(str(input_csv))
+            for name in os.listdir(resources):
+                if name.endswith('.png'):
+                    shutil.copy(os.path.join(resources, name), tmpdir)
+            with open(os.path.join(resources, 'input_from.csv')) as f:
+                lines = f.read().splitlines()
+            csv_input = os.path.join(tmpdir, 'input_from.csv')
+            with open(csv_input, 'w') as f:
+                f.write(lines[0] + ',teeth\n')
+                f.write(lines[1] + ',\n')
+                f.write(lines[2] + ',\n')
+                f.write(lines[3] + ',"13-23 Q3"\n')
+            controller.SimpleController(None).bulk_convert_from_csv(csv_input, teeth=['16'])
+            ds = pydicom.dcmread(os.path.join(tmpdir, 'IV-25_IO.MX.MO.OV.WM.BC.dcm'))
+            self.assertEqual(len(ds.PrimaryAnatomicStructureSequence), 14)
+            ds = pydicom.dcmread(os.path.join(tmpdir, 'EV-01_EO.RP.LR.CO.dcm'))
+            self.assertEqual([item.CodeMeaning[:2] for item in ds.PrimaryAnatomicStructureSequence],
+                             ['16'])
@@ -0,0 +1,78 @@
+'''
+Unit tests for per-stage timing of conversions.
+'''
+import unittest
+import logging
+import importlib.resources
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import dicom4ortho.controller as controller
+import dicom4ortho.timing as timing
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+        for name in os.listdir(resources):
+            if name.endswith(('.png', '.csv')):
+                shutil.copy(os.path.join(resources, name), self.tmpdir.name)
+        self.csv = os.path.join(self.tmpdir.name, 'input_from.csv')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_report(self, stream, failed=0):
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        records, summary = lines[:-1], lines[-1]['summary']
+        self.assertEqual(len(records), 3 + failed)
+        for record in records:
+            if record['error'] is not None:
+                continue
+            for stage in timing.STAGES:
+                self.assertGreaterEqual(record[stage], 0, stage)
+            self.assertLessEqual(sum(record[s] for s in timing.STAGES), record['total'])
+            self.assertEqual(record['input_bytes'], os.path.getsize(record['input']))
+            self.assertEqual(record['output_bytes'], os.path.getsize(record['output']))
+        self.assertEqual((summary['files'], summary['failed']), (3 + failed, failed))
+        self.assertEqual(summary['output_bytes'],
+                         sum(r['output_bytes'] or 0 for r in records))
+        self.assertLessEqual(summary['p50'], summary['p99'])
+        self.assertEqual(len(summary['slowest']), 3)
+        return records
+
+    def test_sequential(self):
+        stream = io.StringIO()
+        progress = io.StringIO()
+        report = timing.RunReport(stream, progress=progress)
+        controller.SimpleController(None).bulk_convert_from_csv(self.csv, report=report)
+        report.close()
+        self.check_report(stream)
+        self.assertIn('3/3 files', progress.getvalue())
+        self.assertTrue(progress.getvalue().endswith('\n'))
+
+    def test_workers(self):
+        with open(self.csv, 'a') as f:
+            f.write('\nJohn,Doe,99999,M,2000-01-01,Edward,Angle,EV-01,Apple,missing.png,'
+                    '1.2.3,Initial Visit,1.2.3.4,Orthodontic Extraoral Series')
+        stream = io.StringIO()
+        report = timing.RunReport(stream)
+        controller.SimpleController(None).bulk_convert_from_csv(
+            self.csv, workers=2, report=report)
+        report.close()
+        records = self.check_report(stream, failed=1)
+        self.assertEqual([os.path.basename(r['input']) for r in records
+                          if r['error'] is not None], ['missing.png'])
+
+    def test_disabled(self):
+        c = controller.SimpleController(None)
+        c.bulk_convert_from_csv(self.csv)
+        self.assertIs(c.photo.timings, timing.NULL_TIMINGS)
@@ -0,0 +1,88 @@
+'''
+Unit tests for UID allocation.
+'''
+import unittest
+import logging
+import importlib.resources
+import multiprocessing
+import os
+import shutil
+import tempfile
+import uuid
+
+import pydicom
+import pydicom.uid
+
+import dicom4ortho.controller as controller
+import dicom4ortho.uid as uid
+
+ALLOCATOR = uid.UIDAllocator()
+
+
+def new_uid():
+    return ALLOCATOR.new()
+
+
+class Test(unittest.TestCase):
+
+    def setUp(self):
+        logging.basicConfig(format='%(asctime)s - %(levelname)s - %(funcName)s: %(message)s',
+                    level=logging.INFO)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        with importlib.resources.path("test.resources", "input_from.csv") as input_csv:
+            resources = os.path.dirname(str(input_csv))
+        for name in os.listdir(resources):
+            if name.endswith('.png'):
+                shutil.copy(os.path.join(resources, name), self.tmpdir.name)
+        # Without Study and Series Instance UIDs.
+        with open(os.path.join(resources, 'input_from.csv')) as f:
+            lines = f.read().splitlines()
+        self.csv = os.path.join(self.tmpdir.name, 'input_from.csv')
+        with open(self.csv, 'w') as f:
+            f.write(lines[0] + '\n')
+            for line in lines[1:]:
+                values = line.split(',')
+                values[10] = values[12] = ''
+                f.write(','.join(values) + '\n')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def convert(self, **kwargs):
+        controller.SimpleController(None, **kwargs).bulk_convert_from_csv(self.csv)
+        uids = []
+        for name in sorted(os.listdir(self.tmpdir.name)):
+            if name.endswith('.dcm'):
+                ds = pydicom.dcmread(os.path.join(self.tmpdir.name, name))
+                self.assertEqual(ds.SOPInstanceUID, ds.file_meta.MediaStorageSOPInstanceUID)
+                uids.append((ds.StudyInstanceUID, ds.SeriesInstanceUID, ds.SOPInstanceUID))
+        self.assertEqual(len(uids), 3)
+        return uids
+
+    def test_random_uids(self):
+        uids = uid.generate_uids(1000)
+        self.assertEqual(len(set(uids)), 1000)
+        for u in uids:
+            self.assertTrue(pydicom.uid.UID(u).is_valid, u)
+            self.assertEqual(uuid.UUID(int=int(u[len(uid.UID_ROOT):])).version, 4)
+
+    def test_deterministic(self):
+        first = self.convert(uid_namespace='example.com')
+        second = self.convert(uid_namespace='example.com')
+        self.assertEqual(first, second)
+        # One study, two series, three images.
+        self.assertEqual(len({u[0] for u in first}), 1)
+        self.assertEqual(len({u[1] for u in first}), 2)
+        self.assertEqual(len({u[2] for u in first}), 3)
+        self.assertNotEqual(self.convert(uid_namespace='example.org'), first)
+
+    def test_random_by_default(self):
+        first = self.convert()
+        self.assertNotEqual(self.convert(), first)
+        self.assertEqual(len({u[0] for u in first}), 3)
+
+    def test_fork(self):
+        ALLOCATOR.new()
+        with multiprocessing.get_context('fork').Pool(1) as pool:
+            child = pool.apply(new_uid)
+        self.assertNotEqual(child, ALLOCATOR.new())